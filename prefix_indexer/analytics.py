@@ -1,14 +1,21 @@
-"""Analytics helpers for offline prefix aggregation."""
+"""Analytics helpers for offline prefix aggregation.
+
+Scores use forward decay: each key stores its decay-weighted byte volume anchored at its
+own ``last_seen_ms``. Ingest only adds weight (re-anchoring to the newest timestamp), and
+decay to the current time is applied once, when a score is read. Updates therefore touch
+only the keys in a batch, and the result is independent of how traces were batched.
+"""
 
 from __future__ import annotations
 
-import time
-from collections import defaultdict
+import math
 from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Protocol
 
-from .models import PrefixEvent, PrefixStats
-
-PrefixKey = tuple[str, str, str]
+from .columns import EventColumns
+from .models import PrefixEvent, PrefixKey, PrefixStats
+from .rollups import RollupIndex
 
 
 def _decay_weight(now_ms: int, timestamp_ms: int, half_life_ms: int) -> float:
@@ -21,79 +28,304 @@ def _decay_weight(now_ms: int, timestamp_ms: int, half_life_ms: int) -> float:
     return 0.5 ** (elapsed / float(half_life_ms))
 
 
-def aggregate_events(
-    events: Iterable[PrefixEvent],
-    *,
-    now_ms: int | None = None,
-    half_life_ms: int = 3_600_000,
-) -> dict[PrefixKey, PrefixStats]:
-    """Aggregate raw events into prefix statistics."""
-    current_time = now_ms if now_ms is not None else int(time.time() * 1000)
-    aggregates: dict[PrefixKey, dict[str, float]] = defaultdict(
-        lambda: {
-            "hit_count": 0.0,
-            "total_bytes": 0.0,
-            "latency_sum": 0.0,
-            "score": 0.0,
-            "last_seen_ms": 0.0,
-        }
+def _combine_scores(
+    score_a: float, seen_a: int, score_b: float, seen_b: int, half_life_ms: int
+) -> tuple[float, int]:
+    """Add two anchored scores, re-anchoring both at the later timestamp."""
+    anchor = max(seen_a, seen_b)
+    score = score_a * _decay_weight(anchor, seen_a, half_life_ms) + score_b * _decay_weight(
+        anchor, seen_b, half_life_ms
     )
+    return score, anchor
+
+
+def _combine_horizon_scores(
+    scores_a: list[float],
+    seen_a: int,
+    scores_b: list[float],
+    seen_b: int,
+    horizons: tuple[int, ...],
+) -> list[float]:
+    """``_combine_scores`` for each extra half-life; an empty vector counts as zeros."""
+    if not scores_a:
+        scores_a = [0.0] * len(horizons)
+    if not scores_b:
+        scores_b = [0.0] * len(horizons)
+    return [
+        _combine_scores(a, seen_a, b, seen_b, half_life_ms)[0]
+        for a, b, half_life_ms in zip(scores_a, scores_b, horizons, strict=True)
+    ]
+
+
+def decayed_score(stat: PrefixStats, now_ms: int, half_life_ms: int) -> float:
+    """Return the score of ``stat`` decayed from its anchor to ``now_ms``."""
+    return stat.score * _decay_weight(now_ms, stat.last_seen_ms, half_life_ms)
+
+
+def decay_rank(stat: PrefixStats, half_life_ms: int) -> float:
+    """Return a time-invariant ranking key (log2 of the score decayed to the epoch).
+
+    Ordering by this value matches ordering by ``decayed_score`` at any read time, so
+    rankings never need to be recomputed as the clock advances.
+    """
+    return rank_value(stat.score, stat.last_seen_ms, half_life_ms)
+
+
+def rank_value(score: float, last_seen_ms: int, half_life_ms: int) -> float:
+    """``decay_rank`` for raw column values."""
+    if score <= 0.0:
+        return -math.inf
+    return math.log2(score) + last_seen_ms / float(half_life_ms)
+
 
-    for ev in events:
-        key: PrefixKey = (ev.prefix_id, ev.tenant, ev.model_id)
-        bucket = aggregates[key]
-        bucket["hit_count"] += 1.0
-        bucket["total_bytes"] += float(ev.bytes)
-        bucket["latency_sum"] += float(ev.latency_ms)
-        bucket["last_seen_ms"] = max(bucket["last_seen_ms"], float(ev.timestamp_ms))
-        weight = _decay_weight(current_time, ev.timestamp_ms, half_life_ms)
-        bucket["score"] += weight * float(ev.bytes)
-
-    stats: dict[PrefixKey, PrefixStats] = {}
-    for key, bucket in aggregates.items():
-        hits = int(bucket["hit_count"])
-        total_bytes = int(bucket["total_bytes"])
-        avg_latency = bucket["latency_sum"] / hits if hits > 0 else 0.0
-        stats[key] = PrefixStats(
+def rank_floor(min_score: float, now_ms: int, half_life_ms: int) -> float:
+    """Return the lowest ``decay_rank`` whose score at ``now_ms`` can reach ``min_score``."""
+    if min_score <= 0.0:
+        return -math.inf
+    return math.log2(min_score) + now_ms / float(half_life_ms)
+
+
+@dataclass(slots=True)
+class PrefixAggregate:
+    """Mergeable running totals for a single prefix key."""
+
+    hit_count: int = 0
+    total_bytes: int = 0
+    latency_sum: float = 0.0
+    score: float = 0.0
+    last_seen_ms: int = 0
+    # Scores for the aggregator's extra ``horizons``, anchored at ``last_seen_ms`` too.
+    horizon_scores: list[float] = field(default_factory=list)
+
+    def add(
+        self,
+        bytes_: int,
+        latency_ms: float,
+        timestamp_ms: int,
+        half_life_ms: int,
+        horizons: tuple[int, ...] = (),
+    ) -> None:
+        self.hit_count += 1
+        self.total_bytes += bytes_
+        self.latency_sum += latency_ms
+        if horizons:
+            self.horizon_scores = _combine_horizon_scores(
+                self.horizon_scores,
+                self.last_seen_ms,
+                [float(bytes_)] * len(horizons),
+                timestamp_ms,
+                horizons,
+            )
+        self.score, self.last_seen_ms = _combine_scores(
+            self.score, self.last_seen_ms, float(bytes_), timestamp_ms, half_life_ms
+        )
+
+    def merge(
+        self, other: PrefixAggregate, half_life_ms: int, horizons: tuple[int, ...] = ()
+    ) -> None:
+        self.hit_count += other.hit_count
+        self.total_bytes += other.total_bytes
+        self.latency_sum += other.latency_sum
+        if horizons:
+            self.horizon_scores = _combine_horizon_scores(
+                self.horizon_scores,
+                self.last_seen_ms,
+                other.horizon_scores,
+                other.last_seen_ms,
+                horizons,
+            )
+        self.score, self.last_seen_ms = _combine_scores(
+            self.score, self.last_seen_ms, other.score, other.last_seen_ms, half_life_ms
+        )
+
+    def to_stats(self, key: PrefixKey, horizon: int | None = None) -> PrefixStats:
+        """Stats scored for the primary half-life, or for ``horizons[horizon]``."""
+        score = self.score if horizon is None else self.horizon_scores[horizon]
+        avg_latency = self.latency_sum / self.hit_count if self.hit_count > 0 else 0.0
+        return PrefixStats(
             prefix_id=key[0],
             tenant=key[1],
             model_id=key[2],
-            hit_count=hits,
-            total_bytes=total_bytes,
+            hit_count=self.hit_count,
+            total_bytes=self.total_bytes,
             avg_latency_ms=avg_latency,
-            score=max(bucket["score"], 0.0),
-            last_seen_ms=int(bucket["last_seen_ms"]),
+            score=max(score, 0.0),
+            last_seen_ms=self.last_seen_ms,
         )
-    return stats
 
 
-def merge_stats(
-    baseline: Iterable[PrefixStats], updates: Iterable[PrefixStats], *, half_life_ms: int
+class AnalyticsBackend(Protocol):
+    """Aggregation engine that folds one column batch into per-key partial aggregates.
+
+    Implementations must agree with ``PythonBackend`` on counts, bytes and
+    ``last_seen_ms`` exactly and on scores up to floating-point rounding. With
+    ``horizons``, each aggregate also carries one score per extra half-life.
+    """
+
+    name: str
+
+    def aggregate_columns(
+        self, columns: EventColumns, *, half_life_ms: int, horizons: tuple[int, ...] = ()
+    ) -> dict[PrefixKey, PrefixAggregate]: ...
+
+
+class PythonBackend:
+    """Reference pure-Python aggregation loop."""
+
+    name = "python"
+
+    def aggregate_columns(
+        self, columns: EventColumns, *, half_life_ms: int, horizons: tuple[int, ...] = ()
+    ) -> dict[PrefixKey, PrefixAggregate]:
+        aggregates: dict[PrefixKey, PrefixAggregate] = {}
+        _fold_columns(aggregates, columns, half_life_ms, horizons)
+        return aggregates
+
+
+def _fold_columns(
+    aggregates: dict[PrefixKey, PrefixAggregate],
+    columns: EventColumns,
+    half_life_ms: int,
+    horizons: tuple[int, ...] = (),
+) -> None:
+    rows = zip(
+        columns.prefix_id,
+        columns.tenant,
+        columns.model_id,
+        columns.bytes,
+        columns.latency_ms,
+        columns.timestamp_ms,
+        strict=True,
+    )
+    for prefix_id, tenant, model_id, bytes_, latency_ms, timestamp_ms in rows:
+        key: PrefixKey = (prefix_id, tenant, model_id)
+        bucket = aggregates.get(key)
+        if bucket is None:
+            bucket = aggregates[key] = PrefixAggregate()
+        bucket.add(bytes_, latency_ms, timestamp_ms, half_life_ms, horizons)
+
+
+def get_backend(name: str) -> AnalyticsBackend:
+    """Return the analytics backend registered under ``name``."""
+    if name == "python":
+        return PythonBackend()
+    if name == "numpy":
+        try:
+            from .analytics_numpy import NumpyBackend
+        except ImportError as exc:
+            raise RuntimeError(
+                "analytics_backend='numpy' requires the optional 'numpy' dependency"
+            ) from exc
+        return NumpyBackend()
+    raise ValueError(f"Unknown analytics backend {name!r}")
+
+
+class EventAggregator:
+    """Fold events into per-key aggregates one chunk at a time.
+
+    Memory is bounded by the number of distinct keys rather than the number of events,
+    so arbitrarily large traces can be streamed through ``update``. Column batches are
+    handed to the configured ``AnalyticsBackend``. Every extra half-life in ``horizons``
+    gets its own score in the same pass; ``stats(horizon)`` reads one of them. With
+    ``rollups``, every event is also counted in its key's time buckets.
+    """
+
+    def __init__(
+        self,
+        *,
+        half_life_ms: int = 3_600_000,
+        backend: AnalyticsBackend | None = None,
+        horizons: tuple[int, ...] = (),
+        rollups: RollupIndex | None = None,
+    ) -> None:
+        self.half_life_ms = half_life_ms
+        self.horizons = horizons
+        self.rollups = rollups
+        self.backend = backend or PythonBackend()
+        self.events = 0
+        self.rejected = 0
+        self._aggregates: dict[PrefixKey, PrefixAggregate] = {}
+
+    def __len__(self) -> int:
+        return len(self._aggregates)
+
+    def keys(self) -> list[PrefixKey]:
+        return list(self._aggregates)
+
+    def update(self, events: Iterable[PrefixEvent]) -> None:
+        aggregates = self._aggregates
+        half_life_ms = self.half_life_ms
+        horizons = self.horizons
+        rollups = self.rollups
+        for ev in events:
+            key: PrefixKey = (ev.prefix_id, ev.tenant, ev.model_id)
+            bucket = aggregates.get(key)
+            if bucket is None:
+                bucket = aggregates[key] = PrefixAggregate()
+            bucket.add(ev.bytes, ev.latency_ms, ev.timestamp_ms, half_life_ms, horizons)
+            if rollups is not None:
+                rollups.add(ev.prefix_id, ev.tenant, ev.model_id, ev.timestamp_ms, ev.bytes)
+            self.events += 1
+
+    def update_columns(self, columns: EventColumns) -> None:
+        """Fold a columnar batch without materialising per-event models."""
+        if isinstance(self.backend, PythonBackend):
+            _fold_columns(self._aggregates, columns, self.half_life_ms, self.horizons)
+        else:
+            partial = self.backend.aggregate_columns(
+                columns, half_life_ms=self.half_life_ms, horizons=self.horizons
+            )
+            self._merge_partial(partial)
+        if self.rollups is not None:
+            self.rollups.add_columns(columns)
+        self.events += len(columns)
+        self.rejected += columns.rejected
+
+    def stats(self, half_life_ms: int | None = None) -> dict[PrefixKey, PrefixStats]:
+        """Stats scored for ``half_life_ms`` (the primary half-life or one of ``horizons``)."""
+        if half_life_ms is None or half_life_ms == self.half_life_ms:
+            horizon = None
+        else:
+            horizon = self.horizons.index(half_life_ms)
+        return {key: bucket.to_stats(key, horizon) for key, bucket in self._aggregates.items()}
+
+    def merge(self, other: EventAggregator) -> None:
+        """Absorb another aggregator's partial results (e.g. from a worker process)."""
+        self._merge_partial(other._aggregates)
+        if self.rollups is not None and other.rollups is not None:
+            self.rollups.merge(other.rollups)
+        self.events += other.events
+        self.rejected += other.rejected
+
+    def _merge_partial(self, partial: dict[PrefixKey, PrefixAggregate]) -> None:
+        aggregates = self._aggregates
+        for key, bucket in partial.items():
+            existing = aggregates.get(key)
+            if existing is None:
+                aggregates[key] = bucket
+            else:
+                existing.merge(bucket, self.half_life_ms, self.horizons)
+
+
+def aggregate_events(
+    events: Iterable[PrefixEvent],
+    *,
+    half_life_ms: int = 3_600_000,
 ) -> dict[PrefixKey, PrefixStats]:
-    """Merge existing stats with updates applying decay since last seen."""
-    merged: dict[PrefixKey, PrefixStats] = {}
-    now = int(time.time() * 1000)
+    """Aggregate raw events into prefix statistics with scores anchored at last_seen_ms."""
+    aggregator = EventAggregator(half_life_ms=half_life_ms)
+    aggregator.update(events)
+    return aggregator.stats()
 
-    def to_key(stat: PrefixStats) -> PrefixKey:
-        return (stat.prefix_id, stat.tenant, stat.model_id)
 
-    for stat in baseline:
-        key = to_key(stat)
-        # Decay legacy score to keep it bounded if stale.
-        weight = _decay_weight(now, stat.last_seen_ms, half_life_ms)
-        merged[key] = PrefixStats(
-            prefix_id=stat.prefix_id,
-            tenant=stat.tenant,
-            model_id=stat.model_id,
-            hit_count=stat.hit_count,
-            total_bytes=stat.total_bytes,
-            avg_latency_ms=stat.avg_latency_ms,
-            score=stat.score * weight,
-            last_seen_ms=stat.last_seen_ms,
-        )
+def merge_stats(
+    baseline: Iterable[PrefixStats], updates: Iterable[PrefixStats], *, half_life_ms: int
+) -> dict[PrefixKey, PrefixStats]:
+    """Merge existing stats with updates, re-anchoring scores at the newest timestamp."""
+    merged: dict[PrefixKey, PrefixStats] = {stat.key: stat for stat in baseline}
 
     for stat in updates:
-        key = to_key(stat)
+        key = stat.key
         existing = merged.get(key)
         if existing is None:
             merged[key] = stat
@@ -103,6 +335,9 @@ def merge_stats(
             existing.avg_latency_ms * existing.hit_count + stat.avg_latency_ms * stat.hit_count
         )
         avg_latency = combined_latency / total_hits if total_hits > 0 else 0.0
+        score, last_seen = _combine_scores(
+            existing.score, existing.last_seen_ms, stat.score, stat.last_seen_ms, half_life_ms
+        )
         merged[key] = PrefixStats(
             prefix_id=stat.prefix_id,
             tenant=stat.tenant,
@@ -110,7 +345,7 @@ def merge_stats(
             hit_count=total_hits,
             total_bytes=existing.total_bytes + stat.total_bytes,
             avg_latency_ms=avg_latency,
-            score=existing.score + stat.score,
-            last_seen_ms=max(existing.last_seen_ms, stat.last_seen_ms),
+            score=score,
+            last_seen_ms=last_seen,
         )
     return merged
@@ -0,0 +1,67 @@
+"""Vectorized NumPy implementation of the analytics backend protocol."""
+
+from __future__ import annotations
+
+import numpy as np
+
+from .analytics import PrefixAggregate
+from .columns import EventColumns
+from .models import PrefixKey
+
+
+class NumpyBackend:
+    """Aggregate a column batch with array ops instead of a per-event Python loop.
+
+    Keys are factorized into dense codes, the per-key anchor (``last_seen_ms``) comes
+    from ``np.maximum.at``, decay weights are one vector ``exp2``, and the sums are
+    ``np.bincount`` reductions. Scores are anchored exactly as in ``PythonBackend``.
+    """
+
+    name = "numpy"
+
+    def aggregate_columns(
+        self, columns: EventColumns, *, half_life_ms: int, horizons: tuple[int, ...] = ()
+    ) -> dict[PrefixKey, PrefixAggregate]:
+        size = len(columns)
+        if size == 0:
+            return {}
+        index: dict[PrefixKey, int] = {}
+        codes = np.fromiter(
+            (
+                index.setdefault(key, len(index))
+                for key in zip(columns.prefix_id, columns.tenant, columns.model_id, strict=True)
+            ),
+            dtype=np.int64,
+            count=size,
+        )
+        n_keys = len(index)
+        bytes_ = np.asarray(columns.bytes, dtype=np.int64)
+        latency = np.asarray(columns.latency_ms, dtype=np.float64)
+        timestamps = np.asarray(columns.timestamp_ms, dtype=np.int64)
+
+        last_seen = np.zeros(n_keys, dtype=np.int64)
+        np.maximum.at(last_seen, codes, timestamps)
+        age = timestamps - last_seen[codes]
+        scores = np.bincount(
+            codes, weights=np.exp2(age / float(half_life_ms)) * bytes_, minlength=n_keys
+        )
+        horizon_scores = [
+            np.bincount(codes, weights=np.exp2(age / float(h)) * bytes_, minlength=n_keys)
+            for h in horizons
+        ]
+        hits = np.bincount(codes, minlength=n_keys)
+        total_bytes = np.zeros(n_keys, dtype=np.int64)
+        np.add.at(total_bytes, codes, bytes_)
+        latency_sum = np.bincount(codes, weights=latency, minlength=n_keys)
+
+        return {
+            key: PrefixAggregate(
+                hit_count=int(hits[code]),
+                total_bytes=int(total_bytes[code]),
+                latency_sum=float(latency_sum[code]),
+                score=float(scores[code]),
+                last_seen_ms=int(last_seen[code]),
+                horizon_scores=[float(column[code]) for column in horizon_scores],
+            )
+            for key, code in index.items()
+        }
@@ -2,11 +2,23 @@
 
 from __future__ import annotations
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from typing import TextIO
 
-from .models import PrefixEvent, PrefixIndexConfig, PrefixRecommendation, PrefixStats
-from .service import PrefixIndexService
+from .columns import EventColumns
+from .metrics import Metrics
+from .models import (
+    IngestReport,
+    PrefixChanges,
+    PrefixEvent,
+    PrefixIndexConfig,
+    PrefixKey,
+    PrefixRecommendation,
+    PrefixStats,
+)
+from .readers import expand_trace_paths
+from .service import PrefixIndexService, StreamIngest
 
 
 class PrefixIndexAPI:
@@ -16,26 +28,164 @@ class PrefixIndexAPI:
         self._service = PrefixIndexService(config)
 
     def ingest_events(self, events: Iterable[PrefixEvent]) -> None:
-        """Ingest in-memory events."""
-        self._service.ingest_events(list(events))
+        """Ingest events; any iterable, including a lazy generator, is streamed."""
+        self._service.ingest_events(events)
 
-    def ingest_file(self, path: str | Path) -> None:
-        """Load a JSONL file and ingest."""
-        self._service.ingest_jsonl(Path(path))
+    def ingest_batches(
+        self, batches: Iterable[Iterable[PrefixEvent] | EventColumns]
+    ) -> IngestReport:
+        """Ingest event lists and/or ``EventColumns`` batches as a single commit."""
+        return self._service.ingest_batches(batches)
+
+    def ingest_file(
+        self,
+        path: str | Path,
+        *,
+        file_format: str = "auto",
+        since_ms: int | None = None,
+        until_ms: int | None = None,
+    ) -> IngestReport:
+        """Stream a JSONL (plain, gzip or zstd) or Parquet trace and ingest.
+
+        ``file_format="auto"`` picks Parquet for ``.parquet``/``.pq`` paths. The
+        ``since_ms``/``until_ms`` window is pushed down into Parquet scans and is not
+        supported for JSONL.
+        """
+        return self._service.ingest_paths(
+            [Path(path)], file_format=file_format, since_ms=since_ms, until_ms=until_ms
+        )
+
+    def ingest_paths(
+        self,
+        spec: str | Path,
+        *,
+        workers: int = 1,
+        file_format: str = "auto",
+        since_ms: int | None = None,
+        until_ms: int | None = None,
+    ) -> IngestReport:
+        """Ingest every trace matched by a file, directory or glob pattern.
+
+        With ``workers > 1`` shards are aggregated in a process pool and reduced into a
+        single store merge; results are identical to serial ingest.
+        """
+        return self._service.ingest_paths(
+            expand_trace_paths(spec),
+            workers=workers,
+            file_format=file_format,
+            since_ms=since_ms,
+            until_ms=until_ms,
+        )
+
+    def ingest_stream(
+        self, chunks: Iterable[bytes], *, content_encoding: str | None = None
+    ) -> IngestReport:
+        """Ingest an NDJSON byte stream (optionally gzip/zstd-encoded) chunk by chunk.
+
+        Lines are aggregated as the chunks arrive; invalid lines are counted in the
+        report rather than raised.
+        """
+        stream = self._service.open_stream(content_encoding=content_encoding)
+        for chunk in chunks:
+            stream.feed(chunk)
+        return stream.finish()
+
+    def open_stream(self, *, content_encoding: str | None = None) -> StreamIngest:
+        """Return an incremental ingest for callers that receive the body piecemeal."""
+        return self._service.open_stream(content_encoding=content_encoding)
+
+    @property
+    def generation(self) -> int:
+        """Index generation; changes whenever an ingest modifies the index."""
+        return self._service.generation
+
+    @property
+    def version(self) -> tuple[int, int]:
+        """``(generation, as_of_ms)``; see ``PrefixIndexService.version``."""
+        return self._service.version
+
+    @property
+    def horizons(self) -> tuple[int, ...]:
+        """Extra half-lives (ms) that ``recommendations(horizon=...)`` accepts."""
+        return self._service.horizons
+
+    @property
+    def metrics(self) -> Metrics:
+        """Stage timings and counters; recording is off unless ``metrics_enabled``."""
+        return self._service.metrics
 
     def recommendations(
         self,
         *,
         top_k: int | None = None,
         min_score: float | None = None,
+        tenant: str | None = None,
+        model_id: str | None = None,
+        now_ms: int | None = None,
+        horizon: int | None = None,
+        window_ms: int | None = None,
     ) -> list[PrefixRecommendation]:
-        """Return ranked prefix recommendations."""
-        return self._service.recommendations(top_k=top_k, min_score=min_score)
+        """Return ranked prefix recommendations, optionally for one tenant and/or model.
+
+        Scores are decayed to ``now_ms`` (default: the current time). ``horizon`` ranks by
+        one of the ``decay_horizons_ms`` half-lives instead of ``decay_half_life_ms``.
+        ``window_ms`` ranks by bytes moved in the window ending at ``now_ms`` instead;
+        it needs ``rollup_minutes`` or ``rollup_hours``.
+        """
+        return self._service.recommendations(
+            top_k=top_k,
+            min_score=min_score,
+            tenant=tenant,
+            model_id=model_id,
+            now_ms=now_ms,
+            horizon=horizon,
+            window_ms=window_ms,
+        )
+
+    def window_bucket(self, window_ms: int, end_ms: int) -> tuple[int, int] | None:
+        """Last rollup bucket of a window ending at ``end_ms``; see ``PrefixIndexService``."""
+        return self._service.window_bucket(window_ms, end_ms)
+
+    def changes(
+        self,
+        since: int,
+        *,
+        epoch: int | None = None,
+        top_k: int | None = None,
+        tenant: str | None = None,
+        model_id: str | None = None,
+        now_ms: int | None = None,
+    ) -> PrefixChanges:
+        """Return top-k keys changed and evicted after generation ``since``.
+
+        Pass the returned ``generation`` and ``epoch`` as the next ``since`` and ``epoch``.
+        A ``reset`` reply means the change log no longer covers ``since`` (or the index
+        restarted since ``epoch``) and ``changed`` holds the full top-k.
+        """
+        return self._service.changes(
+            since, epoch=epoch, top_k=top_k, tenant=tenant, model_id=model_id, now_ms=now_ms
+        )
+
+    def close(self) -> None:
+        """Save in-memory state (rollups) next to a persistent store before exiting."""
+        self._service.close()
+
+    def eviction_error(self, now_ms: int | None = None) -> float:
+        """Most that bounded-memory eviction can understate any score at ``now_ms``."""
+        return self._service.eviction_error(now_ms)
 
     def snapshot(self) -> list[PrefixStats]:
         """Return the raw statistics."""
         return self._service.export_snapshot()
 
+    def iter_snapshot(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        """Stream raw statistics in key order, resuming after the key ``after``."""
+        return self._service.iter_snapshot(after=after)
+
+    def write_snapshot(self, out: TextIO, *, lines: bool = False, indent: int | None = None) -> int:
+        """Write the index to ``out`` incrementally as a JSON array or NDJSON."""
+        return self._service.write_snapshot(out, lines=lines, indent=indent)
+
     def snapshot_json(self) -> str:
         """Serialize the full index as JSON."""
         return self._service.dump_json()
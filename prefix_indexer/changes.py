@@ -0,0 +1,129 @@
+"""Bounded log of per-commit key changes backing the incremental planner feed."""
+
+from __future__ import annotations
+
+import heapq
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass, field
+from itertools import chain, islice
+
+from .models import PrefixKey, PrefixStats
+from .ranking import rank_entry
+
+# One logged commit: its generation and the pre-commit stats (``None`` for new keys).
+LoggedCommit = tuple[int, dict[PrefixKey, PrefixStats | None]]
+
+
+@dataclass(frozen=True)
+class ChangeLogView:
+    """The log as of one generation, readable without locks while commits continue.
+
+    ``entries[start:stop]`` are the retained commits. The log only appends past ``stop``
+    and replaces its list instead of trimming it, so a view never changes underneath a
+    reader.
+    """
+
+    generation: int = 0
+    floor: int = 0
+    entries: list[LoggedCommit] = field(default_factory=list)
+    start: int = 0
+    stop: int = 0
+
+    def since(self, generation: int) -> dict[PrefixKey, PrefixStats | None] | None:
+        """Keys changed after ``generation`` mapped to their stats at that generation.
+
+        Returns ``None`` when the log no longer reaches back to ``generation`` or
+        ``generation`` is newer than this view.
+        """
+        if generation < self.floor or generation > self.generation:
+            return None
+        previous: dict[PrefixKey, PrefixStats | None] = {}
+        for index in range(self.stop - 1, self.start - 1, -1):
+            committed, old = self.entries[index]
+            if committed <= generation:
+                break
+            # Walking newest to oldest, so the last write wins with the oldest prior stats.
+            previous.update(old)
+        return previous
+
+
+class ChangeLog:
+    """Remember, for each recent commit, the stats every touched key had before it.
+
+    That is enough to rebuild the ranking as of any retained generation: unchanged keys
+    keep their time-invariant rank, and changed keys take their earliest recorded prior
+    stats. At most ``max_keys`` key records are kept; older commits are dropped and
+    ``floor`` advances, after which callers asking for an older generation must resync.
+    ``record`` needs a single writer; readers use ``view``, which it swaps in one
+    reference.
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._entries: list[LoggedCommit] = []
+        self._start = 0
+        self._keys = 0
+        self.view = ChangeLogView(entries=self._entries)
+
+    @property
+    def floor(self) -> int:
+        return self.view.floor
+
+    def record(self, generation: int, previous: dict[PrefixKey, PrefixStats | None]) -> None:
+        """Log the pre-commit stats (``None`` for new keys) of commit ``generation``."""
+        entries = self._entries
+        entries.append((generation, previous))
+        self._keys += len(previous)
+        floor = self.view.floor
+        while self._keys > self.max_keys and self._start < len(entries):
+            floor, old = entries[self._start]
+            self._keys -= len(old)
+            self._start += 1
+        if self._start > len(entries) // 2:
+            # Published views keep the old list, so trimming copies instead of deleting.
+            entries = self._entries = entries[self._start :]
+            self._start = 0
+        self.view = ChangeLogView(generation, floor, entries, self._start, len(entries))
+
+    def since(self, generation: int) -> dict[PrefixKey, PrefixStats | None] | None:
+        """``view.since``: the changes after ``generation``, or ``None`` to resync."""
+        return self.view.since(generation)
+
+
+def top_with_evictions(
+    ranked: Iterator[PrefixStats],
+    previous: Mapping[PrefixKey, PrefixStats | None],
+    *,
+    limit: int,
+    half_life_ms: int,
+    tenant: str | None = None,
+    model_id: str | None = None,
+) -> tuple[list[PrefixStats], list[PrefixKey]]:
+    """Split the current top ``limit`` from ``ranked`` and find what fell out of it.
+
+    ``ranked`` is the current ranked stream for the ``tenant``/``model_id`` filter and
+    ``previous`` comes from ``ChangeLog.since``. Returns the current top together with
+    the keys that were in the top ``limit`` before those changes but are not now. Past
+    the current top, ``ranked`` is read only to replace changed keys.
+    """
+    top = list(islice(ranked, limit))
+    unchanged = [stat for stat in top if stat.key not in previous]
+    # Changed keys may have left the top, so unchanged keys ranked below it can be needed.
+    unchanged.extend(
+        islice((stat for stat in ranked if stat.key not in previous), limit - len(unchanged))
+    )
+    before = heapq.nsmallest(
+        limit,
+        chain(
+            (rank_entry(stat, half_life_ms) for stat in unchanged),
+            (
+                rank_entry(stat, half_life_ms)
+                for stat in previous.values()
+                if stat is not None
+                and (tenant is None or stat.tenant == tenant)
+                and (model_id is None or stat.model_id == model_id)
+            ),
+        ),
+    )
+    current = {stat.key for stat in top}
+    return top, [entry[3] for entry in before if entry[3] not in current]
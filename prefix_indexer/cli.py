@@ -9,19 +9,40 @@ from pathlib import Path
 
 from .api import PrefixIndexAPI
 from .models import PrefixIndexConfig
+from .readers import expand_trace_paths, resolve_format
 
 
 def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="prefix-indexer", description="Offline prefix index utility."
     )
-    parser.add_argument("--store", type=Path, help="Path to persistent JSONL store.")
+    parser.add_argument(
+        "--store", type=Path, help="Path to persistent JSONL, SQLite or snapshot store."
+    )
+    parser.add_argument(
+        "--store-backend",
+        choices=("auto", "memory", "columnar", "jsonl", "sqlite", "snapshot"),
+        default="auto",
+        help="Store implementation; auto picks SQLite for .sqlite/.db and snapshot for .pidx.",
+    )
+    parser.add_argument(
+        "--wal",
+        action="store_true",
+        help="Append updates to a delta log and compact periodically instead of rewriting.",
+    )
     parser.add_argument(
         "--half-life-ms",
         type=int,
         default=3_600_000,
         help="Half-life window for score decay (milliseconds).",
     )
+    parser.add_argument(
+        "--horizon-ms",
+        type=int,
+        action="append",
+        default=[],
+        help="Extra half-life scored in the same pass, for suggest --horizon (repeatable).",
+    )
     parser.add_argument(
         "--max-recs",
         type=int,
@@ -35,19 +56,88 @@ def _build_parser() -> argparse.ArgumentParser:
         help="Minimum score filter used for recommendations.",
     )
 
+    parser.add_argument(
+        "--max-keys",
+        type=int,
+        default=None,
+        help="Bound the index to roughly this many keys by evicting the coldest ones.",
+    )
+    parser.add_argument(
+        "--evict-min-score",
+        type=float,
+        default=0.0,
+        help="Evict keys whose decayed score falls below this (0 keeps them).",
+    )
+    parser.add_argument(
+        "--analytics-backend",
+        choices=("python", "numpy"),
+        default="python",
+        help="Aggregation engine for columnar ingest (numpy needs the optional extra).",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print per-stage timings and ingest counters to stderr when done.",
+    )
+
     sub = parser.add_subparsers(dest="command", required=True)
 
-    ingest = sub.add_parser("ingest", help="Ingest a JSONL trace file.")
-    ingest.add_argument("path", type=Path, help="Path to trace JSONL.")
+    ingest = sub.add_parser("ingest", help="Ingest trace files.")
+    ingest.add_argument(
+        "path", help="Trace file (JSONL or Parquet), directory of traces, or glob pattern."
+    )
+    ingest.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Aggregate shards in this many processes before a single store merge.",
+    )
+    ingest.add_argument(
+        "--format",
+        dest="file_format",
+        choices=("auto", "jsonl", "parquet"),
+        default="auto",
+        help="Trace format; auto uses Parquet for .parquet/.pq paths.",
+    )
+    ingest.add_argument(
+        "--since-ms", type=int, default=None, help="Parquet only: skip events before this."
+    )
+    ingest.add_argument(
+        "--until-ms", type=int, default=None, help="Parquet only: skip events at/after this."
+    )
+    ingest.add_argument(
+        "--strict",
+        action="store_true",
+        help="Validate every line as a PrefixEvent and abort on the first invalid one.",
+    )
 
     suggest = sub.add_parser("suggest", help="Print recommendations.")
     suggest.add_argument("--top-k", type=int, default=10, help="Number of recommendations to show.")
     suggest.add_argument(
-        "--min-score", type=float, default=None, help="Optional per-call score floor."
+        "--min-score",
+        dest="suggest_min_score",
+        type=float,
+        default=None,
+        help="Optional per-call score floor.",
+    )
+    suggest.add_argument("--tenant", default=None, help="Only rank prefixes for this tenant.")
+    suggest.add_argument("--model-id", default=None, help="Only rank prefixes for this model.")
+    suggest.add_argument(
+        "--horizon",
+        type=int,
+        default=None,
+        help="Rank by this half-life (ms); must be --half-life-ms or a --horizon-ms.",
     )
 
     dump = sub.add_parser("dump", help="Dump raw stats as JSON.")
     dump.add_argument("--pretty", action="store_true", help="Pretty-print JSON output.")
+    dump.add_argument(
+        "--jsonl", action="store_true", help="Write one JSON record per line (NDJSON)."
+    )
+    dump.add_argument(
+        "--output", "-o", type=Path, default=None, help="Write to this file instead of stdout."
+    )
 
     return parser
 
@@ -55,9 +145,17 @@ def _build_parser() -> argparse.ArgumentParser:
 def _config_from_args(args: argparse.Namespace) -> PrefixIndexConfig:
     return PrefixIndexConfig(
         decay_half_life_ms=args.half_life_ms,
+        decay_horizons_ms=args.horizon_ms,
         max_recommendations=args.max_recs,
         min_score=args.min_score,
         store_path=str(args.store) if args.store else None,
+        store_backend=args.store_backend,
+        store_wal=args.wal,
+        ingest_decoder="pydantic" if getattr(args, "strict", False) else "columnar",
+        analytics_backend=args.analytics_backend,
+        max_keys=args.max_keys,
+        evict_min_score=args.evict_min_score,
+        metrics_enabled=args.profile,
     )
 
 
@@ -66,12 +164,48 @@ def main(argv: Sequence[str] | None = None) -> int:
     args = parser.parse_args(argv)
     config = _config_from_args(args)
     api = PrefixIndexAPI(config)
+    try:
+        return _run_command(parser, args, api)
+    finally:
+        api.close()
+        if args.profile:
+            print(api.metrics.report(), file=sys.stderr)
+
 
+def _run_command(
+    parser: argparse.ArgumentParser, args: argparse.Namespace, api: PrefixIndexAPI
+) -> int:
     if args.command == "ingest":
-        api.ingest_file(args.path)
+        paths = expand_trace_paths(args.path)
+        if not paths:
+            parser.error(f"No trace files match {args.path}")
+        windowed = args.since_ms is not None or args.until_ms is not None
+        if windowed and any(resolve_format(p, args.file_format) != "parquet" for p in paths):
+            parser.error("--since-ms/--until-ms are only supported for Parquet input")
+        report = api.ingest_paths(
+            args.path,
+            workers=args.workers,
+            file_format=args.file_format,
+            since_ms=args.since_ms,
+            until_ms=args.until_ms,
+        )
+        if report.rejected:
+            print(
+                f"Skipped {report.rejected} invalid trace rows ({report.accepted} ingested).",
+                file=sys.stderr,
+            )
         return 0
     if args.command == "suggest":
-        recs = api.recommendations(top_k=args.top_k, min_score=args.min_score)
+        try:
+            recs = api.recommendations(
+                top_k=args.top_k,
+                min_score=args.suggest_min_score,
+                tenant=args.tenant,
+                model_id=args.model_id,
+                horizon=args.horizon,
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
         if not recs:
             print("No recommendations above threshold.", file=sys.stdout)
             return 0
@@ -81,11 +215,15 @@ def main(argv: Sequence[str] | None = None) -> int:
             )
         return 0
     if args.command == "dump":
-        data = api.snapshot_json()
-        if args.pretty:
-            print(data)
-        else:
-            print(data.replace("\n", ""), file=sys.stdout)
+        indent = 2 if args.pretty else None
+        out = sys.stdout if args.output is None else args.output.open("w", encoding="utf-8")
+        try:
+            api.write_snapshot(out, lines=args.jsonl, indent=indent)
+            if not args.jsonl:
+                out.write("\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
         return 0
     parser.error(f"Unsupported command {args.command}")
     return 1
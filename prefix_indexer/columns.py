@@ -0,0 +1,119 @@
+"""Column-oriented event batches and the fast-path JSONL decoder."""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+from typing import Any
+
+from .models import PrefixEvent
+
+_ID_FIELDS = ("prefix_id", "tenant", "model_id")
+_COUNT_FIELDS = ("layer", "page_start", "page_end", "bytes", "timestamp_ms")
+
+
+@dataclass(slots=True)
+class EventColumns:
+    """Parallel columns holding the event fields that aggregation reads.
+
+    ``rejected`` counts input rows that failed validation and were dropped.
+    """
+
+    prefix_id: list[str] = field(default_factory=list)
+    tenant: list[str] = field(default_factory=list)
+    model_id: list[str] = field(default_factory=list)
+    bytes: list[int] = field(default_factory=list)
+    latency_ms: list[float] = field(default_factory=list)
+    timestamp_ms: list[int] = field(default_factory=list)
+    rejected: int = 0
+
+    def __len__(self) -> int:
+        return len(self.prefix_id)
+
+    @classmethod
+    def from_events(cls, events: Iterable[PrefixEvent]) -> EventColumns:
+        columns = cls()
+        for ev in events:
+            columns.prefix_id.append(ev.prefix_id)
+            columns.tenant.append(ev.tenant)
+            columns.model_id.append(ev.model_id)
+            columns.bytes.append(ev.bytes)
+            columns.latency_ms.append(ev.latency_ms)
+            columns.timestamp_ms.append(ev.timestamp_ms)
+        return columns
+
+
+def _bad_ids(values: Sequence[Any]) -> set[int]:
+    return {i for i, v in enumerate(values) if type(v) is not str or not v}
+
+
+def _bad_counts(values: Sequence[Any]) -> set[int]:
+    # Mirrors PrefixEvent's ``int >= 0`` fields for JSON numbers: integral floats pass,
+    # fractional ones, strings, booleans and nulls do not.
+    return {
+        i
+        for i, v in enumerate(values)
+        if not ((type(v) is int and v >= 0) or (type(v) is float and v >= 0 and v.is_integer()))
+    }
+
+
+def _bad_floats(values: Sequence[Any]) -> set[int]:
+    return {i for i, v in enumerate(values) if type(v) not in (int, float) or not v >= 0}
+
+
+def columns_from_mapping(raw: dict[str, list[Any]], *, rejected: int = 0) -> EventColumns:
+    """Validate raw per-field columns in bulk and keep only the valid rows.
+
+    The aggregation fields must be present. ``layer``/``page_*`` are checked when
+    supplied, so projected sources (e.g. Parquet scans) can leave them out.
+    """
+    size = len(raw["prefix_id"])
+    bad: set[int] = set()
+    for name in _ID_FIELDS:
+        bad |= _bad_ids(raw[name])
+    for name in _COUNT_FIELDS:
+        if name in raw:
+            bad |= _bad_counts(raw[name])
+    bad |= _bad_floats(raw["latency_ms"])
+
+    if bad:
+        keep = [i for i in range(size) if i not in bad]
+        raw = {name: [values[i] for i in keep] for name, values in raw.items()}
+    return EventColumns(
+        prefix_id=raw["prefix_id"],
+        tenant=raw["tenant"],
+        model_id=raw["model_id"],
+        bytes=[int(v) for v in raw["bytes"]],
+        latency_ms=[float(v) for v in raw["latency_ms"]],
+        timestamp_ms=[int(v) for v in raw["timestamp_ms"]],
+        rejected=rejected + len(bad),
+    )
+
+
+def columns_from_rows(rows: Sequence[Any], *, rejected: int = 0) -> EventColumns:
+    """Validate decoded JSON objects column by column and keep the valid rows."""
+    # Non-objects become empty records, which then fail the required-id check.
+    records: list[dict[str, Any]] = [row if type(row) is dict else {} for row in rows]
+    raw: dict[str, list[Any]] = {
+        name: [r.get(name) for r in records] for name in (*_ID_FIELDS, *_COUNT_FIELDS)
+    }
+    raw["latency_ms"] = [r.get("latency_ms") for r in records]
+    return columns_from_mapping(raw, rejected=rejected)
+
+
+def decode_jsonl(lines: Iterable[str | bytes]) -> EventColumns:
+    """Decode JSONL lines straight into columns, skipping (and counting) invalid rows.
+
+    Applies the same constraints as ``PrefixEvent`` (non-empty ids, non-negative
+    numbers) without building a pydantic model per line.
+    """
+    rows: list[Any] = []
+    malformed = 0
+    loads = json.loads
+    for line in lines:
+        try:
+            rows.append(loads(line))
+        except ValueError:
+            malformed += 1
+    return columns_from_rows(rows, rejected=malformed)
@@ -0,0 +1,169 @@
+"""Bounded in-process ingest buffer drained by a background asyncio worker."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Sequence
+
+from pydantic import BaseModel, Field
+
+from .columns import EventColumns
+from .models import PrefixEvent
+
+# A queued request body: validated events, or columns decoded from a binary payload.
+IngestBatch = Sequence[PrefixEvent] | EventColumns
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueStats(BaseModel):
+    """Point-in-time queue depth and micro-batch timings."""
+
+    depth: int = Field(..., ge=0, description="Events waiting to be committed.")
+    capacity: int = Field(..., ge=0)
+    in_flight: int = Field(0, ge=0, description="Events in the batch being committed.")
+    enqueued_events: int = Field(0, ge=0)
+    committed_events: int = Field(0, ge=0)
+    batches: int = Field(0, ge=0)
+    failed_batches: int = Field(0, ge=0)
+    rejected_requests: int = Field(0, ge=0)
+    last_batch_events: int = Field(0, ge=0)
+    last_batch_latency_ms: float = Field(0.0, ge=0.0, description="Commit time of the last batch.")
+    max_batch_latency_ms: float = Field(0.0, ge=0.0)
+    last_queue_wait_ms: float = Field(
+        0.0, ge=0.0, description="Time the oldest event of the last batch spent queued."
+    )
+
+
+class IngestQueue:
+    """Buffer event batches and commit them in micro-batches off the request path.
+
+    ``offer`` never blocks: it either queues the events or reports that the buffer is
+    full so the caller can apply backpressure. The worker waits until
+    ``batch_events`` are queued or the oldest queued event is ``batch_delay_ms`` old,
+    then hands the coalesced batches to ``sink`` on a worker thread so slow commits do
+    not stall the event loop. All methods must be called from the loop that runs the
+    worker.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[list[IngestBatch]], object],
+        *,
+        max_events: int,
+        batch_events: int,
+        batch_delay_ms: int,
+    ) -> None:
+        self._sink = sink
+        self.max_events = max_events
+        self.batch_events = batch_events
+        self.batch_delay_s = batch_delay_ms / 1000.0
+        self._pending: deque[tuple[float, IngestBatch]] = deque()
+        self._depth = 0
+        self._in_flight = 0
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._closing = False
+        self._task: asyncio.Task[None] | None = None
+        self._totals = IngestQueueStats(depth=0, capacity=max_events)
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    @property
+    def retry_after_s(self) -> int:
+        """Suggested client back-off: roughly one batching window."""
+        return max(1, math.ceil(self.batch_delay_s))
+
+    def offer(self, events: Iterable[PrefixEvent] | EventColumns) -> bool:
+        """Queue ``events``; returns ``False`` without queuing when the buffer is full.
+
+        A batch larger than the whole buffer is still accepted when the buffer is empty,
+        so oversized requests are slowed down rather than rejected forever.
+        """
+        batch = events if isinstance(events, EventColumns) else list(events)
+        if self._closing or (self._depth and self._depth + len(batch) > self.max_events):
+            self._totals.rejected_requests += 1
+            return False
+        self._pending.append((time.monotonic(), batch))
+        self._depth += len(batch)
+        self._totals.enqueued_events += len(batch)
+        self._drained.clear()
+        self._wakeup.set()
+        return True
+
+    def stats(self) -> IngestQueueStats:
+        return self._totals.model_copy(update={"depth": self._depth, "in_flight": self._in_flight})
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def join(self) -> None:
+        """Wait until every queued event has been committed (or failed)."""
+        await self._drained.wait()
+
+    async def stop(self) -> None:
+        """Stop accepting events, commit what is queued, and end the worker."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if not self._pending:
+                self._wakeup.clear()
+                if self._closing:
+                    return
+                continue
+            deadline = self._pending[0][0] + self.batch_delay_s
+            while self._depth < self.batch_events and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except TimeoutError:
+                    break
+            await self._commit_batch()
+            self._wakeup.set()
+
+    async def _commit_batch(self) -> None:
+        oldest = self._pending[0][0]
+        taken: list[IngestBatch] = []
+        size = 0
+        while self._pending and size < self.batch_events:
+            _, events = self._pending.popleft()
+            taken.append(events)
+            size += len(events)
+        self._depth -= size
+        self._in_flight = size
+
+        started = time.monotonic()
+        totals = self._totals
+        try:
+            await asyncio.to_thread(self._sink, taken)
+        except Exception:
+            totals.failed_batches += 1
+            logger.exception("Dropping ingest batch of %d events after commit failure", size)
+        else:
+            totals.committed_events += size
+        finished = time.monotonic()
+        self._in_flight = 0
+        totals.batches += 1
+        totals.last_batch_events = size
+        totals.last_batch_latency_ms = (finished - started) * 1000.0
+        totals.max_batch_latency_ms = max(totals.max_batch_latency_ms, totals.last_batch_latency_ms)
+        totals.last_queue_wait_ms = (started - oldest) * 1000.0
+        if not self._pending:
+            self._drained.set()
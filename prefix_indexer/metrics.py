@@ -0,0 +1,156 @@
+"""Per-stage latency histograms and ingest counters, rendered in Prometheus text format.
+
+A disabled ``Metrics`` hands out one shared no-op context manager and returns from
+``inc`` immediately, and the service only calls into it once per chunk or commit, never
+per event, so leaving instrumentation off costs next to nothing.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# Ingest/query stages, in pipeline order.
+STAGES = ("parse", "aggregate", "merge", "flush", "evict", "suggest")
+# Upper bounds (seconds) of the latency buckets; +Inf is implicit.
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+COUNTERS = {
+    "events_parsed": "Trace events accepted by the decoders.",
+    "events_rejected": "Trace rows dropped as invalid.",
+    "keys_touched": "Keys rewritten by commits.",
+    "commits": "Commits that changed the index.",
+}
+
+_PREFIX = "prefix_index"
+_NO_STAGE = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (not thread-safe; ``Metrics`` locks it)."""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Thread-safe registry of stage timings, counters and scrape-time gauges."""
+
+    def __init__(self, *, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages = {stage: Histogram() for stage in STAGES}
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._gauges: dict[str, tuple[str, str, Callable[[], float]]] = {}
+
+    def stage(self, name: str) -> AbstractContextManager[object]:
+        """Time the ``with`` block into the ``name`` stage histogram."""
+        if not self.enabled:
+            return _NO_STAGE
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed_iter(self, name: str, items: Iterator[T]) -> Iterator[T]:
+        """Yield from ``items``, charging the time spent producing each item to ``name``.
+
+        Use it for lazy decoders, where the parsing happens inside ``next``.
+        """
+        if not self.enabled:
+            yield from items
+            return
+        while True:
+            start = time.perf_counter()
+            item = next(items, None)
+            if item is None:
+                return
+            self.observe(name, time.perf_counter() - start)
+            yield item
+
+    def observe(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stages[name].observe(seconds)
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        if not self.enabled or not amount:
+            return
+        with self._lock:
+            self._counters[name] += amount
+
+    def gauge(self, name: str, kind: str, help_text: str, read: Callable[[], float]) -> None:
+        """Register a value read at scrape time; ``kind`` is ``gauge`` or ``counter``."""
+        self._gauges[name] = (kind, help_text, read)
+
+    def stage_totals(self) -> dict[str, tuple[int, float]]:
+        """``(calls, seconds)`` per stage that has run at least once."""
+        with self._lock:
+            return {
+                name: (hist.count, hist.sum) for name, hist in self._stages.items() if hist.count
+            }
+
+    def counters(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def render(self) -> str:
+        """Render everything in the Prometheus text exposition format (version 0.0.4)."""
+        name = f"{_PREFIX}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Wall-clock time per pipeline stage invocation.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage, hist in self._stages.items():
+                cumulative = 0
+                for bound, count in zip((*hist.buckets, "+Inf"), hist.counts, strict=True):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {hist.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {hist.count}')
+            counters = dict(self._counters)
+        for counter, value in counters.items():
+            lines += [
+                f"# HELP {_PREFIX}_{counter}_total {COUNTERS[counter]}",
+                f"# TYPE {_PREFIX}_{counter}_total counter",
+                f"{_PREFIX}_{counter}_total {value}",
+            ]
+        for gauge, (kind, help_text, read) in self._gauges.items():
+            lines += [
+                f"# HELP {_PREFIX}_{gauge} {help_text}",
+                f"# TYPE {_PREFIX}_{gauge} {kind}",
+                f"{_PREFIX}_{gauge} {read()}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        """Human-readable stage and counter summary (the CLI ``--profile`` output)."""
+        lines = [f"{'stage':<26} {'calls':>8} {'total_ms':>12} {'mean_ms':>10}"]
+        for stage, (calls, seconds) in self.stage_totals().items():
+            lines.append(
+                f"{stage:<26} {calls:>8} {seconds * 1000:>12.2f} {seconds * 1000 / calls:>10.3f}"
+            )
+        lines.extend(f"{counter:<26} {value}" for counter, value in self.counters().items())
+        lines.extend(f"{gauge:<26} {read()}" for gauge, (_, _, read) in self._gauges.items())
+        return "\n".join(lines)
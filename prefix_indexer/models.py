@@ -2,8 +2,13 @@
 
 from __future__ import annotations
 
+from typing import Annotated, Literal
+
 from pydantic import BaseModel, Field
 
+# Identity of an aggregate: (prefix_id, tenant, model_id).
+PrefixKey = tuple[str, str, str]
+
 
 class PrefixEvent(BaseModel):
     """Single KV cache access trace."""
@@ -36,6 +41,11 @@ class PrefixStats(BaseModel):
     score: float = Field(..., ge=0.0)
     last_seen_ms: int = Field(..., ge=0)
 
+    @property
+    def key(self) -> PrefixKey:
+        """Identity tuple used by stores and merges."""
+        return (self.prefix_id, self.tenant, self.model_id)
+
 
 class PrefixRecommendation(BaseModel):
     """Recommendation produced for planners."""
@@ -47,10 +57,81 @@ class PrefixRecommendation(BaseModel):
     hint: str
 
 
+class PrefixChanges(BaseModel):
+    """Top-k delta between an earlier index generation and the current one."""
+
+    generation: int = Field(..., ge=0, description="Generation to pass as ``since`` next time.")
+    epoch: int = Field(
+        0,
+        ge=0,
+        description="Server start-up time in ms; pass it back as ``epoch`` with ``since``.",
+    )
+    reset: bool = Field(
+        False,
+        description="The change log no longer covers ``since``; ``changed`` is the full top-k.",
+    )
+    changed: list[PrefixRecommendation] = Field(
+        default_factory=list, description="Current top-k keys whose stats changed."
+    )
+    evicted: list[PrefixKey] = Field(
+        default_factory=list, description="Keys that were in the top-k and no longer are."
+    )
+
+
+class IngestReport(BaseModel):
+    """Outcome of ingesting a trace source."""
+
+    accepted: int = Field(..., ge=0)
+    rejected: int = Field(0, ge=0)
+    keys: int = Field(0, ge=0)
+
+
 class PrefixIndexConfig(BaseModel):
     """Runtime configuration switches."""
 
     decay_half_life_ms: int = Field(3_600_000, ge=1)
+    # Extra half-lives scored in the same ingest pass. Each gets its own ranked store,
+    # read with ``recommendations(horizon=...)``; ``decay_half_life_ms`` stays the default.
+    decay_horizons_ms: list[Annotated[int, Field(ge=1)]] = Field(default_factory=list)
     max_recommendations: int = Field(100, ge=1)
     min_score: float = Field(0.0, ge=0.0)
     store_path: str | None = None
+    store_backend: Literal["auto", "memory", "columnar", "jsonl", "sqlite", "snapshot"] = "auto"
+    ingest_chunk_size: int = Field(10_000, ge=1)
+    # "columnar" decodes straight into columns and skips invalid rows; "pydantic"
+    # validates a PrefixEvent per line and aborts on the first bad one.
+    ingest_decoder: Literal["columnar", "pydantic"] = "columnar"
+    # Longest NDJSON line accepted by streamed ingest; longer lines reject the stream.
+    ingest_max_line_bytes: int = Field(1 << 20, ge=1)
+    analytics_backend: Literal["python", "numpy"] = "python"
+    # HTTP /ingest buffers up to this many events and commits them in micro-batches from
+    # a background worker; 0 commits inside the request instead.
+    ingest_queue_max_events: int = Field(0, ge=0)
+    ingest_batch_max_events: int = Field(5_000, ge=1)
+    ingest_batch_max_delay_ms: int = Field(50, ge=0)
+    # HTTP /suggest and /snapshot responses kept per parameters and generation; /suggest
+    # answers as of the generation's commit, so polls of an unchanged index share one
+    # body and ETag. 0 disables response caching.
+    response_cache_entries: int = Field(256, ge=0)
+    # Prior stats of changed keys kept for the ``changes(since=...)`` feed; older commits
+    # are dropped past this many key records and their callers get a full reset.
+    change_log_max_keys: int = Field(100_000, ge=0)
+    # Bounded-memory mode: once the index grows ``evict_slack`` past ``max_keys`` (or past
+    # its size after the previous sweep), the lowest-ranked keys are evicted down to
+    # ``max_keys`` together with every key whose decayed score is below ``evict_min_score``.
+    # Keys tied with the ``max_keys``-th rank are kept, so the bound is approximate.
+    max_keys: int | None = Field(None, ge=1)
+    evict_min_score: float = Field(0.0, ge=0.0)
+    evict_slack: float = Field(0.1, ge=0.0)
+    # Record per-stage latency histograms and ingest counters (see ``metrics``); off by
+    # default, which leaves only a no-op context manager per chunk and commit.
+    metrics_enabled: bool = False
+    # Per-key ring buffers of per-minute and per-hour byte/hit totals behind windowed
+    # ``recommendations(window_ms=...)``; 0 disables a level. Each bucket costs 16 bytes
+    # per key. With a persistent ``store_path`` they are saved beside it on ``close``; a
+    # start-up without that file refuses windows reaching back before it.
+    rollup_minutes: int = Field(0, ge=0)
+    rollup_hours: int = Field(0, ge=0)
+    store_wal: bool = False
+    wal_compact_min_bytes: int = Field(64 * 1024 * 1024, ge=0)
+    wal_compact_ratio: float = Field(0.5, gt=0.0)
@@ -0,0 +1,441 @@
+"""Ranking structures kept current on upsert so queries avoid full sorts."""
+
+from __future__ import annotations
+
+import heapq
+import math
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from itertools import chain, islice
+from operator import itemgetter
+
+from .analytics import decay_rank
+from .models import PrefixKey, PrefixStats
+
+# Sort entry: (-rank, -hit_count, -last_seen_ms, key). Ascending order is the ranking
+# order used by recommendations, with the key as a deterministic final tie-breaker.
+RankEntry = tuple[float, int, int, PrefixKey]
+
+# Batches at least this large (or 1/64th of the index) re-sort instead of bisecting.
+_REBUILD_MIN_BATCH = 64
+# Entries per block of the rank order; blocks split at twice this size.
+_BLOCK_SIZE = 512
+# Keys per hash shard before the shard count doubles.
+_SHARD_LOAD = 1_024
+
+
+def rank_entry(stat: PrefixStats, half_life_ms: int) -> RankEntry:
+    return (-decay_rank(stat, half_life_ms), -stat.hit_count, -stat.last_seen_ms, stat.key)
+
+
+def _rank_key(entry: RankEntry) -> float:
+    return entry[0]
+
+
+class RankingIndex:
+    """Stats ordered by time-invariant decay rank.
+
+    The rank order is a list of sorted blocks of about ``_BLOCK_SIZE`` entries, and keys
+    map to their stats through hash shards of about ``_SHARD_LOAD`` keys. An
+    upsert bisects the block maxima, then the block; large batches fall back to one
+    re-sort of mostly ordered data. Ranked iteration is lazy, so taking the top ``k``
+    costs O(k + log N), and a rank floor is answered with two bisects.
+
+    ``copy`` shares every block and shard with the original and copies only the lists
+    that point at them; a block or shard is cloned the first time the copy writes to it.
+    A copy-on-write update therefore costs O(N / block + N / shard) plus the touched
+    blocks and shards, which follows the batch rather than the partition.
+    """
+
+    def __init__(self, half_life_ms: int) -> None:
+        self.half_life_ms = half_life_ms
+        self._blocks: list[list[RankEntry]] = []
+        self._maxes: list[RankEntry] = []
+        self._shards: list[dict[PrefixKey, PrefixStats]] = [{}]
+        self._len = 0
+        # ids of the blocks and shards this instance may mutate (created since ``copy``).
+        self._owned: set[int] = {id(self._shards[0])}
+        # Keys in ``prefix_id`` order, built on first ordered scan and dropped on change.
+        self._sorted: list[PrefixKey] | None = None
+
+    def __len__(self) -> int:
+        return self._len
+
+    def copy(self) -> RankingIndex:
+        clone = RankingIndex(self.half_life_ms)
+        clone._blocks = self._blocks.copy()
+        clone._maxes = self._maxes.copy()
+        clone._shards = self._shards.copy()
+        clone._len = self._len
+        clone._owned = set()
+        # Both sides now share every block and shard, so neither may write them in place.
+        self._owned = set()
+        return clone
+
+    def entry(self, stat: PrefixStats) -> RankEntry:
+        return rank_entry(stat, self.half_life_ms)
+
+    def get(self, key: PrefixKey) -> PrefixStats | None:
+        return self._shards[hash(key) & (len(self._shards) - 1)].get(key)
+
+    def values(self) -> Iterator[PrefixStats]:
+        for shard in self._shards:
+            yield from shard.values()
+
+    def upsert(self, stats: Iterable[PrefixStats]) -> None:
+        batch = list(stats)
+        if not batch:
+            return
+        self._sorted = None
+        if len(batch) >= max(_REBUILD_MIN_BATCH, self._len >> 6):
+            self._rebuild(batch)
+            return
+        for stat in batch:
+            key = stat.key
+            shard = self._shard(key)
+            previous = shard.get(key)
+            shard[key] = stat
+            entry = self.entry(stat)
+            if previous is None:
+                self._len += 1
+            else:
+                previous_entry = self.entry(previous)
+                if previous_entry == entry:
+                    continue
+                self._remove(previous_entry)
+            self._insert(entry)
+        self._maybe_reshard()
+
+    def discard(self, key: PrefixKey) -> None:
+        if self.get(key) is None:
+            return
+        self._remove(self.entry(self._shard(key).pop(key)))
+        self._len -= 1
+        self._sorted = None
+
+    def clear(self) -> None:
+        self._blocks = []
+        self._maxes = []
+        self._shards = [{}]
+        self._len = 0
+        self._owned = {id(self._shards[0])}
+        self._sorted = None
+
+    def lowest_rank(self) -> float:
+        """Rank of the coldest key, ``inf`` when empty."""
+        return -self._maxes[-1][0] if self._maxes else math.inf
+
+    def evict(self, *, min_rank: float) -> int:
+        """Drop every key ranked below ``min_rank``; returns how many were dropped."""
+        block, position = self._cut(min_rank)
+        if block == len(self._blocks):
+            return 0
+        cold = self._blocks[block][position:]
+        for tail in self._blocks[block + 1 :]:
+            cold.extend(tail)
+        del self._blocks[block + 1 :]
+        del self._maxes[block + 1 :]
+        if position:
+            kept = self._blocks[block][:position]
+            self._blocks[block] = kept
+            self._maxes[block] = kept[-1]
+            self._owned.add(id(kept))
+        else:
+            del self._blocks[block]
+            del self._maxes[block]
+        for entry in cold:
+            del self._shard(entry[3])[entry[3]]
+        self._len -= len(cold)
+        self._sorted = None
+        return len(cold)
+
+    def iter_sorted(self, *, after: str | None = None) -> Iterator[PrefixStats]:
+        """Yield stats in ``prefix_id`` order, starting after prefix ``after``."""
+        keys = self._sorted
+        if keys is None:
+            keys = self._sorted = sorted(key for shard in self._shards for key in shard)
+        start = 0 if after is None else bisect_right(keys, after, key=itemgetter(0))
+        for key in islice(keys, start, None):
+            yield self._shards[hash(key) & (len(self._shards) - 1)][key]
+
+    def iter_entries(self, *, min_rank: float = -math.inf) -> Iterator[RankEntry]:
+        """Yield entries from highest to lowest rank, stopping below ``min_rank``."""
+        stop_block, stop = self._cut(min_rank)
+        runs = self._blocks[:stop_block]
+        if stop_block < len(self._blocks):
+            runs.append(self._blocks[stop_block][:stop])
+        return chain.from_iterable(runs)
+
+    def iter_items(self, *, min_rank: float = -math.inf) -> Iterator[tuple[RankEntry, PrefixStats]]:
+        """Yield ``(entry, stats)`` pairs from highest to lowest rank."""
+        shards = self._shards
+        mask = len(shards) - 1
+        for entry in self.iter_entries(min_rank=min_rank):
+            yield entry, shards[hash(entry[3]) & mask][entry[3]]
+
+    def iter_keys(self, *, min_rank: float = -math.inf) -> Iterator[PrefixKey]:
+        """Yield keys from highest to lowest rank, stopping below ``min_rank``."""
+        for entry in self.iter_entries(min_rank=min_rank):
+            yield entry[3]
+
+    def _cut(self, min_rank: float) -> tuple[int, int]:
+        """``(block, offset)`` of the first entry ranked below ``min_rank``."""
+        if min_rank == -math.inf:
+            return len(self._blocks), 0
+        block = bisect_right(self._maxes, -min_rank, key=_rank_key)
+        if block == len(self._blocks):
+            return block, 0
+        return block, bisect_right(self._blocks[block], -min_rank, key=_rank_key)
+
+    def _shard(self, key: PrefixKey) -> dict[PrefixKey, PrefixStats]:
+        """The shard holding ``key``, cloned first if it is shared with another copy."""
+        slot = hash(key) & (len(self._shards) - 1)
+        shard = self._shards[slot]
+        if id(shard) not in self._owned:
+            shard = self._shards[slot] = shard.copy()
+            self._owned.add(id(shard))
+        return shard
+
+    def _writable_block(self, block: int) -> list[RankEntry]:
+        entries = self._blocks[block]
+        if id(entries) not in self._owned:
+            entries = self._blocks[block] = entries.copy()
+            self._owned.add(id(entries))
+        return entries
+
+    def _insert(self, entry: RankEntry) -> None:
+        if not self._blocks:
+            self._blocks.append([entry])
+            self._maxes.append(entry)
+            self._owned.add(id(self._blocks[0]))
+            return
+        block = min(bisect_left(self._maxes, entry), len(self._blocks) - 1)
+        entries = self._writable_block(block)
+        insort(entries, entry)
+        self._maxes[block] = entries[-1]
+        if len(entries) > 2 * _BLOCK_SIZE:
+            head, tail = entries[:_BLOCK_SIZE], entries[_BLOCK_SIZE:]
+            self._blocks[block : block + 1] = [head, tail]
+            self._maxes[block : block + 1] = [head[-1], tail[-1]]
+            self._owned.update((id(head), id(tail)))
+
+    def _remove(self, entry: RankEntry) -> None:
+        block = bisect_left(self._maxes, entry)
+        entries = self._writable_block(block)
+        del entries[bisect_left(entries, entry)]
+        if entries:
+            self._maxes[block] = entries[-1]
+        else:
+            del self._blocks[block]
+            del self._maxes[block]
+
+    def _rebuild(self, batch: list[PrefixStats]) -> None:
+        count = _shard_count(self._len + len(batch))
+        shards: list[dict[PrefixKey, PrefixStats]]
+        if count == len(self._shards):
+            shards = [shard.copy() for shard in self._shards]
+        else:
+            shards = [{} for _ in range(count)]
+            for shard in self._shards:
+                for key, stat in shard.items():
+                    shards[hash(key) & (count - 1)][key] = stat
+        entry_of = self.entry
+        entries: dict[PrefixKey, RankEntry] = {}
+        for stat in batch:
+            entry = entry_of(stat)
+            key = entry[3]
+            entries[key] = entry
+            shards[hash(key) & (count - 1)][key] = stat
+        order = [entry for block in self._blocks for entry in block if entry[3] not in entries]
+        order.extend(entries.values())
+        order.sort()
+        self._blocks = [order[i : i + _BLOCK_SIZE] for i in range(0, len(order), _BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(order)
+        self._shards = shards
+        self._owned = {id(block) for block in self._blocks}
+        self._owned.update(id(shard) for shard in shards)
+
+    def _maybe_reshard(self) -> None:
+        if self._len > _SHARD_LOAD * len(self._shards):
+            self._rebuild([])
+
+
+def _shard_count(keys: int) -> int:
+    count = 1
+    while count * _SHARD_LOAD < keys:
+        count *= 2
+    return count
+
+
+class PartitionedRanking:
+    """One ``RankingIndex`` per ``(tenant, model_id)`` partition.
+
+    A query for a single tenant/model reads just that partition. Broader queries lazily
+    merge the selected partitions, which costs O(k log P) for the top ``k`` across ``P``
+    partitions instead of touching keys that would be filtered out.
+
+    Writes are copy-on-write: touched partitions are cloned, updated, and published by
+    swapping one reference, and published partitions are never mutated. A reader that
+    started before a write keeps iterating the state it started on, so it never waits for
+    and never observes a half-applied batch. Cloning a partition shares its blocks and
+    shards (see ``RankingIndex``), so a write costs the batch plus a small index copy
+    rather than the size of the partition.
+    """
+
+    def __init__(self, half_life_ms: int) -> None:
+        self.half_life_ms = half_life_ms
+        self._partitions: dict[str, dict[str, RankingIndex]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._iter_partitions())
+
+    def snapshot(self) -> PartitionedRanking:
+        """Return a read-only view of the current state in O(1)."""
+        view = PartitionedRanking(self.half_life_ms)
+        view._partitions = self._partitions
+        return view
+
+    def get(self, key: PrefixKey) -> PrefixStats | None:
+        _, tenant, model_id = key
+        index = self._partitions.get(tenant, {}).get(model_id)
+        return index.get(key) if index is not None else None
+
+    def values(self) -> Iterator[PrefixStats]:
+        for index in self._iter_partitions():
+            yield from index.values()
+
+    def iter_stats(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        """Yield stats in ``(tenant, model_id, prefix_id)`` order, strictly after ``after``.
+
+        Partitions cache their sorted keys, so resuming a scan from a cursor costs a
+        bisect rather than a sort.
+        """
+        partitions = self._partitions
+        for tenant in sorted(partitions):
+            if after is not None and tenant < after[1]:
+                continue
+            models = partitions[tenant]
+            for model_id in sorted(models):
+                position = (tenant, model_id)
+                if after is not None and position < (after[1], after[2]):
+                    continue
+                resume = (
+                    after[0] if after is not None and position == (after[1], after[2]) else None
+                )
+                yield from models[model_id].iter_sorted(after=resume)
+
+    def upsert(self, stats: Iterable[PrefixStats]) -> None:
+        grouped: dict[tuple[str, str], list[PrefixStats]] = defaultdict(list)
+        for stat in stats:
+            grouped[(stat.tenant, stat.model_id)].append(stat)
+        if not grouped:
+            return
+        partitions = dict(self._partitions)
+        copied: set[str] = set()
+        for (tenant, model_id), batch in grouped.items():
+            if tenant not in copied:
+                partitions[tenant] = dict(partitions.get(tenant, {}))
+                copied.add(tenant)
+            models = partitions[tenant]
+            previous = models.get(model_id)
+            index = previous.copy() if previous is not None else RankingIndex(self.half_life_ms)
+            index.upsert(batch)
+            models[model_id] = index
+        self._partitions = partitions
+
+    def discard(self, key: PrefixKey) -> None:
+        _, tenant, model_id = key
+        models = self._partitions.get(tenant)
+        if models is None or model_id not in models or models[model_id].get(key) is None:
+            return
+        partitions = dict(self._partitions)
+        models = partitions[tenant] = dict(models)
+        index = models[model_id] = models[model_id].copy()
+        index.discard(key)
+        if not len(index):
+            del models[model_id]
+            if not models:
+                del partitions[tenant]
+        self._partitions = partitions
+
+    def clear(self) -> None:
+        self._partitions = {}
+
+    def evict(self, *, min_rank: float) -> int:
+        """Drop every key ranked below ``min_rank`` and publish the result in one swap.
+
+        Only partitions whose lowest entry falls below the floor are copied.
+        """
+        partitions = dict(self._partitions)
+        evicted = 0
+        for tenant, models in self._partitions.items():
+            for model_id, index in models.items():
+                if index.lowest_rank() >= min_rank:
+                    continue
+                if partitions[tenant] is models:
+                    partitions[tenant] = dict(models)
+                trimmed = index.copy()
+                evicted += trimmed.evict(min_rank=min_rank)
+                if len(trimmed):
+                    partitions[tenant][model_id] = trimmed
+                else:
+                    del partitions[tenant][model_id]
+            if not partitions[tenant]:
+                del partitions[tenant]
+        if evicted:
+            self._partitions = partitions
+        return evicted
+
+    def iter_keys(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[PrefixKey]:
+        """Yield keys in rank order, optionally restricted to a tenant and/or model."""
+        for entry in self.iter_entries(min_rank=min_rank, tenant=tenant, model_id=model_id):
+            yield entry[3]
+
+    def iter_entries(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[RankEntry]:
+        """Yield sort entries in rank order across the selected partitions."""
+        selected = list(self._iter_partitions(tenant=tenant, model_id=model_id))
+        if len(selected) == 1:
+            return selected[0].iter_entries(min_rank=min_rank)
+        return heapq.merge(*(index.iter_entries(min_rank=min_rank) for index in selected))
+
+    def iter_items(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[tuple[RankEntry, PrefixStats]]:
+        """Yield ``(entry, stats)`` pairs in rank order across the selected partitions."""
+        selected = list(self._iter_partitions(tenant=tenant, model_id=model_id))
+        if len(selected) == 1:
+            return selected[0].iter_items(min_rank=min_rank)
+        runs = (index.iter_items(min_rank=min_rank) for index in selected)
+        return heapq.merge(*runs, key=itemgetter(0))
+
+    def _iter_partitions(
+        self, *, tenant: str | None = None, model_id: str | None = None
+    ) -> Iterator[RankingIndex]:
+        partitions = self._partitions
+        if tenant is not None:
+            tenants = [partitions.get(tenant, {})]
+        else:
+            tenants = list(partitions.values())
+        for models in tenants:
+            if model_id is None:
+                yield from models.values()
+            elif model_id in models:
+                yield models[model_id]
@@ -0,0 +1,221 @@
+"""Trace readers that stream events from disk in bounded chunks."""
+
+from __future__ import annotations
+
+import glob
+import gzip
+import io
+import zlib
+from collections.abc import Callable, Iterator
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import IO, Any
+
+from .columns import EventColumns, columns_from_mapping, decode_jsonl
+from .models import PrefixEvent
+
+# Only the fields aggregation reads are projected out of columnar sources.
+PARQUET_COLUMNS = ("prefix_id", "tenant", "model_id", "bytes", "latency_ms", "timestamp_ms")
+PARQUET_SUFFIXES = (".parquet", ".pq")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+TRACE_SUFFIXES = (".jsonl", ".ndjson", ".json", ".gz", ".zst", *PARQUET_SUFFIXES)
+
+
+def resolve_format(path: Path, file_format: str = "auto") -> str:
+    """Return ``"parquet"`` or ``"jsonl"``, inferring from the suffix when ``auto``."""
+    if file_format == "auto":
+        return "parquet" if path.suffix in PARQUET_SUFFIXES else "jsonl"
+    return file_format
+
+
+def expand_trace_paths(spec: str | Path) -> list[Path]:
+    """Expand a file, directory or glob pattern into a sorted list of trace files.
+
+    Directories contribute their non-hidden files with a known trace suffix.
+    """
+    text = str(spec)
+    if any(char in text for char in "*?["):
+        return sorted(
+            Path(match) for match in glob.glob(text, recursive=True) if Path(match).is_file()
+        )
+    source = Path(text)
+    if source.is_dir():
+        return sorted(
+            path
+            for path in source.iterdir()
+            if path.is_file() and not path.name.startswith(".") and path.suffix in TRACE_SUFFIXES
+        )
+    return [source]
+
+
+def open_trace(path: Path) -> IO[str]:
+    """Open a trace file for text reading, transparently decompressing gzip or zstd.
+
+    The compression format is sniffed from the leading magic bytes, so file suffixes do
+    not matter. zstd support needs the optional ``zstandard`` package.
+    """
+    with path.open("rb") as probe:
+        magic = probe.read(4)
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if magic.startswith(_ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError as exc:  # pragma: no cover - depends on optional extra
+            raise RuntimeError(
+                f"{path} is zstd-compressed; install the 'zstandard' package to read it"
+            ) from exc
+        raw = path.open("rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+# Largest piece ``StreamDecoder.decode`` inflates gzip input into at once.
+DECODE_CHUNK = 64 * 1024
+# zstd input is fed this many bytes at a time; a zstd block needs at least four bytes
+# and inflates to at most 128 KiB, which bounds each piece at 2 MiB.
+_ZSTD_SLICE = 64
+
+
+class LineTooLongError(ValueError):
+    """An NDJSON line exceeded the configured maximum length."""
+
+
+class StreamDecoder:
+    """Incrementally undo an HTTP ``Content-Encoding`` (identity, gzip or zstd).
+
+    Concatenated gzip members and zstd frames are decoded back to back. ``decode``
+    yields the output in bounded pieces rather than inflating a whole chunk at once, so
+    a small, highly compressed body cannot allocate more than one piece at a time. It
+    raises ``ValueError`` on corrupt input and ``close`` raises it if the stream ended
+    inside a member.
+    """
+
+    def __init__(self, content_encoding: str | None = None) -> None:
+        encoding = (content_encoding or "identity").strip().lower()
+        self._zstd = False
+        self._factory: Callable[[], Any] | None
+        self._errors: tuple[type[Exception], ...] = (zlib.error,)
+        if encoding == "identity":
+            self._factory = None
+        elif encoding in ("gzip", "x-gzip"):
+            self._factory = partial(zlib.decompressobj, 16 + zlib.MAX_WBITS)
+        elif encoding == "zstd":
+            try:
+                import zstandard
+            except ImportError as exc:  # pragma: no cover - depends on optional extra
+                raise RuntimeError(
+                    "zstd request bodies need the optional 'zstandard' package"
+                ) from exc
+            self._factory = zstandard.ZstdDecompressor().decompressobj
+            self._errors = (zstandard.ZstdError,)
+            self._zstd = True
+        else:
+            raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+        self._obj = self._factory() if self._factory is not None else None
+        self._in_member = False
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        """Yield the decoded bytes of ``data`` in pieces of bounded size."""
+        if self._obj is None:
+            if data:
+                yield data
+            return
+        try:
+            if self._zstd:
+                for start in range(0, len(data), _ZSTD_SLICE):
+                    yield from self._inflate(data[start : start + _ZSTD_SLICE])
+            else:
+                yield from self._inflate(data)
+        except self._errors as exc:
+            raise ValueError(f"Corrupt compressed body: {exc}") from exc
+
+    def _inflate(self, data: bytes) -> Iterator[bytes]:
+        assert self._factory is not None
+        if not data:
+            return
+        obj: Any = self._obj
+        self._in_member = True
+        while True:
+            if self._zstd:
+                piece = obj.decompress(data)
+                data = b""
+            else:
+                piece = obj.decompress(data, DECODE_CHUNK)
+                data = obj.unconsumed_tail
+            if piece:
+                yield piece
+            if obj.eof:
+                data = obj.unused_data
+                obj = self._obj = self._factory()
+                self._in_member = bool(data)
+                if not data:
+                    return
+            elif not data and (self._zstd or len(piece) < DECODE_CHUNK):
+                # A full gzip piece may have more output pending; drain it first.
+                return
+
+    def close(self) -> None:
+        if self._in_member:
+            raise ValueError("Compressed body ended mid-stream")
+
+
+def iter_jsonl_lines(path: Path, *, chunk_size: int) -> Iterator[list[str]]:
+    """Yield non-blank JSONL lines from ``path`` in lists of at most ``chunk_size``."""
+    with open_trace(path) as fh:
+        lines = (line for line in fh if line.strip())
+        while chunk := list(islice(lines, chunk_size)):
+            yield chunk
+
+
+def iter_jsonl_chunks(path: Path, *, chunk_size: int) -> Iterator[list[PrefixEvent]]:
+    """Yield validated events from ``path`` in lists of at most ``chunk_size``."""
+    for lines in iter_jsonl_lines(path, chunk_size=chunk_size):
+        yield [PrefixEvent.model_validate_json(line) for line in lines]
+
+
+def iter_jsonl_columns(path: Path, *, chunk_size: int) -> Iterator[EventColumns]:
+    """Yield column batches from ``path``; invalid rows are counted, not raised."""
+    for lines in iter_jsonl_lines(path, chunk_size=chunk_size):
+        yield decode_jsonl(lines)
+
+
+def iter_parquet_columns(
+    path: Path,
+    *,
+    chunk_size: int,
+    since_ms: int | None = None,
+    until_ms: int | None = None,
+) -> Iterator[EventColumns]:
+    """Yield column batches from a Parquet file or directory of Parquet files.
+
+    Only ``PARQUET_COLUMNS`` are read, record batches are bounded by ``chunk_size``, and
+    the optional ``[since_ms, until_ms)`` window is pushed down to the scan so row groups
+    outside it are skipped via their statistics. Needs the optional ``pyarrow`` package.
+    """
+    try:
+        import pyarrow.dataset as ds
+    except ImportError as exc:  # pragma: no cover - depends on optional extra
+        raise RuntimeError(f"Reading {path} requires the optional 'pyarrow' package") from exc
+
+    dataset = ds.dataset(str(path), format="parquet")
+    predicate = None
+    if since_ms is not None:
+        predicate = ds.field("timestamp_ms") >= since_ms
+    if until_ms is not None:
+        upper = ds.field("timestamp_ms") < until_ms
+        predicate = upper if predicate is None else predicate & upper
+    scanner = dataset.scanner(
+        columns=list(PARQUET_COLUMNS), filter=predicate, batch_size=chunk_size
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield columns_from_mapping(
+                {name: batch.column(name).to_pylist() for name in PARQUET_COLUMNS}
+            )
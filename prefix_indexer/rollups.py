@@ -0,0 +1,399 @@
+"""Per-key ring buffers of time-bucketed totals for windowed top-k queries.
+
+Every key keeps a ring of per-minute buckets and a ring of per-hour buckets, each holding
+the bytes and hits seen in that bucket. Both rings are filled from the same events, so an
+hour bucket always equals the sum of its minutes, and memory per key is fixed by the ring
+sizes. A window query sums the buckets it covers instead of rescanning traces: the minute
+ring answers windows it still fully retains, the hour ring longer ones.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from array import array
+from collections.abc import Iterator
+from operator import itemgetter
+from typing import Any
+
+from .columns import EventColumns
+from .models import PrefixKey
+
+MINUTE_MS = 60_000
+HOUR_MS = 3_600_000
+
+# Keys per hash shard of a partition; copy-on-write merges clone only touched shards.
+_SHARD_LOAD = 1_024
+
+# (key, bytes, hits) summed over a window.
+WindowTotal = tuple[PrefixKey, int, int]
+
+# JSON-ready form of one key: [prefix_id, tenant, model_id, minutes, hours], each ring as
+# [head, values] or None for a disabled level.
+RollupRow = list[Any]
+
+
+class TimeRing:
+    """Fixed number of consecutive buckets ending at ``head``, the newest bucket seen.
+
+    Bucket ``b`` covers ``[b * width, (b + 1) * width)`` for the ring's width, which the
+    caller tracks. ``values`` holds the byte totals followed by the hit totals.
+    """
+
+    __slots__ = ("head", "values")
+
+    def __init__(self, slots: int) -> None:
+        self.head = -1
+        self.values = array("q", bytes(16 * slots))
+
+    def copy(self) -> TimeRing:
+        return TimeRing.restore(self.head, self.values)
+
+    @classmethod
+    def restore(cls, head: int, values: Any) -> TimeRing:
+        """Rebuild a ring from its ``head`` and ``values`` (copied)."""
+        ring = cls.__new__(cls)
+        ring.head = head
+        ring.values = array("q", values)
+        return ring
+
+    def add(self, bucket: int, bytes_: int, hits: int = 1) -> None:
+        """Count an event in ``bucket``; buckets the ring no longer retains are ignored."""
+        slots = len(self.values) // 2
+        if bucket > self.head:
+            self._advance(bucket, slots)
+        elif bucket <= self.head - slots:
+            return
+        pos = bucket % slots
+        self.values[pos] += bytes_
+        self.values[slots + pos] += hits
+
+    def merge(self, other: TimeRing) -> None:
+        """Add every bucket of ``other`` that this ring retains after catching up to it."""
+        if other.head < 0:
+            return
+        slots = len(self.values) // 2
+        if other.head > self.head:
+            self._advance(other.head, slots)
+        values, theirs = self.values, other.values
+        for bucket in range(max(other.head, self.head) - slots + 1, other.head + 1):
+            if bucket <= other.head - slots:
+                continue
+            pos = bucket % slots
+            values[pos] += theirs[pos]
+            values[slots + pos] += theirs[slots + pos]
+
+    def total(self, first: int, last: int) -> tuple[int, int]:
+        """Bytes and hits over buckets ``first..last`` (inclusive)."""
+        slots = len(self.values) // 2
+        total_bytes = hits = 0
+        for bucket in range(max(first, self.head - slots + 1), min(last, self.head) + 1):
+            pos = bucket % slots
+            total_bytes += self.values[pos]
+            hits += self.values[slots + pos]
+        return total_bytes, hits
+
+    def _advance(self, bucket: int, slots: int) -> None:
+        if bucket - self.head >= slots:
+            if self.head >= 0:
+                self.values = array("q", bytes(16 * slots))
+        else:
+            for stale in range(self.head + 1, bucket + 1):
+                pos = stale % slots
+                self.values[pos] = 0
+                self.values[slots + pos] = 0
+        self.head = bucket
+
+
+class KeyRollup:
+    """The minute and hour rings of one key (``None`` for a disabled level)."""
+
+    __slots__ = ("minutes", "hours")
+
+    def __init__(self, minutes: TimeRing | None, hours: TimeRing | None) -> None:
+        self.minutes = minutes
+        self.hours = hours
+
+    def copy(self) -> KeyRollup:
+        return KeyRollup(
+            self.minutes.copy() if self.minutes is not None else None,
+            self.hours.copy() if self.hours is not None else None,
+        )
+
+    def add(self, timestamp_ms: int, bytes_: int) -> None:
+        if self.minutes is not None:
+            self.minutes.add(timestamp_ms // MINUTE_MS, bytes_)
+        if self.hours is not None:
+            self.hours.add(timestamp_ms // HOUR_MS, bytes_)
+
+    def merge(self, other: KeyRollup) -> None:
+        if self.minutes is not None and other.minutes is not None:
+            self.minutes.merge(other.minutes)
+        if self.hours is not None and other.hours is not None:
+            self.hours.merge(other.hours)
+
+    def newest_ms(self) -> int:
+        """Start of the newest retained bucket, or -1 when empty."""
+        if self.minutes is not None:
+            return self.minutes.head * MINUTE_MS if self.minutes.head >= 0 else -1
+        assert self.hours is not None
+        return self.hours.head * HOUR_MS if self.hours.head >= 0 else -1
+
+
+class _Partition:
+    """Rollups of one ``(tenant, model_id)``, split over hash shards of ``prefix_id``.
+
+    The shard count is a power of two keeping about ``_SHARD_LOAD`` keys per shard, so a
+    copy-on-write update clones the list of shards plus the shards it writes to.
+    """
+
+    __slots__ = ("shards", "size")
+
+    def __init__(self, shards: list[dict[str, KeyRollup]] | None = None, size: int = 0) -> None:
+        self.shards = shards if shards is not None else [{}]
+        self.size = size
+
+    def copy(self) -> _Partition:
+        """A copy sharing every shard with this partition."""
+        return _Partition(list(self.shards), self.size)
+
+    def items(self) -> Iterator[tuple[str, KeyRollup]]:
+        for shard in self.shards:
+            yield from shard.items()
+
+    def shard(self, prefix_id: str, owned: set[int] | None = None) -> dict[str, KeyRollup]:
+        """The shard holding ``prefix_id``; cloned first unless ``owned`` lists it.
+
+        ``owned=None`` writes in place, for partitions no reader can see yet.
+        """
+        slot = hash(prefix_id) & (len(self.shards) - 1)
+        shard = self.shards[slot]
+        if owned is not None and id(shard) not in owned:
+            shard = self.shards[slot] = dict(shard)
+            owned.add(id(shard))
+        return shard
+
+    def reshard(self) -> None:
+        """Double the shard count while shards are over ``_SHARD_LOAD`` keys on average."""
+        count = len(self.shards)
+        while count * _SHARD_LOAD < self.size:
+            count *= 2
+        if count == len(self.shards):
+            return
+        shards: list[dict[str, KeyRollup]] = [{} for _ in range(count)]
+        for prefix_id, rollup in self.items():
+            shards[hash(prefix_id) & (count - 1)][prefix_id] = rollup
+        self.shards = shards
+
+
+class RollupIndex:
+    """Rollups for every key, grouped by ``(tenant, model_id)``.
+
+    ``add`` mutates in place and is meant for the private index an ingest folds into.
+    ``merge`` publishes another index copy-on-write, copying only the touched shards of
+    each partition and the touched keys, so its cost follows the batch rather than the
+    partition and readers iterating a previous state never see a half-merged batch.
+    Keys whose newest event has aged out of every ring are dropped as the index grows.
+    """
+
+    def __init__(self, minute_slots: int, hour_slots: int) -> None:
+        if minute_slots <= 0 and hour_slots <= 0:
+            raise ValueError("A rollup index needs minute or hour buckets")
+        self.minute_slots = minute_slots
+        self.hour_slots = hour_slots
+        self.newest_ms = -1
+        self._partitions: dict[tuple[str, str], _Partition] = {}
+        self._size = 0
+        self._prune_at = 1_024
+
+    def __len__(self) -> int:
+        return self._size
+
+    def new_key(self) -> KeyRollup:
+        return KeyRollup(
+            TimeRing(self.minute_slots) if self.minute_slots > 0 else None,
+            TimeRing(self.hour_slots) if self.hour_slots > 0 else None,
+        )
+
+    def add(
+        self, prefix_id: str, tenant: str, model_id: str, timestamp_ms: int, bytes_: int
+    ) -> None:
+        """Count one event in place (not safe against concurrent readers)."""
+        partition = self._partitions.get((tenant, model_id))
+        if partition is None:
+            partition = self._partitions[(tenant, model_id)] = _Partition()
+        keys = partition.shard(prefix_id)
+        rollup = keys.get(prefix_id)
+        if rollup is None:
+            rollup = keys[prefix_id] = self.new_key()
+            self._size += 1
+            partition.size += 1
+            partition.reshard()
+        rollup.add(timestamp_ms, int(bytes_))
+        if timestamp_ms > self.newest_ms:
+            self.newest_ms = timestamp_ms
+
+    def add_columns(self, columns: EventColumns) -> None:
+        rows = zip(
+            columns.prefix_id,
+            columns.tenant,
+            columns.model_id,
+            columns.timestamp_ms,
+            columns.bytes,
+            strict=True,
+        )
+        for prefix_id, tenant, model_id, timestamp_ms, bytes_ in rows:
+            self.add(prefix_id, tenant, model_id, timestamp_ms, bytes_)
+
+    def merge(self, other: RollupIndex) -> None:
+        """Fold ``other`` in and publish the result with one reference swap."""
+        merged = self.merged(other)
+        self.newest_ms = merged.newest_ms
+        self._size = merged._size
+        self._prune_at = merged._prune_at
+        self._partitions = merged._partitions
+
+    def merged(self, other: RollupIndex) -> RollupIndex:
+        """A new index holding this one plus ``other``; this one is left as it was.
+
+        The result shares every shard and key the batch does not touch, so it can be
+        built ahead of time and published later by swapping references.
+        """
+        result = RollupIndex(self.minute_slots, self.hour_slots)
+        result._size, result._prune_at = self._size, self._prune_at
+        partitions = dict(self._partitions)
+        for position, theirs in other._partitions.items():
+            published = partitions.get(position)
+            partition = published.copy() if published is not None else _Partition()
+            owned: set[int] | None = set() if published is not None else None
+            for prefix_id, rollup in theirs.items():
+                keys = partition.shard(prefix_id, owned)
+                existing = keys.get(prefix_id)
+                if existing is None:
+                    combined = self.new_key()
+                    result._size += 1
+                    partition.size += 1
+                else:
+                    combined = existing.copy()
+                combined.merge(rollup)
+                keys[prefix_id] = combined
+            partition.reshard()
+            partitions[position] = partition
+        result.newest_ms = max(self.newest_ms, other.newest_ms)
+        if result._size >= result._prune_at:
+            partitions = result._pruned(partitions)
+            result._prune_at = max(1_024, 2 * result._size)
+        result._partitions = partitions
+        return result
+
+    def rows(self) -> Iterator[RollupRow]:
+        """Yield every key as a ``RollupRow``, for persisting the index."""
+        for (tenant, model_id), partition in self._partitions.items():
+            for prefix_id, rollup in partition.items():
+                yield [
+                    prefix_id,
+                    tenant,
+                    model_id,
+                    *(
+                        None if ring is None else [ring.head, ring.values.tolist()]
+                        for ring in (rollup.minutes, rollup.hours)
+                    ),
+                ]
+
+    def add_row(self, row: RollupRow) -> None:
+        """Restore one key written by ``rows`` in place (like ``add``).
+
+        Raises ``ValueError`` when the row's rings do not match this index's sizes.
+        """
+        prefix_id, tenant, model_id, minutes, hours = row
+        rings: list[TimeRing | None] = []
+        for ring, slots in ((minutes, self.minute_slots), (hours, self.hour_slots)):
+            if (ring is None) != (slots <= 0) or (ring is not None and len(ring[1]) != 2 * slots):
+                raise ValueError(f"Rollup row for {prefix_id!r} does not match the ring sizes")
+            rings.append(None if ring is None else TimeRing.restore(ring[0], ring[1]))
+        partition = self._partitions.setdefault((tenant, model_id), _Partition())
+        keys = partition.shard(prefix_id)
+        restored = KeyRollup(*rings)
+        if prefix_id not in keys:
+            self._size += 1
+            partition.size += 1
+        keys[prefix_id] = restored
+        partition.reshard()
+        self.newest_ms = max(self.newest_ms, restored.newest_ms())
+
+    def resolution(self, window_ms: int, end_ms: int) -> tuple[int, int, int]:
+        """Pick the ring for a window ending at ``end_ms``: ``(width_ms, first, last)``.
+
+        The window covers the ``ceil(window_ms / width)`` buckets ending with the one
+        that contains ``end_ms``. Raises ``ValueError`` when neither ring still holds
+        every bucket of the window.
+        """
+        for width, slots in ((MINUTE_MS, self.minute_slots), (HOUR_MS, self.hour_slots)):
+            if slots <= 0:
+                continue
+            last = end_ms // width
+            first = last - math.ceil(window_ms / width) + 1
+            # No key has dropped a bucket newer than ``slots`` before the newest event.
+            if self.newest_ms < 0 or first > self.newest_ms // width - slots:
+                return width, first, last
+        raise ValueError(
+            f"A {window_ms} ms window ending at {end_ms} reaches past the retained rollups "
+            f"({self.minute_slots} minute and {self.hour_slots} hour buckets)"
+        )
+
+    def window_totals(
+        self,
+        window_ms: int,
+        *,
+        end_ms: int,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[WindowTotal]:
+        """Yield ``(key, bytes, hits)`` over the window for every key with traffic in it."""
+        width, first, last = self.resolution(window_ms, end_ms)
+        for (part_tenant, part_model), partition in self._partitions.items():
+            if (tenant is not None and part_tenant != tenant) or (
+                model_id is not None and part_model != model_id
+            ):
+                continue
+            for prefix_id, rollup in partition.items():
+                ring = rollup.minutes if width == MINUTE_MS else rollup.hours
+                assert ring is not None
+                total_bytes, hits = ring.total(first, last)
+                if hits:
+                    yield (prefix_id, part_tenant, part_model), total_bytes, hits
+
+    def top(
+        self,
+        window_ms: int,
+        *,
+        end_ms: int,
+        limit: int,
+        min_bytes: float = 0.0,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> list[WindowTotal]:
+        """The ``limit`` keys that moved the most bytes in the window, largest first."""
+        totals = self.window_totals(window_ms, end_ms=end_ms, tenant=tenant, model_id=model_id)
+        return heapq.nlargest(
+            limit, (total for total in totals if total[1] >= min_bytes), key=itemgetter(1)
+        )
+
+    def _pruned(
+        self, partitions: dict[tuple[str, str], _Partition]
+    ) -> dict[tuple[str, str], _Partition]:
+        retained_ms = max(self.minute_slots * MINUTE_MS, self.hour_slots * HOUR_MS)
+        cutoff = self.newest_ms - retained_ms
+        kept: dict[tuple[str, str], _Partition] = {}
+        for position, partition in partitions.items():
+            shards = [
+                {prefix_id: r for prefix_id, r in shard.items() if r.newest_ms() > cutoff}
+                for shard in partition.shards
+            ]
+            live = sum(map(len, shards))
+            self._size -= partition.size - live
+            if live == partition.size:
+                kept[position] = partition
+            elif live:
+                kept[position] = _Partition(shards, live)
+        return kept
@@ -2,82 +2,772 @@
 
 from __future__ import annotations
 
+import io
 import json
-from collections.abc import Iterable
+import math
+import threading
+import time
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain, dropwhile, islice
 from pathlib import Path
+from typing import TextIO
 
-from .analytics import aggregate_events, merge_stats
-from .models import PrefixEvent, PrefixIndexConfig, PrefixRecommendation, PrefixStats
-from .storage import PrefixIndexStore, create_store
+from .analytics import (
+    EventAggregator,
+    decay_rank,
+    decayed_score,
+    get_backend,
+    merge_stats,
+    rank_floor,
+)
+from .changes import ChangeLog, top_with_evictions
+from .columns import EventColumns, decode_jsonl
+from .metrics import Metrics
+from .models import (
+    IngestReport,
+    PrefixChanges,
+    PrefixEvent,
+    PrefixIndexConfig,
+    PrefixKey,
+    PrefixRecommendation,
+    PrefixStats,
+)
+from .readers import (
+    LineTooLongError,
+    StreamDecoder,
+    iter_jsonl_chunks,
+    iter_jsonl_columns,
+    iter_parquet_columns,
+    resolve_format,
+)
+from .rollups import RollupIndex
+from .storage import (
+    PrefixIndexStore,
+    create_horizon_store,
+    create_store,
+    read_rollups,
+    rollups_path,
+    write_rollups,
+)
 
 
 class PrefixIndexService:
-    """Coordinates the offline prefix index lifecycle."""
+    """Coordinates the offline prefix index lifecycle.
+
+    Safe to share between threads. Events are aggregated without any lock and only the
+    read-modify-write in ``commit`` is serialized, so concurrent ingests never lose
+    updates. Queries take no lock: stores publish each ``bulk_upsert`` atomically and
+    readers keep the state they started on, so they never wait on a running ingest.
+    """
 
     def __init__(self, config: PrefixIndexConfig, store: PrefixIndexStore | None = None) -> None:
         self.config = config
-        self.store = store or create_store(config)
+        self.store = store if store is not None else create_store(config)
+        self.backend = get_backend(config.analytics_backend)
+        self._commit_lock = threading.Lock()
+        # Start-up time in ms. Generations restart at 0 with the process, so ``changes``
+        # replies carry it and callers resync when it no longer matches.
+        self.epoch = int(time.time() * 1000)
+        self._generation = 0
+        # Generation whose writes may be visible in the stores; runs ahead of the change
+        # log while a commit is being flushed.
+        self._flushing = 0
+        # (generation, wall-clock ms it was published), swapped as one reference.
+        self._version = (0, self.epoch)
+        self._changes = ChangeLog(config.change_log_max_keys)
         self.store.load()
+        self.horizons = _horizons(config)
+        self._horizon_stores = {h: create_horizon_store(config, h) for h in self.horizons}
+        for horizon_store in self._horizon_stores.values():
+            horizon_store.load()
+        # Time-bucketed totals for windowed queries. ``close`` saves them next to a
+        # persistent store; without that sidecar, windows reaching back before start-up
+        # would miss the stored keys' earlier events, so they are refused.
+        self.rollups = _rollups(config)
+        self._rollups_path = rollups_path(config) if self.rollups is not None else None
+        self._rollups_from_ms: int | None = None
+        if self.rollups is not None:
+            restored = None
+            if self._rollups_path is not None:
+                restored = read_rollups(
+                    self._rollups_path, config.rollup_minutes, config.rollup_hours
+                )
+            if restored is not None:
+                self.rollups, self._rollups_from_ms = restored
+            elif len(self.store):
+                self._rollups_from_ms = self.epoch
+        self._bounded = config.max_keys is not None or config.evict_min_score > 0
+        self._size = len(self.store) if self._bounded else 0
+        self._clock_ms = 0
+        self._evict_at = self._sweep_threshold()
+        # log2 of the sum of 2**cut over sweeps, i.e. the error bound as a decay rank.
+        self._evicted_bound = -math.inf
+        self._evicted = 0
+        self.metrics = Metrics(enabled=config.metrics_enabled)
+        self.metrics.gauge("store_keys", "gauge", "Keys in the index.", lambda: len(self.store))
+        self.metrics.gauge(
+            "evicted_keys_total",
+            "counter",
+            "Keys dropped by bounded-memory sweeps.",
+            lambda: self._evicted,
+        )
+        self.metrics.gauge(
+            "store_bytes_written_total",
+            "counter",
+            "Bytes written by the store (0 for stores that do not track it).",
+            lambda: getattr(self.store, "bytes_written", 0),
+        )
+
+    @property
+    def generation(self) -> int:
+        """Monotonic counter bumped by every commit that changed the index."""
+        return self._generation
+
+    @property
+    def version(self) -> tuple[int, int]:
+        """``(generation, as_of_ms)``: the generation and when it was committed.
+
+        ``as_of_ms`` is the start-up time until the first commit. Answers computed at
+        ``as_of_ms`` only change when the generation does.
+        """
+        return self._version
+
+    @property
+    def evicted(self) -> int:
+        """Keys dropped by bounded-memory sweeps since start-up."""
+        return self._evicted
+
+    def ingest_events(self, events: Iterable[PrefixEvent]) -> None:
+        """Aggregate raw events and merge them into the current index.
+
+        ``events`` is consumed lazily, so generators are folded without being buffered.
+        """
+        aggregator = self.new_aggregator()
+        with self.metrics.stage("aggregate"):
+            aggregator.update(events)
+        self.commit(aggregator)
+
+    def ingest_batches(
+        self, batches: Iterable[Iterable[PrefixEvent] | EventColumns]
+    ) -> IngestReport:
+        """Fold event lists and decoded column batches into one aggregator, commit once.
+
+        Column batches (e.g. decoded MessagePack or Arrow bodies) go through the
+        analytics backend without building a ``PrefixEvent`` per row.
+        """
+        aggregator = self.new_aggregator()
+        with self.metrics.stage("aggregate"):
+            for batch in batches:
+                if isinstance(batch, EventColumns):
+                    aggregator.update_columns(batch)
+                else:
+                    aggregator.update(batch)
+        self.commit(aggregator)
+        return _report(aggregator)
 
-    def ingest_events(self, events: Iterable[PrefixEvent], *, now_ms: int | None = None) -> None:
-        """Aggregate raw events and merge them into the current index."""
-        updates = aggregate_events(
-            events, now_ms=now_ms, half_life_ms=self.config.decay_half_life_ms
+    def ingest_jsonl(self, path: Path) -> IngestReport:
+        """Stream a (optionally gzip/zstd-compressed) JSONL trace file and ingest it.
+
+        Lines are decoded in chunks of ``ingest_chunk_size`` and folded into running
+        aggregates, so peak memory follows the number of distinct keys, not events.
+        With the default columnar decoder, invalid rows are counted in the report
+        instead of aborting the file.
+        """
+        aggregator = aggregate_trace(path, self.config, file_format="jsonl", metrics=self.metrics)
+        self.commit(aggregator)
+        return _report(aggregator)
+
+    def ingest_parquet(
+        self, path: Path, *, since_ms: int | None = None, until_ms: int | None = None
+    ) -> IngestReport:
+        """Ingest a Parquet file or directory, optionally limited to ``[since_ms, until_ms)``.
+
+        Only the columns aggregation needs are read and record batches stream through the
+        aggregator, so memory stays bounded regardless of file size.
+        """
+        aggregator = aggregate_trace(
+            path,
+            self.config,
+            file_format="parquet",
+            since_ms=since_ms,
+            until_ms=until_ms,
+            metrics=self.metrics,
+        )
+        self.commit(aggregator)
+        return _report(aggregator)
+
+    def ingest_paths(
+        self,
+        paths: Sequence[Path],
+        *,
+        workers: int = 1,
+        file_format: str = "auto",
+        since_ms: int | None = None,
+        until_ms: int | None = None,
+    ) -> IngestReport:
+        """Aggregate many trace shards (in parallel when ``workers > 1``) and merge once.
+
+        Each shard is folded into its own aggregator, in a worker process when a pool is
+        used, and the partials are combined by a pairwise tree reduction in the parent.
+        Partial scores are anchored at their own ``last_seen_ms`` and re-anchored on
+        merge, so decay is never applied twice. The reduction shape does not depend on
+        ``workers``, so parallel and serial ingest produce identical stats.
+        """
+        shard = partial(
+            aggregate_trace,
+            config=self.config,
+            file_format=file_format,
+            since_ms=since_ms,
+            until_ms=until_ms,
         )
-        existing = self.store.list_stats()
-        merged = merge_stats(
-            existing,
-            updates.values(),
+        if workers > 1 and len(paths) > 1:
+            # Workers cannot report into this process, so parsing is charged to aggregate.
+            with (
+                self.metrics.stage("aggregate"),
+                ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool,
+            ):
+                partials = list(pool.map(shard, paths))
+        else:
+            partials = [shard(path, metrics=self.metrics) for path in paths]
+        with self.metrics.stage("aggregate"):
+            aggregator = _tree_reduce(partials) if partials else self.new_aggregator()
+        self.commit(aggregator)
+        return _report(aggregator)
+
+    def open_stream(self, *, content_encoding: str | None = None) -> StreamIngest:
+        """Start an incremental NDJSON ingest; see ``StreamIngest``."""
+        return StreamIngest(self, content_encoding=content_encoding)
+
+    def new_aggregator(self) -> EventAggregator:
+        """Return an empty aggregator configured for this index."""
+        return EventAggregator(
             half_life_ms=self.config.decay_half_life_ms,
+            backend=self.backend,
+            horizons=self.horizons,
+            rollups=_rollups(self.config),
         )
-        self.store.bulk_upsert(merged.values())
 
-    def ingest_jsonl(self, path: Path, *, now_ms: int | None = None) -> None:
-        """Read JSONL trace file and ingest."""
-        with path.open("r", encoding="utf-8") as fh:
-            events = [PrefixEvent.model_validate_json(line) for line in fh if line.strip()]
-        self.ingest_events(events, now_ms=now_ms)
+    def commit(self, aggregator: EventAggregator) -> None:
+        """Merge folded aggregates into the store.
+
+        Only keys present in the aggregator are read back and rewritten, so the cost
+        scales with the batch rather than with the size of the index. Each extra horizon
+        store is merged with that horizon's scores, and the aggregator's rollups with
+        ``rollups``. Commits are serialized; readers are not blocked by them.
+        """
+        metrics = self.metrics
+        metrics.inc("events_parsed", aggregator.events)
+        metrics.inc("events_rejected", aggregator.rejected)
+        if not len(aggregator):
+            return
+        keys = aggregator.keys()
+        updates = aggregator.stats().values()
+        horizon_updates = {h: aggregator.stats(h).values() for h in self.horizons}
+        with self._commit_lock:
+            with metrics.stage("merge"):
+                existing = self.store.get_many(keys)
+                merged = merge_stats(
+                    existing.values(), updates, half_life_ms=self.config.decay_half_life_ms
+                )
+                horizon_merged = [
+                    (
+                        store,
+                        merge_stats(
+                            store.get_many(keys).values(), horizon_updates[h], half_life_ms=h
+                        ),
+                    )
+                    for h, store in self._horizon_stores.items()
+                ]
+                # Built now, published with the generation once the flush succeeded.
+                rollups = self.rollups
+                if rollups is not None and aggregator.rollups is not None:
+                    rollups = rollups.merged(aggregator.rollups)
+            self._flushing = self._generation + 1
+            if self._rollups_path is not None and self._rollups_path.exists():
+                # The sidecar only matches the store until the next commit lands.
+                self._rollups_path.unlink()
+            try:
+                with metrics.stage("flush"):
+                    self.store.bulk_upsert(merged.values())
+                    for store, stats in horizon_merged:
+                        store.bulk_upsert(stats.values())
+                metrics.inc("commits")
+                metrics.inc("keys_touched", len(merged))
+                # Evicted keys are logged with their last stats so ``changes`` can report
+                # them; keys of this batch keep their pre-commit stats.
+                previous: dict[PrefixKey, PrefixStats | None] = {}
+                if self._bounded:
+                    self._size += sum(1 for key in merged if key not in existing)
+                    self._clock_ms = max(
+                        self._clock_ms, max(stat.last_seen_ms for stat in merged.values())
+                    )
+                    if self._size > self._evict_at:
+                        with metrics.stage("evict"):
+                            previous.update(self._sweep())
+                previous.update((key, existing.get(key)) for key in merged)
+                self.rollups = rollups
+                self._generation += 1
+                self._version = (self._generation, int(time.time() * 1000))
+                # Publishing the log view last marks the stores as settled for ``changes``.
+                self._changes.record(self._generation, previous)
+            finally:
+                # A failed flush leaves the stores as they are; stop readers waiting on it.
+                self._flushing = self._generation
+
+    def close(self) -> None:
+        """Save state that lives only in memory; call once ingest has stopped.
+
+        Writes the rollups next to a persistent store, so the next start-up serves
+        windows over the traffic seen so far. Any later commit deletes the file again,
+        since it would no longer match the store.
+        """
+        with self._commit_lock:
+            if self.rollups is not None and self._rollups_path is not None:
+                write_rollups(
+                    self._rollups_path, self.rollups, complete_from_ms=self._rollups_from_ms
+                )
+
+    def eviction_error(self, now_ms: int | None = None) -> float:
+        """Upper bound on how much eviction can understate a key's score at ``now_ms``.
+
+        A key loses at most its score when it is evicted, which is below that sweep's
+        rank cut, so the sum of every sweep's cut decayed to ``now_ms`` bounds the loss.
+        Ranked results are therefore exact up to this margin: a key missing from a top-k
+        scores at most the k-th score plus the bound. Zero until something is evicted.
+        The bound covers the primary ``decay_half_life_ms`` ranking only.
+        """
+        if self._evicted_bound == -math.inf:
+            return 0.0
+        current_time = now_ms if now_ms is not None else int(time.time() * 1000)
+        exponent = self._evicted_bound - current_time / float(self.config.decay_half_life_ms)
+        return math.inf if exponent >= 1024 else 2.0**exponent
 
     def recommendations(
         self,
         *,
         top_k: int | None = None,
         min_score: float | None = None,
+        tenant: str | None = None,
+        model_id: str | None = None,
+        now_ms: int | None = None,
+        horizon: int | None = None,
+        window_ms: int | None = None,
+    ) -> list[PrefixRecommendation]:
+        """Return ranked prefix recommendations with scores decayed to ``now_ms``.
+
+        The store keeps keys ordered by rank within each ``(tenant, model_id)`` partition,
+        so this walks at most ``top_k`` entries past the ``min_score`` cut of the selected
+        partitions instead of sorting the whole index. ``horizon`` selects the half-life
+        to rank and score by: ``decay_half_life_ms`` (the default) or one of
+        ``decay_horizons_ms``; any other value raises ``ValueError``.
+
+        ``window_ms`` instead ranks keys by the bytes they moved in the last ``window_ms``
+        up to ``now_ms``, summed from the rollup buckets (``rollup_minutes`` and
+        ``rollup_hours``); ``min_score`` then applies to those bytes. It raises
+        ``ValueError`` when rollups are off, no longer retain the whole window, or the
+        window reaches back before a start-up that found stored keys but no saved rollups.
+        """
+        if window_ms is not None:
+            if horizon is not None:
+                raise ValueError("A window query cannot also select a horizon")
+            with self.metrics.stage("suggest"):
+                return self._window_recommendations(
+                    window_ms, top_k, min_score, tenant, model_id, now_ms
+                )
+        store, half_life_ms = self._horizon(horizon)
+        with self.metrics.stage("suggest"):
+            return self._recommendations(
+                store, half_life_ms, top_k, min_score, tenant, model_id, now_ms
+            )
+
+    def _recommendations(
+        self,
+        store: PrefixIndexStore,
+        half_life_ms: int,
+        top_k: int | None,
+        min_score: float | None,
+        tenant: str | None,
+        model_id: str | None,
+        now_ms: int | None,
     ) -> list[PrefixRecommendation]:
-        """Return ranked prefix recommendations."""
         limit = top_k if top_k is not None else self.config.max_recommendations
         score_floor = min_score if min_score is not None else self.config.min_score
-        stats = sorted(
-            self.store.list_stats(),
-            key=lambda s: (s.score, s.hit_count, s.last_seen_ms),
-            reverse=True,
-        )
+        current_time = now_ms if now_ms is not None else int(time.time() * 1000)
+        min_rank = rank_floor(score_floor, current_time, half_life_ms)
         recs: list[PrefixRecommendation] = []
-        for stat in stats:
-            if stat.score < score_floor:
+        ranked = store.iter_ranked(min_rank=min_rank, tenant=tenant, model_id=model_id)
+        for stat in ranked:
+            score = decayed_score(stat, current_time, half_life_ms)
+            if score < score_floor:
+                # Keys stamped after now_ms are not decayed, so the rank cut overshoots.
                 continue
-            hint = (
-                f"score={stat.score:.1f} hits={stat.hit_count} "
-                f"bytes={stat.total_bytes} last_seen={stat.last_seen_ms}"
-            )
-            recs.append(
-                PrefixRecommendation(
-                    prefix_id=stat.prefix_id,
-                    tenant=stat.tenant,
-                    model_id=stat.model_id,
-                    score=stat.score,
-                    hint=hint,
-                )
-            )
+            recs.append(_recommendation(stat, score))
             if len(recs) >= limit:
                 break
         return recs
 
+    def _window_recommendations(
+        self,
+        window_ms: int,
+        top_k: int | None,
+        min_score: float | None,
+        tenant: str | None,
+        model_id: str | None,
+        now_ms: int | None,
+    ) -> list[PrefixRecommendation]:
+        if self.rollups is None:
+            raise ValueError("Window queries need rollup_minutes or rollup_hours")
+        if window_ms <= 0:
+            raise ValueError("The window must be positive")
+        end_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        if self._rollups_from_ms is not None and end_ms - window_ms < self._rollups_from_ms:
+            raise ValueError(
+                f"A {window_ms} ms window ending at {end_ms} reaches back before "
+                f"{self._rollups_from_ms}, when the service started on a store whose rollups "
+                "were not saved; earlier traffic is missing from them"
+            )
+        top = self.rollups.top(
+            window_ms,
+            end_ms=end_ms,
+            limit=top_k if top_k is not None else self.config.max_recommendations,
+            min_bytes=min_score if min_score is not None else self.config.min_score,
+            tenant=tenant,
+            model_id=model_id,
+        )
+        return [
+            PrefixRecommendation(
+                prefix_id=prefix_id,
+                tenant=key_tenant,
+                model_id=key_model,
+                score=float(total_bytes),
+                hint=f"window={window_ms}ms bytes={total_bytes} hits={hits}",
+            )
+            for (prefix_id, key_tenant, key_model), total_bytes, hits in top
+        ]
+
+    def window_bucket(self, window_ms: int, end_ms: int) -> tuple[int, int] | None:
+        """``(width_ms, bucket)`` of the last rollup bucket a window ending at ``end_ms`` sums.
+
+        Window totals only change when this (or the index generation) does. ``None`` when
+        the window cannot be served from the rollups.
+        """
+        if self.rollups is None:
+            return None
+        try:
+            width, _, last = self.rollups.resolution(window_ms, end_ms)
+        except ValueError:
+            return None
+        return width, last
+
+    def changes(
+        self,
+        since: int,
+        *,
+        epoch: int | None = None,
+        top_k: int | None = None,
+        tenant: str | None = None,
+        model_id: str | None = None,
+        now_ms: int | None = None,
+    ) -> PrefixChanges:
+        """Return how the top ``top_k`` changed after generation ``since``.
+
+        ``changed`` lists current top-k keys whose stats changed (scores decayed to
+        ``now_ms``) and ``evicted`` the keys that dropped out of the top-k. Ranks are
+        time-invariant, so only committed keys can reorder the top-k and the cost follows
+        the churn since ``since`` plus ``top_k``, not the index size. When the bounded
+        change log no longer reaches ``since``, or ``epoch`` names another process
+        lifetime than this one, the reply is a ``reset`` carrying the full top-k.
+
+        Takes no lock: the change log view and the ranking are read back to back, and if
+        a commit started flushing in between (so the ranking may be ahead of the log)
+        the read waits for that commit to land and starts over.
+        """
+        limit = top_k if top_k is not None else self.config.max_recommendations
+        current_time = now_ms if now_ms is not None else int(time.time() * 1000)
+        half_life_ms = self.config.decay_half_life_ms
+        while True:
+            log = self._changes.view
+            ranked = self.store.iter_ranked(tenant=tenant, model_id=model_id)
+            # Pulling the top pins the state the ranked iteration reads from.
+            top = list(islice(ranked, limit))
+            if self._flushing == log.generation:
+                break
+            with self._commit_lock:
+                pass
+        generation = log.generation
+        evicted: list[PrefixKey] = []
+        previous = log.since(since) if epoch in (None, self.epoch) else None
+        if previous is not None:
+            top, evicted = top_with_evictions(
+                chain(top, ranked),
+                previous,
+                limit=limit,
+                half_life_ms=half_life_ms,
+                tenant=tenant,
+                model_id=model_id,
+            )
+        changed = [
+            _recommendation(stat, decayed_score(stat, current_time, half_life_ms))
+            for stat in top
+            if previous is None or stat.key in previous
+        ]
+        return PrefixChanges(
+            generation=generation,
+            epoch=self.epoch,
+            reset=previous is None,
+            changed=changed,
+            evicted=evicted,
+        )
+
+    def _horizon(self, horizon: int | None) -> tuple[PrefixIndexStore, int]:
+        if horizon is None or horizon == self.config.decay_half_life_ms:
+            return self.store, self.config.decay_half_life_ms
+        store = self._horizon_stores.get(horizon)
+        if store is None:
+            configured = ", ".join(str(h) for h in (self.config.decay_half_life_ms, *self.horizons))
+            raise ValueError(f"Unknown horizon {horizon} ms; configured: {configured}")
+        return store, horizon
+
+    def _sweep(self) -> dict[PrefixKey, PrefixStats]:
+        """Evict cold keys down to ``max_keys``; runs under the commit lock.
+
+        Ranks never decrease and order keys by decayed score at any time, so the coldest
+        keys are always the tail of the rank order and one rank cut removes them. Each
+        horizon store keeps its own top ``max_keys`` by its own ranking. Returns the keys
+        evicted from the primary store with their last stats, for the change log.
+        """
+        half_life_ms = self.config.decay_half_life_ms
+        cut = self._evict_cut(self.store, half_life_ms, self._size)
+        cold: dict[PrefixKey, PrefixStats] = {}
+        if cut > -math.inf:
+            tail = dropwhile(
+                lambda stat: decay_rank(stat, half_life_ms) >= cut, self.store.iter_ranked()
+            )
+            cold = {stat.key: stat for stat in tail}
+        evicted = self.store.evict(min_rank=cut) if cold else 0
+        if evicted:
+            self._size -= evicted
+            self._evicted += evicted
+            # Accumulate 2**cut in log space: ranks are far too large to exponentiate.
+            high, low = max(self._evicted_bound, cut), min(self._evicted_bound, cut)
+            self._evicted_bound = (
+                high if low == -math.inf else high + math.log2(1.0 + 2.0 ** (low - high))
+            )
+        for half_life_ms, store in self._horizon_stores.items():
+            horizon_cut = self._evict_cut(store, half_life_ms, len(store))
+            if horizon_cut > -math.inf:
+                store.evict(min_rank=horizon_cut)
+        self._evict_at = self._sweep_threshold()
+        return cold
+
+    def _evict_cut(self, store: PrefixIndexStore, half_life_ms: int, size: int) -> float:
+        cut = rank_floor(self.config.evict_min_score, self._clock_ms, half_life_ms)
+        capacity = self.config.max_keys
+        if capacity is not None and size > capacity:
+            last_kept = next(islice(store.iter_ranked(), capacity - 1, None), None)
+            if last_kept is not None:
+                cut = max(cut, decay_rank(last_kept, half_life_ms))
+        return cut
+
+    def _sweep_threshold(self) -> int:
+        base = self.config.max_keys if self.config.max_keys is not None else self._size
+        return int(base * (1.0 + self.config.evict_slack))
+
     def export_snapshot(self) -> list[PrefixStats]:
         """Return all stats, useful for tests or diagnostics."""
         return self.store.list_stats()
 
+    def iter_snapshot(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        """Stream stats in ``(tenant, model_id, prefix_id)`` order, strictly after ``after``.
+
+        Pass the key of the last stat received as ``after`` to resume a scan; no other
+        state is kept between calls.
+        """
+        return self.store.iter_stats(after=after)
+
+    def write_snapshot(self, out: TextIO, *, lines: bool = False, indent: int | None = None) -> int:
+        """Write every stat to ``out`` one record at a time; returns the record count.
+
+        ``lines=True`` writes NDJSON, otherwise a JSON array (indented when ``indent`` is
+        set). Only one record is held in memory at a time.
+        """
+        count = 0
+        if lines:
+            for stat in self.iter_snapshot():
+                out.write(stat.model_dump_json())
+                out.write("\n")
+                count += 1
+            return count
+        pad = "\n" + " " * (indent or 0)
+        out.write("[")
+        for count, stat in enumerate(self.iter_snapshot(), start=1):
+            if count > 1:
+                out.write(",")
+            record = json.dumps(stat.model_dump(), indent=indent)
+            out.write(record if indent is None else pad + record.replace("\n", pad))
+        out.write("\n]" if count and indent is not None else "]")
+        return count
+
     def dump_json(self) -> str:
         """Serialize the current index to JSON for callers that need a blob."""
-        payload = [stat.model_dump() for stat in self.store.list_stats()]
-        return json.dumps(payload, indent=2)
+        buffer = io.StringIO()
+        self.write_snapshot(buffer, indent=2)
+        return buffer.getvalue()
+
+
+class StreamIngest:
+    """Fold an NDJSON byte stream into one aggregator as it arrives, then commit once.
+
+    ``feed`` accepts arbitrary byte chunks (optionally gzip/zstd-encoded as a whole).
+    Compressed input is inflated in bounded pieces and complete lines are decoded
+    ``ingest_chunk_size`` at a time with the columnar decoder, so memory follows the
+    chunk size, ``ingest_max_line_bytes`` and the number of distinct keys rather than
+    the body size or its compression ratio. Invalid lines are counted, not raised; a
+    line longer than ``ingest_max_line_bytes`` raises ``LineTooLongError``.
+    """
+
+    def __init__(self, service: PrefixIndexService, *, content_encoding: str | None = None):
+        self._service = service
+        self._decoder = StreamDecoder(content_encoding)
+        self._aggregator = service.new_aggregator()
+        # Pieces of the unterminated last line, kept apart to avoid re-copying them.
+        self._tail: list[bytes] = []
+        self._tail_bytes = 0
+        self._lines: list[bytes] = []
+
+    def feed(self, data: bytes) -> None:
+        """Decode ``data`` and aggregate every line it completes."""
+        chunk_size = self._service.config.ingest_chunk_size
+        for piece in self._decoder.decode(data):
+            self._split(piece)
+            if len(self._lines) >= chunk_size:
+                self._flush_lines()
+
+    def finish(self) -> IngestReport:
+        """Aggregate the final line, commit the batch, and report the counts."""
+        self._decoder.close()
+        last = b"".join(self._tail)
+        if last.strip():
+            self._lines.append(last)
+        self._tail, self._tail_bytes = [], 0
+        self._flush_lines()
+        self._service.commit(self._aggregator)
+        return _report(self._aggregator)
+
+    def _split(self, piece: bytes) -> None:
+        max_line = self._service.config.ingest_max_line_bytes
+        end = piece.rfind(b"\n")
+        if end < 0:
+            self._tail.append(piece)
+            self._tail_bytes += len(piece)
+        else:
+            head = b"".join((*self._tail, piece[:end])) if self._tail else piece[:end]
+            lines = head.split(b"\n")
+            if len(head) > max_line and max(map(len, lines)) > max_line:
+                raise LineTooLongError(f"NDJSON line longer than {max_line} bytes")
+            self._lines.extend(line for line in lines if line.strip())
+            rest = piece[end + 1 :]
+            self._tail = [rest] if rest else []
+            self._tail_bytes = len(rest)
+        if self._tail_bytes > max_line:
+            raise LineTooLongError(f"NDJSON line longer than {max_line} bytes")
+
+    def _flush_lines(self) -> None:
+        chunk_size = self._service.config.ingest_chunk_size
+        metrics = self._service.metrics
+        for start in range(0, len(self._lines), chunk_size):
+            with metrics.stage("parse"):
+                columns = decode_jsonl(self._lines[start : start + chunk_size])
+            with metrics.stage("aggregate"):
+                self._aggregator.update_columns(columns)
+        self._lines = []
+
+
+def aggregate_trace(
+    path: Path,
+    config: PrefixIndexConfig,
+    *,
+    file_format: str = "auto",
+    since_ms: int | None = None,
+    until_ms: int | None = None,
+    metrics: Metrics | None = None,
+) -> EventAggregator:
+    """Fold one trace file into a fresh aggregator without touching any store.
+
+    Module-level (and therefore picklable) so it can run in a worker process. With
+    ``metrics``, decoding is timed as the parse stage and folding as aggregate.
+    """
+    timings = metrics if metrics is not None else _NO_METRICS
+    aggregator = EventAggregator(
+        half_life_ms=config.decay_half_life_ms,
+        backend=get_backend(config.analytics_backend),
+        horizons=_horizons(config),
+        rollups=_rollups(config),
+    )
+    chunk_size = config.ingest_chunk_size
+    if resolve_format(path, file_format) == "parquet":
+        parquet = iter_parquet_columns(
+            path, chunk_size=chunk_size, since_ms=since_ms, until_ms=until_ms
+        )
+        for columns in timings.timed_iter("parse", parquet):
+            with timings.stage("aggregate"):
+                aggregator.update_columns(columns)
+        return aggregator
+    if since_ms is not None or until_ms is not None:
+        raise ValueError("Time-window filters are only supported for Parquet input")
+    if config.ingest_decoder == "columnar":
+        for columns in timings.timed_iter("parse", iter_jsonl_columns(path, chunk_size=chunk_size)):
+            with timings.stage("aggregate"):
+                aggregator.update_columns(columns)
+    else:
+        for chunk in timings.timed_iter("parse", iter_jsonl_chunks(path, chunk_size=chunk_size)):
+            with timings.stage("aggregate"):
+                aggregator.update(chunk)
+    return aggregator
+
+
+_NO_METRICS = Metrics()
+
+
+def _horizons(config: PrefixIndexConfig) -> tuple[int, ...]:
+    primary = config.decay_half_life_ms
+    return tuple(h for h in dict.fromkeys(config.decay_horizons_ms) if h != primary)
+
+
+def _rollups(config: PrefixIndexConfig) -> RollupIndex | None:
+    if not config.rollup_minutes and not config.rollup_hours:
+        return None
+    return RollupIndex(config.rollup_minutes, config.rollup_hours)
+
+
+def _tree_reduce(partials: list[EventAggregator]) -> EventAggregator:
+    while len(partials) > 1:
+        paired: list[EventAggregator] = []
+        for left, right in zip(partials[::2], partials[1::2], strict=False):
+            left.merge(right)
+            paired.append(left)
+        if len(partials) % 2:
+            paired.append(partials[-1])
+        partials = paired
+    return partials[0]
+
+
+def _recommendation(stat: PrefixStats, score: float) -> PrefixRecommendation:
+    return PrefixRecommendation(
+        prefix_id=stat.prefix_id,
+        tenant=stat.tenant,
+        model_id=stat.model_id,
+        score=score,
+        hint=(
+            f"score={score:.1f} hits={stat.hit_count} "
+            f"bytes={stat.total_bytes} last_seen={stat.last_seen_ms}"
+        ),
+    )
+
+
+def _report(aggregator: EventAggregator) -> IngestReport:
+    return IngestReport(
+        accepted=aggregator.events, rejected=aggregator.rejected, keys=len(aggregator)
+    )
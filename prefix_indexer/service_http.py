@@ -1,19 +1,145 @@
 from __future__ import annotations
 
 import argparse
-from collections.abc import Iterable
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Hashable, Iterable, Iterator
+from contextlib import asynccontextmanager
+from hashlib import blake2b
+from itertools import islice
 from typing import Annotated
 
 import uvicorn
-from fastapi import FastAPI, Query, status
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
 
+from . import wire
 from .api import build_api
-from .models import PrefixEvent, PrefixIndexConfig, PrefixRecommendation
+from .columns import EventColumns
+from .ingest_queue import IngestQueue, IngestQueueStats
+from .models import (
+    IngestReport,
+    PrefixChanges,
+    PrefixEvent,
+    PrefixIndexConfig,
+    PrefixKey,
+    PrefixRecommendation,
+    PrefixStats,
+)
+from .readers import LineTooLongError
 
 EventsPayload = Annotated[list[PrefixEvent], Field(min_length=1)]
 
+NDJSON_MEDIA_TYPES = frozenset(
+    {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"}
+)
+
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_RECOMMENDATIONS = TypeAdapter(list[PrefixRecommendation])
+
+# Records serialized per chunk of a streamed NDJSON snapshot.
+_STREAM_BATCH = 512
+
+# Milliseconds per unit suffix accepted by ``/suggest?window=``.
+_WINDOW_UNITS = {"ms": 1, "s": 1_000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+
+# (etag, body, extra headers)
+CachedResponse = tuple[str, bytes, dict[str, str]]
+
+
+class ResponseCache:
+    """Bounded LRU of serialized responses and their ETags.
+
+    Entries hold the ETag of the index version they were built for; a lookup whose tag
+    differs rebuilds and replaces the entry, so nothing needs invalidating on commit.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, CachedResponse] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _encode_cursor(key: PrefixKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> PrefixKey:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed snapshot cursor"
+        ) from exc
+    if not (isinstance(raw, list) and len(raw) == 3 and all(isinstance(p, str) for p in raw)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed snapshot cursor"
+        )
+    return (raw[0], raw[1], raw[2])
+
+
+def _parse_window(window: str) -> int:
+    """Milliseconds in ``window``: a plain ms count or a duration such as ``15m`` or ``6h``."""
+    number, unit = window.rstrip("smhd"), window[len(window.rstrip("smhd")) :]
+    scale = _WINDOW_UNITS.get(unit or "ms")
+    if scale is None or not number.isdigit() or int(number) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Malformed window {window!r}; use milliseconds or e.g. 30s, 15m, 6h, 1d",
+        )
+    return int(number) * scale
+
+
+def _snapshot_record(stat: PrefixStats) -> PrefixRecommendation:
+    return PrefixRecommendation(
+        prefix_id=stat.prefix_id,
+        tenant=stat.tenant,
+        model_id=stat.model_id,
+        score=stat.score,
+        hint=f"hits={stat.hit_count} bytes={stat.total_bytes} last_seen={stat.last_seen_ms}",
+    )
+
+
+def _depth(queue: IngestQueue) -> Callable[[], float]:
+    return lambda: queue.depth
+
+
+def _wants_ndjson(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(
+        part.split(";")[0].strip().lower() in NDJSON_MEDIA_TYPES for part in accept.split(",")
+    )
+
 
 class IngestRequest(BaseModel):
     """Payload for ingesting prefix events."""
@@ -30,11 +156,84 @@ class IngestResponse(BaseModel):
 def create_app(
     config: PrefixIndexConfig | None = None, *, cors_origins: Iterable[str] | None = None
 ) -> FastAPI:
-    """Construct a FastAPI app backed by PrefixIndexAPI."""
+    """Construct a FastAPI app backed by PrefixIndexAPI.
+
+    Handlers share one API from FastAPI's thread pool. Ingests are serialized inside the
+    service; queries read the last published state without locking.
+
+    With ``ingest_queue_max_events > 0``, ``/ingest`` only queues the events and returns;
+    a background worker commits them in micro-batches, and a full queue answers 429 with
+    ``Retry-After``. ``/ingest/queue`` reports queue depth and batch timings.
+
+    With ``metrics_enabled``, ``/metrics`` serves stage latency histograms and ingest
+    counters in the Prometheus text format.
+    """
 
     api = build_api(config)
-    app = FastAPI(title="Offline Prefix Index", version="0.1.0")
+    settings = config or PrefixIndexConfig()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        queue: IngestQueue | None = None
+        if settings.ingest_queue_max_events:
+            queue = IngestQueue(
+                app.state.api.ingest_batches,
+                max_events=settings.ingest_queue_max_events,
+                batch_events=settings.ingest_batch_max_events,
+                batch_delay_ms=settings.ingest_batch_max_delay_ms,
+            )
+            queue.start()
+            app.state.api.metrics.gauge(
+                "ingest_queue_depth", "gauge", "Events waiting in the ingest queue.", _depth(queue)
+            )
+        app.state.ingest_queue = queue
+        try:
+            yield
+        finally:
+            if queue is not None:
+                await queue.stop()
+            app.state.ingest_queue = None
+            app.state.api.close()
+
+    app = FastAPI(title="Offline Prefix Index", version="0.1.0", lifespan=lifespan)
     app.state.api = api
+    app.state.ingest_queue = None
+    cache = ResponseCache(settings.response_cache_entries)
+    app.state.response_cache = cache
+
+    def cached_response(
+        request: Request,
+        key: Hashable,
+        version: tuple[int, int],
+        build: Callable[[], tuple[bytes, dict[str, str]]],
+        *,
+        media_type: str = wire.JSON,
+    ) -> Response:
+        """Serve ``build()`` from the cache, answering 304 when ``If-None-Match`` hits.
+
+        ``build`` returns the body plus any headers that belong with it (such as a page
+        cursor); both are cached together. ``key`` holds every request parameter,
+        including ``media_type``, and the body must depend on nothing but ``key`` and the
+        index ``version``. The ETag is derived from those two alone, so a client
+        revalidating an unchanged index gets a 304 whether or not its entry is cached.
+        """
+        if not settings.response_cache_entries:
+            body, extra = build()
+            return Response(content=body, media_type=media_type, headers=extra)
+        etag = f'"{version[0]}-{blake2b(repr((version, key)).encode(), digest_size=8).hexdigest()}"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        entry = cache.get(key)
+        if entry is None or entry[0] != etag:
+            body, extra = build()
+            entry = (etag, body, extra)
+            # An ingest that landed while building must not be cached under the old tag.
+            if app.state.api.version == version:
+                cache.put(key, entry)
+        _, body, extra = entry
+        headers = {**extra, "ETag": etag, "Cache-Control": "no-cache"}
+        return Response(content=body, media_type=media_type, headers=headers)
 
     if cors_origins:
         app.add_middleware(
@@ -50,30 +249,223 @@ def create_app(
         return {"status": "ok"}
 
     @app.post("/ingest", response_model=IngestResponse, status_code=status.HTTP_202_ACCEPTED)
-    def ingest(payload: IngestRequest) -> IngestResponse:
-        app.state.api.ingest_events(payload.events)
-        return IngestResponse(ingested=len(payload.events))
+    async def ingest(request: Request) -> IngestResponse:
+        """Ingest a JSON ``IngestRequest`` or a MessagePack / Arrow IPC body.
+
+        Binary bodies are decoded straight into columns; their invalid rows are dropped
+        and only the accepted events are counted in ``ingested``.
+        """
+        content_type = wire.media_type(request.headers.get("content-type"))
+        body = await request.body()
+        batch: list[PrefixEvent] | EventColumns
+        if content_type in wire.BINARY_MEDIA_TYPES:
+            try:
+                batch = await run_in_threadpool(wire.decode_events, body, content_type)
+            except RuntimeError as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(exc)
+                ) from exc
+            except ValueError as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)
+                ) from exc
+        else:
+            try:
+                batch = IngestRequest.model_validate_json(body).events
+            except ValidationError as exc:
+                raise RequestValidationError(exc.errors(include_url=False)) from exc
+        queue: IngestQueue | None = app.state.ingest_queue
+        if queue is None:
+            await run_in_threadpool(app.state.api.ingest_batches, [batch])
+        elif not queue.offer(batch):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Ingest queue is full",
+                headers={"Retry-After": str(queue.retry_after_s)},
+            )
+        return IngestResponse(ingested=len(batch))
+
+    @app.post("/ingest/stream", response_model=IngestReport, status_code=status.HTTP_202_ACCEPTED)
+    async def ingest_stream(request: Request) -> IngestReport:
+        """Aggregate an NDJSON body line by line while it streams in.
+
+        The body may be gzip- or zstd-encoded (``Content-Encoding``). Invalid lines are
+        skipped and counted; the batch is committed once the body ends. A line longer
+        than ``ingest_max_line_bytes`` answers 413 and nothing is committed.
+        """
+        media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if media_type not in NDJSON_MEDIA_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="Expected an application/x-ndjson body",
+            )
+        try:
+            stream = app.state.api.open_stream(
+                content_encoding=request.headers.get("content-encoding")
+            )
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(exc)
+            ) from exc
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    await run_in_threadpool(stream.feed, chunk)
+            report: IngestReport = await run_in_threadpool(stream.finish)
+        except LineTooLongError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(exc)
+            ) from exc
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+        return report
+
+    @app.get("/ingest/queue", response_model=IngestQueueStats)
+    def ingest_queue() -> IngestQueueStats:
+        queue: IngestQueue | None = app.state.ingest_queue
+        if queue is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Ingest queue is disabled"
+            )
+        return queue.stats()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics() -> PlainTextResponse:
+        if not app.state.api.metrics.enabled:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled"
+            )
+        return PlainTextResponse(app.state.api.metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
 
     @app.get("/suggest", response_model=list[PrefixRecommendation])
     def suggest(
+        request: Request,
         top_k: int | None = Query(default=None, ge=1, le=10_000),
         min_score: float | None = Query(default=None, ge=0.0),
-    ) -> list[PrefixRecommendation]:
-        return app.state.api.recommendations(top_k=top_k, min_score=min_score)
+        tenant: str | None = Query(default=None, min_length=1),
+        model_id: str | None = Query(default=None, min_length=1),
+        horizon: int | None = Query(default=None, ge=1, description="Half-life in ms."),
+        window: str | None = Query(default=None, min_length=1, description="e.g. 15m or 1h."),
+    ) -> Response:
+        """Ranked recommendations as of the latest commit, cached per parameters.
+
+        Scores are decayed to the time the current generation was committed (sent as
+        ``X-Scores-As-Of``), so every poll of an unchanged index gets the same body and
+        ETag. Windows end at request time instead; their body and ETag also change when
+        the window moves into a new rollup bucket. Ranks do not depend on time, so the order is the one
+        a later reference time would give. ``Accept`` may ask for
+        MessagePack or an Arrow IPC stream instead of JSON. ``horizon`` picks one of the
+        configured half-lives; unknown horizons answer 400. ``window`` ranks by bytes moved
+        in that trailing window instead (milliseconds or ``30s``/``15m``/``6h``/``1d``);
+        it answers 400 unless the server keeps rollups that cover it.
+        """
+        api = app.state.api
+        window_ms = _parse_window(window) if window is not None else None
+        media_type = wire.negotiate(request.headers.get("accept"))
+        version = api.version
+        if window_ms is None:
+            as_of_ms, end_bucket = version[1], None
+        else:
+            # Window totals only move with the rollup bucket the window ends in.
+            as_of_ms = int(time.time() * 1000)
+            end_bucket = api.window_bucket(window_ms, as_of_ms)
+
+        def build() -> tuple[bytes, dict[str, str]]:
+            try:
+                recs = api.recommendations(
+                    top_k=top_k,
+                    min_score=min_score,
+                    tenant=tenant,
+                    model_id=model_id,
+                    now_ms=as_of_ms,
+                    horizon=horizon,
+                    window_ms=window_ms,
+                )
+            except ValueError as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)
+                ) from exc
+            headers = {"X-Scores-As-Of": str(as_of_ms)}
+            if media_type == wire.JSON:
+                return _RECOMMENDATIONS.dump_json(recs), headers
+            try:
+                return wire.encode_recommendations(recs, media_type), headers
+            except RuntimeError as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=str(exc)
+                ) from exc
+
+        key = (
+            "suggest",
+            top_k,
+            min_score,
+            tenant,
+            model_id,
+            horizon,
+            window_ms,
+            end_bucket,
+            media_type,
+        )
+        return cached_response(request, key, version, build, media_type=media_type)
+
+    @app.get("/changes", response_model=PrefixChanges)
+    def changes(
+        since: int = Query(..., ge=0),
+        epoch: int | None = Query(default=None, ge=0),
+        top_k: int | None = Query(default=None, ge=1, le=10_000),
+        tenant: str | None = Query(default=None, min_length=1),
+        model_id: str | None = Query(default=None, min_length=1),
+    ) -> PrefixChanges:
+        """Top-k keys changed and evicted since generation ``since``, for mirroring planners.
+
+        Pass the previous reply's ``epoch`` too: generations restart with the server, and
+        a mismatched epoch answers with a ``reset``.
+        """
+        result: PrefixChanges = app.state.api.changes(
+            since, epoch=epoch, top_k=top_k, tenant=tenant, model_id=model_id
+        )
+        return result
 
     @app.get("/snapshot", response_model=list[PrefixRecommendation])
-    def snapshot() -> list[PrefixRecommendation]:
-        stats = app.state.api.snapshot()
-        return [
-            PrefixRecommendation(
-                prefix_id=stat.prefix_id,
-                tenant=stat.tenant,
-                model_id=stat.model_id,
-                score=stat.score,
-                hint=f"hits={stat.hit_count} bytes={stat.total_bytes} last_seen={stat.last_seen_ms}",
+    def snapshot(
+        request: Request,
+        cursor: str | None = Query(default=None, min_length=1),
+        limit: int | None = Query(default=None, ge=1, le=100_000),
+    ) -> Response:
+        """Stored keys with their undecayed scores, in ``(tenant, model_id, prefix_id)`` order.
+
+        With ``limit`` the response is one page; when more keys follow, ``X-Next-Cursor``
+        holds the ``cursor`` for the next page. Pages are cached per generation. With
+        ``Accept: application/x-ndjson`` records are streamed one per line instead of
+        being serialized into a single body.
+        """
+        api = app.state.api
+        after = _decode_cursor(cursor) if cursor is not None else None
+
+        if _wants_ndjson(request):
+
+            def lines() -> Iterator[bytes]:
+                stats = islice(api.iter_snapshot(after=after), limit)
+                while batch := list(islice(stats, _STREAM_BATCH)):
+                    yield b"".join(
+                        _snapshot_record(stat).model_dump_json().encode() + b"\n" for stat in batch
+                    )
+
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        version = api.version
+
+        def build() -> tuple[bytes, dict[str, str]]:
+            stats = list(
+                islice(api.iter_snapshot(after=after), None if limit is None else limit + 1)
             )
-            for stat in stats
-        ]
+            headers = {}
+            if limit is not None and len(stats) > limit:
+                del stats[limit:]
+                headers["X-Next-Cursor"] = _encode_cursor(stats[-1].key)
+            return _RECOMMENDATIONS.dump_json([_snapshot_record(stat) for stat in stats]), headers
+
+        return cached_response(request, ("snapshot", cursor, limit), version, build)
 
     return app
 
@@ -83,7 +475,21 @@ def run(argv: list[str] | None = None) -> None:
     parser.add_argument("--host", default="127.0.0.1", help="Host interface to bind.")
     parser.add_argument("--port", type=int, default=8000, help="TCP port for the service.")
     parser.add_argument(
-        "--store", type=str, default=None, help="Optional JSONL store path for persistence."
+        "--store",
+        type=str,
+        default=None,
+        help="Optional JSONL, SQLite or snapshot store path for persistence.",
+    )
+    parser.add_argument(
+        "--store-backend",
+        choices=("auto", "memory", "columnar", "jsonl", "sqlite", "snapshot"),
+        default="auto",
+        help="Store implementation; auto picks SQLite for .sqlite/.db and snapshot for .pidx.",
+    )
+    parser.add_argument(
+        "--wal",
+        action="store_true",
+        help="Append updates to a delta log and compact periodically instead of rewriting.",
     )
     parser.add_argument(
         "--decay-half-life-ms",
@@ -91,12 +497,64 @@ def run(argv: list[str] | None = None) -> None:
         default=3_600_000,
         help="Half-life used for exponential decay of prefix scores.",
     )
+    parser.add_argument(
+        "--horizon-ms",
+        type=int,
+        action="append",
+        default=[],
+        help="Extra half-life to rank by in the same pass, for /suggest?horizon= (repeatable).",
+    )
+    parser.add_argument(
+        "--rollup-minutes",
+        type=int,
+        default=0,
+        help="Per-minute buckets kept per key for /suggest?window= (0 disables).",
+    )
+    parser.add_argument(
+        "--rollup-hours",
+        type=int,
+        default=0,
+        help="Per-hour buckets kept per key for longer /suggest?window= queries (0 disables).",
+    )
     parser.add_argument(
         "--max-recs", type=int, default=100, help="Default maximum number of suggestions."
     )
     parser.add_argument(
         "--min-score", type=float, default=0.0, help="Minimum default score filter."
     )
+    parser.add_argument(
+        "--max-keys",
+        type=int,
+        default=None,
+        help="Bound the index to roughly this many keys by evicting the coldest ones.",
+    )
+    parser.add_argument(
+        "--evict-min-score",
+        type=float,
+        default=0.0,
+        help="Evict keys whose decayed score falls below this (0 keeps them).",
+    )
+    parser.add_argument(
+        "--ingest-queue",
+        type=int,
+        default=0,
+        metavar="EVENTS",
+        help="Buffer /ingest in a queue of this many events and commit in micro-batches.",
+    )
+    parser.add_argument(
+        "--batch-max-events", type=int, default=5_000, help="Largest queued micro-batch."
+    )
+    parser.add_argument(
+        "--batch-max-delay-ms",
+        type=int,
+        default=50,
+        help="Longest time an event waits in the queue before its batch is committed.",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Record stage timings and counters and serve them at /metrics.",
+    )
     parser.add_argument(
         "--cors-origin",
         action="append",
@@ -108,9 +566,20 @@ def run(argv: list[str] | None = None) -> None:
 
     config = PrefixIndexConfig(
         decay_half_life_ms=args.decay_half_life_ms,
+        decay_horizons_ms=args.horizon_ms,
+        rollup_minutes=args.rollup_minutes,
+        rollup_hours=args.rollup_hours,
         max_recommendations=args.max_recs,
         min_score=args.min_score,
         store_path=args.store,
+        store_backend=args.store_backend,
+        store_wal=args.wal,
+        max_keys=args.max_keys,
+        evict_min_score=args.evict_min_score,
+        ingest_queue_max_events=args.ingest_queue,
+        ingest_batch_max_events=args.batch_max_events,
+        ingest_batch_max_delay_ms=args.batch_max_delay_ms,
+        metrics_enabled=args.metrics,
     )
     app = create_app(config=config, cors_origins=args.cors_origins)
     uvicorn.run(app, host=args.host, port=args.port, log_level="info")
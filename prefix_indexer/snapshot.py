@@ -0,0 +1,322 @@
+"""Memory-mapped binary snapshot format for instant cold starts.
+
+Layout (little-endian, every section 8-byte aligned)::
+
+    header     magic, half_life_ms, row count, string count, partition count
+    rank       f64[rows]   decay rank used for ordering
+    score      f64[rows]
+    latency    f64[rows]   avg_latency_ms
+    hits       i64[rows]
+    bytes      i64[rows]   total_bytes
+    seen       i64[rows]   last_seen_ms
+    prefix     u32[rows]   string ids
+    tenant     u32[rows]
+    model      u32[rows]
+    key_order  u32[rows]   row ids sorted by (tenant, model_id, prefix_id)
+    partitions u64[4 * partitions]  (tenant id, model id, first row, end row)
+    offsets    u64[strings + 1]     string table offsets into the blob
+    blob       utf-8 bytes of the interned strings
+
+Rows are grouped by ``(tenant, model_id)`` and ranked within each group, so a ranked
+query reads a contiguous slice and a rank floor is one binary search. Columns are
+``memoryview`` casts over the mapping: opening a snapshot parses only the header and
+the partition directory, and ``PrefixStats`` objects are built only for rows returned.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+from .analytics import rank_value
+from .models import PrefixKey, PrefixStats
+from .ranking import RankEntry
+
+MAGIC = b"PIXSNAP1"
+_HEADER = struct.Struct("<8sQQQQ")
+
+# (prefix_id, tenant, model_id, hit_count, total_bytes, avg_latency_ms, score, last_seen_ms)
+SnapshotRow = tuple[str, str, str, int, int, float, float, int]
+
+_ROW_COLUMNS = (
+    ("rank", "d"),
+    ("score", "d"),
+    ("latency", "d"),
+    ("hits", "q"),
+    ("bytes", "q"),
+    ("seen", "q"),
+    ("prefix", "I"),
+    ("tenant", "I"),
+    ("model", "I"),
+    ("key_order", "I"),
+)
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _layout(rows: int, strings: int, partitions: int) -> dict[str, tuple[int, int, str]]:
+    """Return ``name -> (offset, item count, array typecode)`` for every section."""
+    sections = [(name, rows, code) for name, code in _ROW_COLUMNS]
+    sections += [("partitions", 4 * partitions, "Q"), ("offsets", strings + 1, "Q")]
+    layout: dict[str, tuple[int, int, str]] = {}
+    offset = _HEADER.size
+    for name, count, code in sections:
+        offset = _align(offset)
+        layout[name] = (offset, count, code)
+        offset += count * array(code).itemsize
+    layout["blob"] = (_align(offset), 0, "B")
+    return layout
+
+
+def stats_to_row(stat: PrefixStats) -> SnapshotRow:
+    return (
+        stat.prefix_id,
+        stat.tenant,
+        stat.model_id,
+        stat.hit_count,
+        stat.total_bytes,
+        stat.avg_latency_ms,
+        stat.score,
+        stat.last_seen_ms,
+    )
+
+
+def write_snapshot(path: Path, rows: Iterable[SnapshotRow], *, half_life_ms: int) -> int:
+    """Write ``rows`` as a binary snapshot via temp file plus rename; return its size."""
+    strings: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        sid = strings.get(value)
+        if sid is None:
+            sid = strings[value] = len(strings)
+        return sid
+
+    ordered = sorted(
+        (
+            (row[1], row[2], -rank_value(row[6], row[7], half_life_ms), -row[3], -row[7], row[0]),
+            row,
+        )
+        for row in rows
+    )
+    columns: dict[str, array[Any]] = {name: array(code) for name, code in _ROW_COLUMNS}
+    partitions = array("Q")
+    current: tuple[str, str] | None = None
+    for index, (sort_key, row) in enumerate(ordered):
+        prefix_id, tenant, model_id, hits, total_bytes, latency, score, seen = row
+        columns["rank"].append(-sort_key[2])
+        columns["score"].append(score)
+        columns["latency"].append(latency)
+        columns["hits"].append(hits)
+        columns["bytes"].append(total_bytes)
+        columns["seen"].append(seen)
+        columns["prefix"].append(intern(prefix_id))
+        columns["tenant"].append(intern(tenant))
+        columns["model"].append(intern(model_id))
+        if (tenant, model_id) != current:
+            if current is not None:
+                partitions.append(index)
+            partitions.extend((strings[tenant], strings[model_id], index))
+            current = (tenant, model_id)
+    if current is not None:
+        partitions.append(len(ordered))
+    columns["key_order"].extend(
+        sorted(
+            range(len(ordered)),
+            key=lambda i: (ordered[i][1][1], ordered[i][1][2], ordered[i][1][0]),
+        )
+    )
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = array("Q", [0])
+    for blob_part in encoded:
+        offsets.append(offsets[-1] + len(blob_part))
+    layout = _layout(len(ordered), len(strings), len(partitions) // 4)
+    sections = {**columns, "partitions": partitions, "offsets": offsets}
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    with tmp.open("wb") as fh:
+        fh.write(
+            _HEADER.pack(MAGIC, half_life_ms, len(ordered), len(strings), len(partitions) // 4)
+        )
+        for name, (offset, _, _) in layout.items():
+            fh.write(b"\0" * (offset - fh.tell()))
+            if name == "blob":
+                fh.write(b"".join(encoded))
+            else:
+                fh.write(sections[name].tobytes())
+        size = fh.tell()
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return size
+
+
+class SnapshotReader:
+    """Zero-copy, read-only view over a binary snapshot file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, half_life_ms, rows, strings, partitions = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{path} is not a prefix index snapshot")
+        self.half_life_ms = int(half_life_ms)
+        self._rows = int(rows)
+        self._views: list[memoryview] = [view]
+        layout = _layout(self._rows, int(strings), int(partitions))
+        self._cols: dict[str, memoryview[Any]] = {}
+        for name, (offset, count, code) in layout.items():
+            if name == "blob":
+                self._blob = self._slice(view, offset, len(view) - offset, "B")
+            else:
+                self._cols[name] = self._slice(view, offset, count * array(code).itemsize, code)
+        self._strings: list[str | None] = [None] * int(strings)
+        parts = self._cols["partitions"]
+        self.partitions: dict[tuple[str, str], tuple[int, int]] = {
+            (self.string(parts[i]), self.string(parts[i + 1])): (parts[i + 2], parts[i + 3])
+            for i in range(0, len(parts), 4)
+        }
+
+    def _slice(self, view: memoryview, offset: int, size: int, code: str) -> memoryview[Any]:
+        column = view[offset : offset + size].cast(code)  # type: ignore[call-overload]
+        self._views.append(column)
+        return column
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mmap.close()
+
+    def string(self, sid: int) -> str:
+        value = self._strings[sid]
+        if value is None:
+            offsets = self._cols["offsets"]
+            value = self._strings[sid] = bytes(self._blob[offsets[sid] : offsets[sid + 1]]).decode(
+                "utf-8"
+            )
+        return value
+
+    def key(self, row: int) -> PrefixKey:
+        cols = self._cols
+        return (
+            self.string(cols["prefix"][row]),
+            self.string(cols["tenant"][row]),
+            self.string(cols["model"][row]),
+        )
+
+    def row(self, row: int) -> SnapshotRow:
+        cols = self._cols
+        prefix_id, tenant, model_id = self.key(row)
+        return (
+            prefix_id,
+            tenant,
+            model_id,
+            cols["hits"][row],
+            cols["bytes"][row],
+            cols["latency"][row],
+            cols["score"][row],
+            cols["seen"][row],
+        )
+
+    def stats(self, row: int) -> PrefixStats:
+        prefix_id, tenant, model_id, hits, total_bytes, latency, score, seen = self.row(row)
+        return PrefixStats(
+            prefix_id=prefix_id,
+            tenant=tenant,
+            model_id=model_id,
+            hit_count=hits,
+            total_bytes=total_bytes,
+            avg_latency_ms=latency,
+            score=score,
+            last_seen_ms=seen,
+        )
+
+    def rank_entry(self, row: int) -> RankEntry:
+        cols = self._cols
+        return (-cols["rank"][row], -cols["hits"][row], -cols["seen"][row], self.key(row))
+
+    def find(self, key: PrefixKey) -> int | None:
+        """Binary-search ``key_order`` for ``key``; returns the row id or ``None``."""
+        position = self._lower_bound(key)
+        if position < self._rows:
+            row = self._cols["key_order"][position]
+            if self.key(row) == key:
+                return row
+        return None
+
+    def iter_rows(self, *, after: PrefixKey | None = None) -> Iterator[int]:
+        """Yield row ids in ``(tenant, model_id, prefix_id)`` order, strictly after ``after``."""
+        order = self._cols["key_order"]
+        start = 0
+        if after is not None:
+            start = self._lower_bound(after)
+            if start < self._rows and self.key(order[start]) == after:
+                start += 1
+        return islice(order, start, None)
+
+    def _lower_bound(self, key: PrefixKey) -> int:
+        """Position of the first ``key_order`` entry not ordered before ``key``."""
+        prefix_id, tenant, model_id = key
+        target = (tenant, model_id, prefix_id)
+        order = self._cols["key_order"]
+        lo, hi = 0, self._rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = self.key(order[mid])
+            if (found[1], found[2], found[0]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_ranked_rows(
+        self,
+        *,
+        min_rank: float,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> list[Iterator[int]]:
+        """Return one rank-ordered row iterator per partition matching the filters."""
+        streams: list[Iterator[int]] = []
+        for (part_tenant, part_model), (start, end) in self.partitions.items():
+            if tenant is not None and part_tenant != tenant:
+                continue
+            if model_id is not None and part_model != model_id:
+                continue
+            streams.append(iter(range(start, self._rank_stop(start, end, min_rank))))
+        return streams
+
+    def count_below(self, min_rank: float) -> int:
+        """Number of rows ranked below ``min_rank``; one binary search per partition."""
+        return sum(
+            end - self._rank_stop(start, end, min_rank) for start, end in self.partitions.values()
+        )
+
+    def _rank_stop(self, start: int, end: int, min_rank: float) -> int:
+        """First row of ``[start, end)`` ranked below ``min_rank``; ranks descend within it."""
+        ranks = self._cols["rank"]
+        lo, hi = start, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ranks[mid] >= min_rank:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
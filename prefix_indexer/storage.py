@@ -3,91 +3,1225 @@
 from __future__ import annotations
 
 import json
-from collections.abc import Iterable
+import math
+import os
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass, field
+from heapq import merge
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import Protocol
+from typing import Any, Protocol
 
-from .models import PrefixIndexConfig, PrefixStats
+from .analytics import decay_rank, rank_value
+from .models import PrefixIndexConfig, PrefixKey, PrefixStats
+from .ranking import _REBUILD_MIN_BATCH, PartitionedRanking, RankEntry, _shard_count
+from .rollups import RollupIndex
+from .snapshot import SnapshotReader, stats_to_row, write_snapshot
 
 
 class PrefixIndexStore(Protocol):
-    """Abstract store contract."""
+    """Abstract store contract.
+
+    Reads may run concurrently with one writer. Each ``bulk_upsert`` must become visible
+    atomically, and a ranked iteration keeps the state it started on.
+    """
 
     def load(self) -> None: ...
 
     def list_stats(self) -> list[PrefixStats]: ...
 
+    def get_many(self, keys: Iterable[PrefixKey]) -> dict[PrefixKey, PrefixStats]: ...
+
+    def iter_ranked(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[PrefixStats]: ...
+
+    def iter_stats(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        """Yield stats in ``(tenant, model_id, prefix_id)`` order, strictly after ``after``."""
+        ...
+
     def bulk_upsert(self, stats: Iterable[PrefixStats]) -> None: ...
 
+    def evict(self, *, min_rank: float) -> int:
+        """Delete every key whose ``decay_rank`` is below ``min_rank``; returns the count."""
+        ...
+
+    def __len__(self) -> int: ...
+
     def clear(self) -> None: ...
 
 
 @dataclass
 class InMemoryPrefixIndexStore(PrefixIndexStore):
-    """Simple in-memory store, convenient for tests."""
+    """Simple in-memory store, convenient for tests.
 
-    _stats: dict[tuple[str, str, str], PrefixStats] = field(default_factory=dict)
+    Stats live in a copy-on-write ``PartitionedRanking``, so reads run against the state
+    published by the last completed ``bulk_upsert`` without taking a lock.
+    """
+
+    half_life_ms: int = 3_600_000
+    _ranking: PartitionedRanking = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._ranking = PartitionedRanking(self.half_life_ms)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, tuple) and self._ranking.get(key) is not None
+
+    def snapshot(self) -> InMemoryPrefixIndexStore:
+        """Return a read-only view of the current contents in O(1)."""
+        view = InMemoryPrefixIndexStore(half_life_ms=self.half_life_ms)
+        view._ranking = self._ranking.snapshot()
+        return view
 
     def load(self) -> None:
         return None
 
     def list_stats(self) -> list[PrefixStats]:
-        return list(self._stats.values())
+        return list(self._ranking.snapshot().values())
+
+    def get_many(self, keys: Iterable[PrefixKey]) -> dict[PrefixKey, PrefixStats]:
+        ranking = self._ranking.snapshot()
+        found: dict[PrefixKey, PrefixStats] = {}
+        for key in keys:
+            stat = ranking.get(key)
+            if stat is not None:
+                found[key] = stat
+        return found
+
+    def iter_ranked(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[PrefixStats]:
+        items = self._ranking.iter_items(min_rank=min_rank, tenant=tenant, model_id=model_id)
+        for _, stat in items:
+            yield stat
+
+    def iter_ranked_entries(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[tuple[RankEntry, PrefixStats]]:
+        """Like ``iter_ranked`` but paired with the sort entry, for merging with other runs."""
+        return self._ranking.iter_items(min_rank=min_rank, tenant=tenant, model_id=model_id)
+
+    def iter_stats(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        return self._ranking.iter_stats(after=after)
 
     def bulk_upsert(self, stats: Iterable[PrefixStats]) -> None:
-        for stat in stats:
-            key = (stat.prefix_id, stat.tenant, stat.model_id)
-            self._stats[key] = stat
+        self._ranking.upsert(stats)
+
+    def evict(self, *, min_rank: float) -> int:
+        return self._ranking.evict(min_rank=min_rank)
+
+    def __len__(self) -> int:
+        return len(self._ranking)
 
     def clear(self) -> None:
-        self._stats.clear()
+        self._ranking.clear()
+
+
+class _RowIndex:
+    """Packed key -> row number of the columnar store, split over hash shards.
+
+    Keys are sharded by their interned ``prefix_id`` into a power-of-two number of
+    dicts of about ``_SHARD_LOAD`` keys. Published indexes are never mutated:
+    ``updated`` and ``without`` return a new index that clones only the shards they
+    write to, so publishing a batch costs the batch plus the list of shards.
+    """
+
+    __slots__ = ("shards", "size")
+
+    def __init__(self, shards: list[dict[int, int]] | None = None, size: int = 0) -> None:
+        self.shards = shards if shards is not None else [{}]
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, packed: int) -> int | None:
+        return self.shards[(packed >> 64) & (len(self.shards) - 1)].get(packed)
+
+    def updated(self, rows: dict[int, int]) -> _RowIndex:
+        """A new index with ``rows`` added or replaced."""
+        result = _RowIndex(list(self.shards), self.size)
+        mask = len(result.shards) - 1
+        cloned: set[int] = set()
+        for packed, row in rows.items():
+            slot = (packed >> 64) & mask
+            if slot not in cloned:
+                result.shards[slot] = dict(result.shards[slot])
+                cloned.add(slot)
+            shard = result.shards[slot]
+            result.size += packed not in shard
+            shard[packed] = row
+        count = _shard_count(result.size)
+        if count > len(result.shards):
+            result.shards = _RowIndex.sharded(
+                (item for shard in result.shards for item in shard.items()), count
+            )
+        return result
+
+    def without(self, keys: Iterable[int]) -> _RowIndex:
+        """A new index with ``keys`` (all present) removed."""
+        result = _RowIndex(list(self.shards), self.size)
+        mask = len(result.shards) - 1
+        cloned: set[int] = set()
+        for packed in keys:
+            slot = (packed >> 64) & mask
+            if slot not in cloned:
+                result.shards[slot] = dict(result.shards[slot])
+                cloned.add(slot)
+            del result.shards[slot][packed]
+            result.size -= 1
+        return result
+
+    @staticmethod
+    def sharded(items: Iterable[tuple[int, int]], count: int) -> list[dict[int, int]]:
+        shards: list[dict[int, int]] = [{} for _ in range(count)]
+        for packed, row in items:
+            shards[(packed >> 64) & (count - 1)][packed] = row
+        return shards
+
+
+# Interned ids of the columnar store: (string -> id, id -> string).
+_InternTable = tuple[dict[str, int], list[str]]
+# Columnar store state published to readers:
+# (columns, partition orders, key -> row, intern table).
+_ColumnarView = tuple[
+    dict[str, "array[Any]"], dict[int, dict[int, "array[int]"]], _RowIndex, _InternTable
+]
+
+_COLUMNAR_TYPES = {
+    "prefix": "I",
+    "tenant": "I",
+    "model": "I",
+    "hits": "q",
+    "bytes": "q",
+    "seen": "q",
+    "latency": "d",
+    "score": "d",
+    "rank": "d",
+}
+
+# Columns holding intern table ids, renumbered when the table is rebuilt.
+_INTERNED = ("prefix", "tenant", "model")
+
+# Superseded rows are reclaimed once they outnumber live rows (and this floor).
+_COLUMNAR_COMPACT_MIN_DEAD = 4_096
 
 
 @dataclass
-class JsonlPrefixIndexStore(PrefixIndexStore):
-    """Persist statistics to a JSONL file."""
+class ColumnarPrefixIndexStore(PrefixIndexStore):
+    """In-memory store holding statistics in parallel typed columns.
 
-    path: Path
-    _stats: InMemoryPrefixIndexStore = field(default_factory=InMemoryPrefixIndexStore)
+    Ids are interned once and each key maps to a row number, so a key costs a few dozen
+    bytes of column space instead of a ``PrefixStats`` object with its own strings. Each
+    ``(tenant, model_id)`` partition keeps its row numbers in rank order, maintained the
+    same way as ``RankingIndex``. ``PrefixStats`` are built only for rows handed back.
+
+    Rows are append-only: an update writes a new row and publishes new partition orders
+    by swapping one reference, so readers never observe a partly written batch. The
+    superseded and evicted rows are reclaimed once they outnumber the live ones, and the
+    intern table is rebuilt from the live rows at the same time, so ids of keys that are
+    gone are released too. The table is published with the columns that use it.
+    """
+
+    half_life_ms: int = 3_600_000
+    _view: _ColumnarView = field(init=False, repr=False)
+    _dead: int = field(default=0, init=False, repr=False)
+    _sorted: dict[tuple[int, int], tuple[array[int], list[int]]] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.clear()
 
     def load(self) -> None:
-        if not self.path.exists():
+        return None
+
+    def list_stats(self) -> list[PrefixStats]:
+        cols, partitions, _, (_, names) = self._view
+        return [
+            self._stats(cols, names, row)
+            for models in partitions.values()
+            for order in models.values()
+            for row in order
+        ]
+
+    def get_many(self, keys: Iterable[PrefixKey]) -> dict[PrefixKey, PrefixStats]:
+        cols, _, rows, (ids, names) = self._view
+        found: dict[PrefixKey, PrefixStats] = {}
+        for key in keys:
+            prefix_id, tenant, model_id = key
+            if prefix_id not in ids or tenant not in ids or model_id not in ids:
+                continue
+            row = rows.get(self._pack(ids[prefix_id], ids[tenant], ids[model_id]))
+            if row is not None:
+                found[key] = self._stats(cols, names, row)
+        return found
+
+    def iter_ranked(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[PrefixStats]:
+        cols, partitions, _, (ids, names) = self._view
+        rank = cols["rank"]
+        runs: list[Iterator[int]] = []
+        for order in self._select(partitions, ids, tenant, model_id):
+            stop = len(order)
+            if min_rank > -math.inf:
+                stop = bisect_right(order, -min_rank, key=lambda row: -rank[row])
+            runs.append(islice(order, stop))
+        if not runs:
             return
-        with self.path.open("r", encoding="utf-8") as fh:
-            lines = fh.readlines()
-        parsed: list[PrefixStats] = []
-        for line in lines:
-            line = line.strip()
-            if not line:
+        rows = runs[0] if len(runs) == 1 else merge(*runs, key=self._sort_key(cols, names))
+        for row in rows:
+            yield self._stats(cols, names, row)
+
+    def iter_stats(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        cols, partitions, _, (_, names) = self._view
+        bound = (after[1], after[2]) if after is not None else None
+        for tenant_name, tenant in sorted((names[sid], sid) for sid in partitions):
+            if bound is not None and tenant_name < bound[0]:
                 continue
+            models = partitions[tenant]
+            for model_name, model_id in sorted((names[sid], sid) for sid in models):
+                if bound is not None and (tenant_name, model_name) < bound:
+                    continue
+                rows = self._sorted_rows(cols, names, tenant, model_id, models[model_id])
+                start = 0
+                if after is not None and (tenant_name, model_name) == bound:
+                    prefix = cols["prefix"]
+                    start = bisect_right(rows, after[0], key=lambda row: names[prefix[row]])
+                for row in islice(rows, start, None):
+                    yield self._stats(cols, names, row)
+
+    def bulk_upsert(self, stats: Iterable[PrefixStats]) -> None:
+        cols, published, rows, table = self._view
+        grouped: dict[tuple[int, int], list[PrefixStats]] = defaultdict(list)
+        for stat in stats:
+            grouped[(self._intern(stat.tenant), self._intern(stat.model_id))].append(stat)
+        if not grouped:
+            return
+        sort_key = self._sort_key(cols, table[1])
+        partitions = dict(published)
+        copied: set[int] = set()
+        replaced: dict[int, int] = {}
+        for (tenant, model_id), batch in grouped.items():
+            if tenant not in copied:
+                partitions[tenant] = dict(partitions.get(tenant, {}))
+                copied.add(tenant)
+            models = partitions[tenant]
+            order = array("I", models.get(model_id, ()))
+            current: dict[int, int] = {}
+            for stat in batch:
+                packed = self._pack(self._intern(stat.prefix_id), tenant, model_id)
+                current[packed] = self._append(cols, stat)
+            if len(current) >= max(_REBUILD_MIN_BATCH, len(order) >> 6):
+                superseded = {row for row in map(rows.get, current) if row is not None}
+                live = [row for row in order if row not in superseded]
+                order = array("I", sorted([*live, *current.values()], key=sort_key))
+            else:
+                for packed, row in current.items():
+                    previous = rows.get(packed)
+                    if previous is not None:
+                        del order[bisect_left(order, sort_key(previous), key=sort_key)]
+                    insort(order, row, key=sort_key)
+            models[model_id] = order
+            replaced.update(current)
+        # A new row index is published with the new orders; the old one stays intact.
+        rows = rows.updated(replaced)
+        self._view = (cols, partitions, rows, table)
+        self._dead = len(cols["hits"]) - len(rows)
+        if self._dead >= max(_COLUMNAR_COMPACT_MIN_DEAD, len(rows)):
+            self._compact()
+
+    def evict(self, *, min_rank: float) -> int:
+        cols, published, rows, table = self._view
+        rank, prefix = cols["rank"], cols["prefix"]
+        partitions: dict[int, dict[int, array[int]]] = {}
+        cold: list[int] = []
+        for tenant, models in published.items():
+            kept: dict[int, array[int]] = {}
+            for model_id, order in models.items():
+                # Ranks descend along the order, so the evicted rows are its tail.
+                stop = bisect_right(order, -min_rank, key=lambda row: -rank[row])
+                if stop < len(order):
+                    cold.extend(self._pack(prefix[row], tenant, model_id) for row in order[stop:])
+                    order = order[:stop]
+                if order:
+                    kept[model_id] = order
+            if kept:
+                partitions[tenant] = kept
+        if not cold:
+            return 0
+        live = rows.without(cold)
+        self._view = (cols, partitions, live, table)
+        self._dead = len(cols["hits"]) - len(live)
+        if self._dead >= max(_COLUMNAR_COMPACT_MIN_DEAD, len(live)):
+            self._compact()
+        return len(cold)
+
+    def __len__(self) -> int:
+        return len(self._view[2])
+
+    def clear(self) -> None:
+        cols = {name: array(code) for name, code in _COLUMNAR_TYPES.items()}
+        self._view = (cols, {}, _RowIndex(), ({}, []))
+        self._dead = 0
+        self._sorted = {}
+
+    def _sorted_rows(
+        self,
+        cols: dict[str, array[Any]],
+        names: list[str],
+        tenant: int,
+        model_id: int,
+        order: array[int],
+    ) -> list[int]:
+        """Rows of one published partition in ``prefix_id`` order, cached per order array."""
+        cached = self._sorted.get((tenant, model_id))
+        if cached is not None and cached[0] is order:
+            return cached[1]
+        prefix = cols["prefix"]
+        rows = sorted(order, key=lambda row: names[prefix[row]])
+        self._sorted[(tenant, model_id)] = (order, rows)
+        return rows
+
+    def _compact(self) -> None:
+        """Copy live rows into fresh columns and a fresh intern table, then publish them."""
+        cols, published, _, (_, old_names) = self._view
+        ids: dict[str, int] = {}
+        names: list[str] = []
+
+        def intern(sid: int) -> int:
+            value = old_names[sid]
+            new_sid = ids.get(value)
+            if new_sid is None:
+                new_sid = ids[value] = len(names)
+                names.append(value)
+            return new_sid
+
+        fresh: dict[str, array[Any]] = {name: array(code) for name, code in _COLUMNAR_TYPES.items()}
+        plain = [(fresh[name], cols[name]) for name in _COLUMNAR_TYPES if name not in _INTERNED]
+        partitions: dict[int, dict[int, array[int]]] = {}
+        rows: dict[int, int] = {}
+        for tenant, models in published.items():
+            new_tenant = intern(tenant)
+            for model_id, order in models.items():
+                new_model = intern(model_id)
+                renumbered = array("I")
+                for row in order:
+                    new_row = len(fresh["hits"])
+                    prefix = intern(cols["prefix"][row])
+                    fresh["prefix"].append(prefix)
+                    fresh["tenant"].append(new_tenant)
+                    fresh["model"].append(new_model)
+                    for column, source in plain:
+                        column.append(source[row])
+                    renumbered.append(new_row)
+                    rows[self._pack(prefix, new_tenant, new_model)] = new_row
+                partitions.setdefault(new_tenant, {})[new_model] = renumbered
+        shards = _RowIndex.sharded(rows.items(), _shard_count(len(rows)))
+        self._view = (fresh, partitions, _RowIndex(shards, len(rows)), (ids, names))
+        self._dead = 0
+        self._sorted = {}
+
+    @staticmethod
+    def _pack(prefix: int, tenant: int, model_id: int) -> int:
+        return (prefix << 64) | (tenant << 32) | model_id
+
+    def _intern(self, value: str) -> int:
+        # Appending leaves every id already published valid, so readers need no copy.
+        ids, names = self._view[3]
+        sid = ids.get(value)
+        if sid is None:
+            sid = ids[value] = len(names)
+            names.append(value)
+        return sid
+
+    def _append(self, cols: dict[str, array[Any]], stat: PrefixStats) -> int:
+        row = len(cols["hits"])
+        cols["prefix"].append(self._intern(stat.prefix_id))
+        cols["tenant"].append(self._intern(stat.tenant))
+        cols["model"].append(self._intern(stat.model_id))
+        cols["hits"].append(stat.hit_count)
+        cols["bytes"].append(stat.total_bytes)
+        cols["seen"].append(stat.last_seen_ms)
+        cols["latency"].append(stat.avg_latency_ms)
+        cols["score"].append(stat.score)
+        cols["rank"].append(rank_value(stat.score, stat.last_seen_ms, self.half_life_ms))
+        return row
+
+    def _sort_key(
+        self, cols: dict[str, array[Any]], names: list[str]
+    ) -> Callable[[int], RankEntry]:
+        rank, hits, seen = cols["rank"], cols["hits"], cols["seen"]
+        prefix, tenant, model = cols["prefix"], cols["tenant"], cols["model"]
+
+        def key(row: int) -> RankEntry:
+            return (
+                -rank[row],
+                -hits[row],
+                -seen[row],
+                (names[prefix[row]], names[tenant[row]], names[model[row]]),
+            )
+
+        return key
+
+    def _select(
+        self,
+        partitions: dict[int, dict[int, array[int]]],
+        ids: dict[str, int],
+        tenant: str | None,
+        model_id: str | None,
+    ) -> Iterator[array[int]]:
+        if tenant is not None:
+            sid = ids.get(tenant)
+            tenants = [partitions.get(sid, {})] if sid is not None else []
+        else:
+            tenants = list(partitions.values())
+        model_sid = ids.get(model_id) if model_id is not None else None
+        for models in tenants:
+            if model_id is None:
+                yield from models.values()
+            elif model_sid is not None and model_sid in models:
+                yield models[model_sid]
+
+    def _stats(self, cols: dict[str, array[Any]], names: list[str], row: int) -> PrefixStats:
+        return PrefixStats(
+            prefix_id=names[cols["prefix"][row]],
+            tenant=names[cols["tenant"][row]],
+            model_id=names[cols["model"][row]],
+            hit_count=cols["hits"][row],
+            total_bytes=cols["bytes"][row],
+            avg_latency_ms=cols["latency"][row],
+            score=cols["score"][row],
+            last_seen_ms=cols["seen"][row],
+        )
+
+
+def _atomic_write_lines(path: Path, lines: Iterable[str]) -> int:
+    """Write lines to a temp file, fsync, and rename it over ``path``."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    written = 0
+    with tmp.open("w", encoding="utf-8") as fh:
+        for line in lines:
+            fh.write(line)
+            fh.write("\n")
+            written += len(line) + 1
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return written
+
+
+def write_rollups(path: Path, rollups: RollupIndex, *, complete_from_ms: int | None) -> int:
+    """Atomically write ``rollups`` as JSONL: a header line, then one ``RollupRow`` per key.
+
+    ``complete_from_ms`` is carried along for the reader: windows starting before it may
+    miss events the rollups never saw (``None`` when they saw every event).
+    """
+    header = {
+        "minute_slots": rollups.minute_slots,
+        "hour_slots": rollups.hour_slots,
+        "newest_ms": rollups.newest_ms,
+        "complete_from_ms": complete_from_ms,
+    }
+    rows = (json.dumps(row, separators=(",", ":")) for row in rollups.rows())
+    return _atomic_write_lines(path, chain([json.dumps(header)], rows))
+
+
+def read_rollups(
+    path: Path, minute_slots: int, hour_slots: int
+) -> tuple[RollupIndex, int | None] | None:
+    """Load ``write_rollups`` output as ``(rollups, complete_from_ms)``.
+
+    Returns ``None`` when the file is missing, unreadable or was written with other ring
+    sizes, in which case the caller has no rollups for what came before.
+    """
+    if not path.exists():
+        return None
+    rollups = RollupIndex(minute_slots, hour_slots)
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            header = json.loads(fh.readline())
+            if (header["minute_slots"], header["hour_slots"]) != (minute_slots, hour_slots):
+                return None
+            for line in fh:
+                rollups.add_row(json.loads(line))
+    except (ValueError, KeyError, TypeError):
+        return None
+    rollups.newest_ms = max(rollups.newest_ms, header["newest_ms"])
+    return rollups, header["complete_from_ms"]
+
+
+def _read_stats_file(path: Path, *, tolerate_torn_tail: bool = False) -> list[PrefixStats]:
+    """Parse a JSONL stats file; optionally skip a half-written final record."""
+    if not path.exists():
+        return []
+    with path.open("r", encoding="utf-8") as fh:
+        lines = [line.strip() for line in fh]
+    lines = [line for line in lines if line]
+    parsed: list[PrefixStats] = []
+    for idx, line in enumerate(lines):
+        try:
             data = json.loads(line)
-            parsed.append(PrefixStats.model_validate(data))
-        self._stats.clear()
-        self._stats.bulk_upsert(parsed)
+        except json.JSONDecodeError:
+            if tolerate_torn_tail and idx == len(lines) - 1:
+                break
+            raise
+        parsed.append(PrefixStats.model_validate(data))
+    return parsed
+
+
+@dataclass
+class JsonlPrefixIndexStore(PrefixIndexStore):
+    """Persist statistics to a JSONL file.
+
+    By default every upsert rewrites the whole file. With ``wal=True`` upserts append
+    only the changed stats to ``<path>.wal`` and the log is folded into a fresh base
+    snapshot once it grows past ``compact_min_bytes`` or ``compact_ratio`` times the
+    base size. Compaction runs on a background thread and always goes through a temp
+    file plus rename, so a crash at any point leaves a replayable base and log.
+    """
+
+    path: Path
+    half_life_ms: int = 3_600_000
+    wal: bool = False
+    compact_min_bytes: int = 64 * 1024 * 1024
+    compact_ratio: float = 0.5
+    background_compaction: bool = True
+    _stats: InMemoryPrefixIndexStore = field(init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _compactor: threading.Thread | None = field(default=None, repr=False)
+    _base_bytes: int = field(default=0, repr=False)
+    _wal_bytes: int = field(default=0, repr=False)
+    # Cumulative bytes of base files and log records written by this instance.
+    bytes_written: int = field(default=0, init=False)
+
+    def __post_init__(self) -> None:
+        self._stats = InMemoryPrefixIndexStore(half_life_ms=self.half_life_ms)
+
+    @property
+    def wal_path(self) -> Path:
+        return self.path.with_name(f"{self.path.name}.wal")
+
+    @property
+    def _compacting_path(self) -> Path:
+        return self.path.with_name(f"{self.path.name}.wal.compacting")
+
+    def load(self) -> None:
+        parsed = _read_stats_file(self.path)
+        # Replay the rotated log first (left behind by an interrupted compaction), then
+        # the live one. Records are full stats, so replaying over a newer base is a no-op.
+        for log in (self._compacting_path, self.wal_path):
+            parsed.extend(_read_stats_file(log, tolerate_torn_tail=True))
+        loaded = InMemoryPrefixIndexStore(half_life_ms=self.half_life_ms)
+        loaded.bulk_upsert(parsed)
+        with self._lock:
+            self._stats = loaded
+            self._base_bytes = self.path.stat().st_size if self.path.exists() else 0
+            self._wal_bytes = sum(
+                log.stat().st_size for log in (self._compacting_path, self.wal_path) if log.exists()
+            )
 
     def list_stats(self) -> list[PrefixStats]:
         return self._stats.list_stats()
 
+    def get_many(self, keys: Iterable[PrefixKey]) -> dict[PrefixKey, PrefixStats]:
+        return self._stats.get_many(keys)
+
+    def iter_ranked(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[PrefixStats]:
+        return self._stats.iter_ranked(min_rank=min_rank, tenant=tenant, model_id=model_id)
+
+    def iter_stats(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        return self._stats.iter_stats(after=after)
+
     def bulk_upsert(self, stats: Iterable[PrefixStats]) -> None:
-        self._stats.bulk_upsert(stats)
-        self._flush()
+        if not self.wal:
+            self._stats.bulk_upsert(stats)
+            self._flush()
+            return
+        batch = list(stats)
+        with self._lock:
+            self._append_wal(batch)
+            self._stats.bulk_upsert(batch)
+        if self._should_compact():
+            if self.background_compaction:
+                self._schedule_compaction()
+            else:
+                self.compact()
+
+    def evict(self, *, min_rank: float) -> int:
+        evicted = self._stats.evict(min_rank=min_rank)
+        if evicted:
+            # Evicted keys have no log record; rewriting the base drops them for good.
+            if self.wal:
+                self.wait_for_compaction()
+                self.compact()
+            else:
+                self._flush()
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._stats)
 
     def clear(self) -> None:
-        self._stats.clear()
-        if self.path.exists():
-            self.path.unlink()
+        self.wait_for_compaction()
+        with self._lock:
+            self._stats.clear()
+            for target in (self.path, self.wal_path, self._compacting_path):
+                if target.exists():
+                    target.unlink()
+            self._base_bytes = 0
+            self._wal_bytes = 0
+
+    def compact(self) -> None:
+        """Fold the delta log into a new base snapshot."""
+        with self._lock:
+            if self._compacting_path.exists():
+                # A previous compaction was interrupted. Memory already reflects both
+                # logs, so rewrite the base while holding the lock and drop them.
+                self._base_bytes = _atomic_write_lines(
+                    self.path, (stat.model_dump_json() for stat in self._stats.list_stats())
+                )
+                self.bytes_written += self._base_bytes
+                for log in (self._compacting_path, self.wal_path):
+                    if log.exists():
+                        log.unlink()
+                self._wal_bytes = 0
+                return
+            if self.wal_path.exists():
+                os.replace(self.wal_path, self._compacting_path)
+            snapshot = self._stats.list_stats()
+            self._wal_bytes = 0
+        base_bytes = _atomic_write_lines(self.path, (stat.model_dump_json() for stat in snapshot))
+        with self._lock:
+            self._base_bytes = base_bytes
+            self.bytes_written += base_bytes
+            if self._compacting_path.exists():
+                self._compacting_path.unlink()
+
+    def wait_for_compaction(self, timeout: float | None = None) -> None:
+        """Block until an in-flight background compaction finishes."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join(timeout)
+
+    def _append_wal(self, batch: list[PrefixStats]) -> None:
+        self.wal_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = "".join(f"{stat.model_dump_json()}\n" for stat in batch)
+        with self.wal_path.open("a", encoding="utf-8") as fh:
+            fh.write(payload)
+            fh.flush()
+        self._wal_bytes += len(payload)
+        self.bytes_written += len(payload)
+
+    def _should_compact(self) -> bool:
+        if self._wal_bytes >= self.compact_min_bytes:
+            return True
+        return self._base_bytes > 0 and self._wal_bytes >= self.compact_ratio * self._base_bytes
+
+    def _schedule_compaction(self) -> None:
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(
+            target=self.compact, name="prefix-index-compaction", daemon=True
+        )
+        self._compactor.start()
 
     def _flush(self) -> None:
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        with self.path.open("w", encoding="utf-8") as fh:
-            for stat in self._stats.list_stats():
-                fh.write(stat.model_dump_json())
-                fh.write("\n")
+        self._base_bytes = _atomic_write_lines(
+            self.path, (stat.model_dump_json() for stat in self._stats.list_stats())
+        )
+        self.bytes_written += self._base_bytes
+        # The full snapshot supersedes any delta log left over from WAL mode.
+        for log in (self.wal_path, self._compacting_path):
+            if log.exists():
+                log.unlink()
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prefix_stats (
+    tenant TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    prefix_id TEXT NOT NULL,
+    hit_count INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL,
+    avg_latency_ms REAL NOT NULL,
+    score REAL NOT NULL,
+    last_seen_ms INTEGER NOT NULL,
+    rank REAL NOT NULL,
+    PRIMARY KEY (tenant, model_id, prefix_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS prefix_stats_partition_rank
+    ON prefix_stats (tenant, model_id, rank DESC, hit_count DESC, last_seen_ms DESC);
+CREATE INDEX IF NOT EXISTS prefix_stats_rank
+    ON prefix_stats (rank DESC, hit_count DESC, last_seen_ms DESC);
+CREATE TABLE IF NOT EXISTS prefix_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+_SQLITE_COLUMNS = (
+    "prefix_id, tenant, model_id, hit_count, total_bytes, avg_latency_ms, score, last_seen_ms"
+)
+_SQLITE_RANK_ORDER = "rank DESC, hit_count DESC, last_seen_ms DESC, prefix_id, tenant, model_id"
+# Keys per point-lookup statement; keeps us under SQLITE_MAX_VARIABLE_NUMBER.
+_SQLITE_LOOKUP_BATCH = 300
+
+
+def _stats_from_row(row: tuple[Any, ...]) -> PrefixStats:
+    return PrefixStats(
+        prefix_id=row[0],
+        tenant=row[1],
+        model_id=row[2],
+        hit_count=row[3],
+        total_bytes=row[4],
+        avg_latency_ms=row[5],
+        score=row[6],
+        last_seen_ms=row[7],
+    )
+
+
+@dataclass
+class SqlitePrefixIndexStore(PrefixIndexStore):
+    """Persist statistics in SQLite (WAL mode) without holding the index in memory.
+
+    Upserts run in a single transaction, point lookups use the primary key, and ranked
+    queries walk a ``(tenant, model_id, rank)`` index, so start-up cost and resident
+    memory do not grow with the number of keys.
+
+    Writes share one connection behind a lock; reads use a connection per thread. In WAL
+    mode each read statement sees the last committed transaction and neither blocks nor
+    is blocked by a writer.
+    """
+
+    path: Path
+    half_life_ms: int = 3_600_000
+    _conn: sqlite3.Connection | None = field(default=None, repr=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    _local: threading.local = field(default_factory=threading.local, repr=False)
+    _readers: list[sqlite3.Connection] = field(default_factory=list, repr=False)
+
+    def load(self) -> None:
+        conn = self._connection()
+        with self._lock, conn:
+            row = conn.execute(
+                "SELECT value FROM prefix_meta WHERE name = 'half_life_ms'"
+            ).fetchone()
+            if row is not None and int(row[0]) == self.half_life_ms:
+                return
+            # Ranks depend on the half-life; recompute them if it changed.
+            stats = [
+                _stats_from_row(r)
+                for r in conn.execute(f"SELECT {_SQLITE_COLUMNS} FROM prefix_stats")
+            ]
+            self._write(conn, stats)
+            conn.execute(
+                "INSERT OR REPLACE INTO prefix_meta (name, value) VALUES ('half_life_ms', ?)",
+                (str(self.half_life_ms),),
+            )
+
+    def list_stats(self) -> list[PrefixStats]:
+        rows = self._reader().execute(f"SELECT {_SQLITE_COLUMNS} FROM prefix_stats")
+        return [_stats_from_row(row) for row in rows]
+
+    def get_many(self, keys: Iterable[PrefixKey]) -> dict[PrefixKey, PrefixStats]:
+        pending = list(keys)
+        found: dict[PrefixKey, PrefixStats] = {}
+        conn = self._reader()
+        for start in range(0, len(pending), _SQLITE_LOOKUP_BATCH):
+            batch = pending[start : start + _SQLITE_LOOKUP_BATCH]
+            values = ", ".join("(?, ?, ?)" for _ in batch)
+            params = [
+                part
+                for prefix_id, tenant, model_id in batch
+                for part in (tenant, model_id, prefix_id)
+            ]
+            rows = conn.execute(
+                f"SELECT {_SQLITE_COLUMNS} FROM prefix_stats "
+                f"WHERE (tenant, model_id, prefix_id) IN (VALUES {values})",
+                params,
+            )
+            for row in rows:
+                stat = _stats_from_row(row)
+                found[stat.key] = stat
+        return found
+
+    def iter_ranked(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[PrefixStats]:
+        clauses = ["rank >= ?"]
+        params: list[Any] = [min_rank]
+        if tenant is not None:
+            clauses.append("tenant = ?")
+            params.append(tenant)
+        if model_id is not None:
+            clauses.append("model_id = ?")
+            params.append(model_id)
+        query = (
+            f"SELECT {_SQLITE_COLUMNS} FROM prefix_stats WHERE {' AND '.join(clauses)} "
+            f"ORDER BY {_SQLITE_RANK_ORDER}"
+        )
+        # One statement is one read snapshot, however slowly the caller consumes it.
+        cursor = self._reader().execute(query, params)
+        while rows := cursor.fetchmany(256):
+            for row in rows:
+                yield _stats_from_row(row)
+
+    def iter_stats(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        query = f"SELECT {_SQLITE_COLUMNS} FROM prefix_stats"
+        params: tuple[str, ...] = ()
+        if after is not None:
+            query += " WHERE (tenant, model_id, prefix_id) > (?, ?, ?)"
+            params = (after[1], after[2], after[0])
+        cursor = self._reader().execute(f"{query} ORDER BY tenant, model_id, prefix_id", params)
+        while rows := cursor.fetchmany(256):
+            for row in rows:
+                yield _stats_from_row(row)
+
+    def bulk_upsert(self, stats: Iterable[PrefixStats]) -> None:
+        conn = self._connection()
+        with self._lock, conn:
+            self._write(conn, stats)
+
+    def evict(self, *, min_rank: float) -> int:
+        conn = self._connection()
+        with self._lock, conn:
+            return conn.execute("DELETE FROM prefix_stats WHERE rank < ?", (min_rank,)).rowcount
+
+    def __len__(self) -> int:
+        (count,) = self._reader().execute("SELECT COUNT(*) FROM prefix_stats").fetchone()
+        return int(count)
+
+    def clear(self) -> None:
+        conn = self._connection()
+        with self._lock, conn:
+            conn.execute("DELETE FROM prefix_stats")
+
+    def close(self) -> None:
+        with self._lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
+            self._local = threading.local()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _write(self, conn: sqlite3.Connection, stats: Iterable[PrefixStats]) -> None:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO prefix_stats ({_SQLITE_COLUMNS}, rank) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    stat.prefix_id,
+                    stat.tenant,
+                    stat.model_id,
+                    stat.hit_count,
+                    stat.total_bytes,
+                    stat.avg_latency_ms,
+                    stat.score,
+                    stat.last_seen_ms,
+                    decay_rank(stat, self.half_life_ms),
+                )
+                for stat in stats
+            ),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SQLITE_SCHEMA)
+                self._conn = conn
+            return self._conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn: sqlite3.Connection | None = getattr(self._local, "conn", None)
+        if conn is None:
+            self._connection()  # creates the file and schema
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+
+@dataclass
+class SnapshotPrefixIndexStore(PrefixIndexStore):
+    """Serve statistics from a memory-mapped binary snapshot plus an in-memory overlay.
+
+    Start-up maps the snapshot (see ``prefix_indexer.snapshot``) instead of parsing it,
+    so load time and resident memory do not grow with the number of keys; ``PrefixStats``
+    are built only for rows a query returns. Upserts land in an overlay that shadows the
+    snapshot and are appended to ``<path>.wal``; once the log outgrows
+    ``compact_min_bytes`` or ``compact_ratio`` times the snapshot, both are folded into a
+    fresh snapshot written via temp file plus rename.
+
+    The ``(snapshot, overlay)`` pair is swapped as one reference, so reads never take the
+    write lock and never see a snapshot paired with the wrong overlay.
+    """
+
+    path: Path
+    half_life_ms: int = 3_600_000
+    compact_min_bytes: int = 64 * 1024 * 1024
+    compact_ratio: float = 0.5
+    _view: tuple[SnapshotReader | None, InMemoryPrefixIndexStore] = field(init=False, repr=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    _base_bytes: int = field(default=0, repr=False)
+    _wal_bytes: int = field(default=0, repr=False)
+    # Cumulative bytes of snapshots and log records written by this instance.
+    bytes_written: int = field(default=0, init=False)
+
+    def __post_init__(self) -> None:
+        self._view = (None, InMemoryPrefixIndexStore(half_life_ms=self.half_life_ms))
+
+    @property
+    def wal_path(self) -> Path:
+        return self.path.with_name(f"{self.path.name}.wal")
+
+    def load(self) -> None:
+        with self._lock:
+            # Readers still iterating an old mapping keep it alive; it is unmapped once
+            # the last reference goes away.
+            base = SnapshotReader(self.path) if self.path.exists() else None
+            overlay = InMemoryPrefixIndexStore(half_life_ms=self.half_life_ms)
+            overlay.bulk_upsert(_read_stats_file(self.wal_path, tolerate_torn_tail=True))
+            self._view = (base, overlay)
+            self._base_bytes = self.path.stat().st_size if base is not None else 0
+            self._wal_bytes = self.wal_path.stat().st_size if self.wal_path.exists() else 0
+            if base is not None and base.half_life_ms != self.half_life_ms:
+                # Stored ranks depend on the half-life; rewrite them.
+                self.compact()
+
+    def list_stats(self) -> list[PrefixStats]:
+        base, overlay = self._current()
+        stats = overlay.list_stats()
+        if base is not None:
+            for row in base.iter_rows():
+                if base.key(row) not in overlay:
+                    stats.append(base.stats(row))
+        return stats
+
+    def get_many(self, keys: Iterable[PrefixKey]) -> dict[PrefixKey, PrefixStats]:
+        base, overlay = self._current()
+        pending = list(keys)
+        found = overlay.get_many(pending)
+        if base is not None:
+            for key in pending:
+                if key in found:
+                    continue
+                row = base.find(key)
+                if row is not None:
+                    found[key] = base.stats(row)
+        return found
+
+    def iter_ranked(
+        self,
+        *,
+        min_rank: float = -math.inf,
+        tenant: str | None = None,
+        model_id: str | None = None,
+    ) -> Iterator[PrefixStats]:
+        base, overlay = self._current()
+        runs: list[Iterator[tuple[RankEntry, Any]]] = [
+            overlay.iter_ranked_entries(min_rank=min_rank, tenant=tenant, model_id=model_id)
+        ]
+        if base is not None:
+            for rows in base.iter_ranked_rows(min_rank=min_rank, tenant=tenant, model_id=model_id):
+                runs.append((base.rank_entry(row), row) for row in rows)
+        for entry, item in merge(*runs, key=itemgetter(0)):
+            if isinstance(item, PrefixStats):
+                yield item
+            elif base is not None and entry[3] not in overlay:
+                yield base.stats(item)
+
+    def iter_stats(self, *, after: PrefixKey | None = None) -> Iterator[PrefixStats]:
+        base, overlay = self._current()
+        runs: list[Iterator[tuple[PrefixKey, Any]]] = [
+            (
+                ((stat.tenant, stat.model_id, stat.prefix_id), stat)
+                for stat in overlay.iter_stats(after=after)
+            )
+        ]
+        if base is not None:
+            runs.append(
+                ((key[1], key[2], key[0]), row)
+                for row, key in ((row, base.key(row)) for row in base.iter_rows(after=after))
+            )
+        for _, item in merge(*runs, key=itemgetter(0)):
+            if isinstance(item, PrefixStats):
+                yield item
+            elif base is not None and base.key(item) not in overlay:
+                yield base.stats(item)
+
+    def bulk_upsert(self, stats: Iterable[PrefixStats]) -> None:
+        batch = list(stats)
+        with self._lock:
+            self.wal_path.parent.mkdir(parents=True, exist_ok=True)
+            payload = "".join(f"{stat.model_dump_json()}\n" for stat in batch)
+            with self.wal_path.open("a", encoding="utf-8") as fh:
+                fh.write(payload)
+                fh.flush()
+            self._wal_bytes += len(payload)
+            self.bytes_written += len(payload)
+            self._view[1].bulk_upsert(batch)
+            if self._wal_bytes >= self.compact_min_bytes or (
+                self._base_bytes > 0 and self._wal_bytes >= self.compact_ratio * self._base_bytes
+            ):
+                self.compact()
+
+    def evict(self, *, min_rank: float) -> int:
+        with self._lock:
+            base, overlay = self._view
+            before = len(self)
+            stale = base.count_below(min_rank) if base is not None else 0
+            # The overlay is only inspected here: dropping its rows first would let
+            # ``compact`` keep the older base rows they shadow.
+            if not stale and len(overlay) == sum(1 for _ in overlay.iter_ranked(min_rank=min_rank)):
+                return 0
+            # Mapped rows cannot be deleted in place and the log would replay evicted
+            # keys, so fold everything into a new snapshot.
+            self.compact(min_rank=min_rank)
+            return before - len(self)
+
+    def __len__(self) -> int:
+        base, overlay = self._current()
+        if base is None:
+            return len(overlay)
+        return len(base) + sum(1 for stat in overlay.list_stats() if base.find(stat.key) is None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._view = (None, InMemoryPrefixIndexStore(half_life_ms=self.half_life_ms))
+            for target in (self.path, self.wal_path):
+                if target.exists():
+                    target.unlink()
+            self._base_bytes = 0
+            self._wal_bytes = 0
+
+    def compact(self, *, min_rank: float = -math.inf) -> None:
+        """Fold the overlay and its log into a new snapshot and map it.
+
+        Keys ranked below ``min_rank`` are left out of the new snapshot.
+        """
+        with self._lock:
+            base, overlay = self._view
+            rows = [
+                stats_to_row(stat)
+                for stat in overlay.list_stats()
+                if decay_rank(stat, self.half_life_ms) >= min_rank
+            ]
+            if base is not None:
+                rows.extend(
+                    base.row(row)
+                    for row in base.iter_rows()
+                    if base.key(row) not in overlay and -base.rank_entry(row)[0] >= min_rank
+                )
+            self._base_bytes = write_snapshot(self.path, rows, half_life_ms=self.half_life_ms)
+            self.bytes_written += self._base_bytes
+            self._view = (
+                SnapshotReader(self.path),
+                InMemoryPrefixIndexStore(half_life_ms=self.half_life_ms),
+            )
+            if self.wal_path.exists():
+                self.wal_path.unlink()
+            self._wal_bytes = 0
+
+    def _current(self) -> tuple[SnapshotReader | None, InMemoryPrefixIndexStore]:
+        base, overlay = self._view
+        return base, overlay.snapshot()
+
+
+_SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+_SNAPSHOT_SUFFIXES = (".pidx",)
 
 
 def create_store(config: PrefixIndexConfig) -> PrefixIndexStore:
-    """Factory helper selecting the appropriate store."""
-    if config.store_path:
-        return JsonlPrefixIndexStore(path=Path(config.store_path))
-    return InMemoryPrefixIndexStore()
+    """Factory helper selecting the appropriate store.
+
+    ``store_backend="auto"`` keeps everything in memory without a ``store_path``, uses
+    SQLite for ``.sqlite``/``.sqlite3``/``.db`` paths, a binary snapshot for ``.pidx``
+    paths, and JSONL otherwise.
+    """
+    backend = config.store_backend
+    if backend == "memory" or (backend == "auto" and not config.store_path):
+        return InMemoryPrefixIndexStore(half_life_ms=config.decay_half_life_ms)
+    if backend == "columnar":
+        return ColumnarPrefixIndexStore(half_life_ms=config.decay_half_life_ms)
+    if not config.store_path:
+        raise ValueError(f"store_backend={backend!r} requires store_path")
+    path = Path(config.store_path)
+    if backend == "sqlite" or (backend == "auto" and path.suffix in _SQLITE_SUFFIXES):
+        return SqlitePrefixIndexStore(path=path, half_life_ms=config.decay_half_life_ms)
+    if backend == "snapshot" or (backend == "auto" and path.suffix in _SNAPSHOT_SUFFIXES):
+        return SnapshotPrefixIndexStore(
+            path=path,
+            half_life_ms=config.decay_half_life_ms,
+            compact_min_bytes=config.wal_compact_min_bytes,
+            compact_ratio=config.wal_compact_ratio,
+        )
+    return JsonlPrefixIndexStore(
+        path=path,
+        half_life_ms=config.decay_half_life_ms,
+        wal=config.store_wal,
+        compact_min_bytes=config.wal_compact_min_bytes,
+        compact_ratio=config.wal_compact_ratio,
+    )
+
+
+def rollups_path(config: PrefixIndexConfig) -> Path | None:
+    """Sidecar file for the rollups of a persistent store (``index.jsonl.rollups``).
+
+    ``None`` when the store lives in memory, since there is nothing to restore against.
+    """
+    if not config.store_path or config.store_backend in ("memory", "columnar"):
+        return None
+    path = Path(config.store_path)
+    return path.with_name(f"{path.name}.rollups")
+
+
+def create_horizon_store(config: PrefixIndexConfig, half_life_ms: int) -> PrefixIndexStore:
+    """Create the store ranking keys for the extra horizon ``half_life_ms``.
+
+    It uses the same backend as ``create_store(config)``; a persistent ``store_path``
+    ``index.jsonl`` becomes ``index.h<half_life_ms>.jsonl``.
+    """
+    path = config.store_path
+    if path:
+        base = Path(path)
+        path = str(base.with_name(f"{base.stem}.h{half_life_ms}{base.suffix}"))
+    return create_store(
+        config.model_copy(update={"decay_half_life_ms": half_life_ms, "store_path": path})
+    )
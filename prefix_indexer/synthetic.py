@@ -0,0 +1,101 @@
+"""Seeded synthetic KV-cache traces for benchmarks and tests.
+
+Prefix popularity follows a Zipf law, so a few prefixes take most hits and a long tail is
+seen once or twice, as in production session traces. Tenants and models are drawn from
+their own Zipf laws. The same ``TraceSpec`` always yields the same events.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import random
+from collections.abc import Iterator
+from dataclasses import dataclass
+from itertools import accumulate
+from pathlib import Path
+from typing import Any
+
+from .models import PrefixEvent
+
+# Rows drawn per ``random.choices`` call; large enough to amortize the call overhead.
+_DRAW_BATCH = 4_096
+
+
+@dataclass(frozen=True)
+class TraceSpec:
+    """Shape of a synthetic trace.
+
+    ``prefixes`` is the number of distinct prefix ids per ``(tenant, model_id)``, and
+    ``zipf_s`` the Zipf exponent of their popularity (higher is more skewed). Timestamps
+    advance uniformly over ``span_ms`` from ``start_ms``.
+    """
+
+    events: int
+    seed: int = 0
+    tenants: int = 4
+    models: int = 2
+    prefixes: int = 10_000
+    zipf_s: float = 1.1
+    start_ms: int = 1_710_000_000_000
+    span_ms: int = 3_600_000
+    mean_bytes: int = 262_144
+
+
+def _zipf_cumulative(n: int, s: float) -> list[float]:
+    return list(accumulate(1.0 / (rank**s) for rank in range(1, n + 1)))
+
+
+def iter_event_rows(spec: TraceSpec) -> Iterator[dict[str, Any]]:
+    """Yield events as plain dicts (the JSONL record shape) without model validation."""
+    rng = random.Random(spec.seed)
+    tenants = [f"tenant-{i}" for i in range(spec.tenants)]
+    models = [f"model-{i}" for i in range(spec.models)]
+    tenant_weights = _zipf_cumulative(spec.tenants, 1.0)
+    model_weights = _zipf_cumulative(spec.models, 1.0)
+    prefix_weights = _zipf_cumulative(spec.prefixes, spec.zipf_s)
+    prefix_ids = range(spec.prefixes)
+    step = spec.span_ms / max(1, spec.events)
+    emitted = 0
+    while emitted < spec.events:
+        size = min(_DRAW_BATCH, spec.events - emitted)
+        draws = zip(
+            rng.choices(tenants, cum_weights=tenant_weights, k=size),
+            rng.choices(models, cum_weights=model_weights, k=size),
+            rng.choices(prefix_ids, cum_weights=prefix_weights, k=size),
+            strict=True,
+        )
+        for tenant, model_id, prefix in draws:
+            pages = rng.randint(1, 8)
+            page_start = rng.randrange(0, 64)
+            yield {
+                "prefix_id": f"session:{prefix}",
+                "tenant": tenant,
+                "model_id": model_id,
+                "layer": rng.randrange(0, 32),
+                "page_start": page_start,
+                "page_end": page_start + pages - 1,
+                "bytes": int(rng.expovariate(1.0 / spec.mean_bytes)),
+                "latency_ms": round(rng.lognormvariate(1.5, 0.5), 3),
+                "timestamp_ms": spec.start_ms + int(emitted * step),
+            }
+            emitted += 1
+
+
+def generate_events(spec: TraceSpec) -> Iterator[PrefixEvent]:
+    """Yield validated ``PrefixEvent`` objects for ``spec``."""
+    for row in iter_event_rows(spec):
+        yield PrefixEvent.model_validate(row)
+
+
+def write_trace(path: Path, spec: TraceSpec) -> int:
+    """Write ``spec`` as JSONL (gzip-compressed for ``.gz`` paths); returns the event count."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    opener = gzip.open if path.suffix == ".gz" else open
+    written = 0
+    with opener(path, "wt", encoding="utf-8") as fh:
+        for row in iter_event_rows(spec):
+            fh.write(json.dumps(row))
+            fh.write("\n")
+            written += 1
+    return written
@@ -0,0 +1,163 @@
+"""Binary wire formats (MessagePack, Arrow IPC) for ingest bodies and recommendations.
+
+Ingest bodies decode straight into ``EventColumns`` with the same bulk validation as the
+columnar JSONL path, so no pydantic model is built per event. Both formats need optional
+packages (``msgpack``, ``pyarrow``), imported on first use.
+"""
+
+from __future__ import annotations
+
+import importlib
+from collections.abc import Sequence
+from typing import Any
+
+from .columns import EventColumns, columns_from_mapping, columns_from_rows
+from .models import PrefixRecommendation
+from .readers import PARQUET_COLUMNS
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+ARROW_FILE = "application/vnd.apache.arrow.file"
+
+_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+BINARY_MEDIA_TYPES = (MSGPACK, ARROW, ARROW_FILE)
+# ``Accept`` ranges answered by the JSON fallback.
+_JSON_RANGES = (JSON, "application/*", "*/*")
+
+
+def media_type(header: str | None) -> str:
+    """Normalize a ``Content-Type`` value, folding known aliases onto canonical names."""
+    value = (header or "").split(";")[0].strip().lower()
+    return _ALIASES.get(value, value)
+
+
+def negotiate(accept: str | None) -> str:
+    """Pick the reply type with the highest ``q`` weight in ``Accept``, falling back to JSON.
+
+    Ties go to the type listed first; ``q=0`` rules a type out. Wildcard ranges count
+    for JSON.
+    """
+    best, best_weight = JSON, 0.0
+    for part in (accept or "").split(","):
+        candidate = media_type(part)
+        if candidate in _JSON_RANGES:
+            candidate = JSON
+        elif candidate not in BINARY_MEDIA_TYPES:
+            continue
+        weight = _quality(part)
+        if weight > best_weight:
+            best, best_weight = candidate, weight
+    return best
+
+
+def _quality(part: str) -> float:
+    for param in part.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return min(max(float(value), 0.0), 1.0)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def decode_events(body: bytes, content_type: str) -> EventColumns:
+    """Decode a MessagePack or Arrow IPC ingest body into one column batch.
+
+    Invalid rows are dropped and counted in ``EventColumns.rejected``; a body that is
+    not a well-formed payload raises ``ValueError``.
+    """
+    if content_type == MSGPACK:
+        return decode_msgpack(body)
+    if content_type in (ARROW, ARROW_FILE):
+        return decode_arrow(body, file=content_type == ARROW_FILE)
+    raise ValueError(f"Unsupported media type: {content_type}")
+
+
+def decode_msgpack(body: bytes) -> EventColumns:
+    """Decode a MessagePack ingest body.
+
+    Accepts a map of per-field arrays (``{"prefix_id": [...], "tenant": [...], ...}``,
+    the compact form), a ``{"events": [...]}`` map mirroring the JSON body, or a bare
+    array of event maps.
+    """
+    msgpack = _import("msgpack", "MessagePack")
+    try:
+        payload = msgpack.unpackb(body, raw=False)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Malformed MessagePack body: {exc}") from exc
+    if type(payload) is dict and "events" in payload:
+        payload = payload["events"]
+    if type(payload) is list:
+        return columns_from_rows(payload)
+    if type(payload) is dict:
+        return columns_from_mapping(_checked_columns(payload))
+    raise ValueError("MessagePack body must be a map of columns or an array of events")
+
+
+def decode_arrow(body: bytes, *, file: bool = False) -> EventColumns:
+    """Decode an Arrow IPC stream (or, with ``file``, an IPC file) carrying the event columns.
+
+    Dictionary-encoded string columns are accepted; other columns are ignored.
+    """
+    pa = _import("pyarrow", "Arrow IPC")
+    reader = pa.ipc.open_file(pa.py_buffer(body)) if file else pa.ipc.open_stream(body)
+    missing = [name for name in PARQUET_COLUMNS if name not in reader.schema.names]
+    if missing:
+        raise ValueError(f"Arrow body is missing columns: {', '.join(missing)}")
+    table = reader.read_all()
+    return columns_from_mapping({name: table.column(name).to_pylist() for name in PARQUET_COLUMNS})
+
+
+def encode_recommendations(recs: Sequence[PrefixRecommendation], content_type: str) -> bytes:
+    """Serialize recommendations as MessagePack (array of maps) or one Arrow record batch.
+
+    The batch is written in the IPC stream or file format matching ``content_type``.
+
+    The Arrow batch dictionary-encodes ``tenant`` and ``model_id``, so repeated names are
+    sent once.
+    """
+    if content_type == MSGPACK:
+        msgpack = _import("msgpack", "MessagePack")
+        packed: bytes = msgpack.packb([rec.model_dump() for rec in recs])
+        return packed
+    if content_type in (ARROW, ARROW_FILE):
+        pa = _import("pyarrow", "Arrow IPC")
+        batch = pa.record_batch(
+            [
+                pa.array([rec.prefix_id for rec in recs], pa.string()),
+                pa.array([rec.tenant for rec in recs], pa.string()).dictionary_encode(),
+                pa.array([rec.model_id for rec in recs], pa.string()).dictionary_encode(),
+                pa.array([rec.score for rec in recs], pa.float64()),
+                pa.array([rec.hint for rec in recs], pa.string()),
+            ],
+            names=["prefix_id", "tenant", "model_id", "score", "hint"],
+        )
+        sink = pa.BufferOutputStream()
+        new_writer = pa.ipc.new_file if content_type == ARROW_FILE else pa.ipc.new_stream
+        with new_writer(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        encoded: bytes = sink.getvalue().to_pybytes()
+        return encoded
+    raise ValueError(f"Unsupported media type: {content_type}")
+
+
+def _checked_columns(payload: dict[str, Any]) -> dict[str, list[Any]]:
+    missing = [name for name in PARQUET_COLUMNS if type(payload.get(name)) is not list]
+    if missing:
+        raise ValueError(f"MessagePack body is missing columns: {', '.join(missing)}")
+    columns = {name: values for name, values in payload.items() if type(values) is list}
+    if len({len(values) for values in columns.values()}) != 1:
+        raise ValueError("MessagePack columns must all have the same length")
+    return columns
+
+
+def _import(module: str, label: str) -> Any:
+    try:
+        return importlib.import_module(module)
+    except ImportError as exc:  # pragma: no cover - depends on optional extra
+        raise RuntimeError(f"{label} payloads need the optional '{module}' package") from exc
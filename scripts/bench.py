@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""Benchmark the ingest, merge, persistence and ranking hot paths on synthetic traces.
+
+Each size runs every benchmark on the same seeded Zipf trace (``prefix_indexer.synthetic``)
+and keeps the best of ``--repeat`` wall-clock timings. Results are written as JSON; with
+``--baseline`` they are compared against a stored run and the script exits non-zero when
+any benchmark is slower than the baseline by more than ``--tolerance`` or the baseline
+does not exist; only ``--update-baseline`` writes one.
+
+    python scripts/bench.py --sizes 10000 100000 --output results/bench.json
+    python scripts/bench.py --baseline results/bench_baseline.json --update-baseline
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import replace
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+from prefix_indexer.analytics import EventAggregator, merge_stats
+from prefix_indexer.models import PrefixEvent, PrefixIndexConfig, PrefixKey, PrefixStats
+from prefix_indexer.service import PrefixIndexService
+from prefix_indexer.storage import JsonlPrefixIndexStore
+from prefix_indexer.synthetic import TraceSpec, generate_events, write_trace
+
+HALF_LIFE_MS = 3_600_000
+DEFAULT_SIZES = (10_000, 100_000)
+# Regressions smaller than this are timer noise, whatever the ratio.
+MIN_DELTA_S = 0.02
+_AGGREGATE_CHUNK = 100_000
+# Events per commit in the small-batch benchmark.
+_SMALL_BATCH = 10
+
+
+def _best_of(
+    repeat: int, run: Callable[[], object], setup: Callable[[], object] | None = None
+) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _time_aggregate(spec: TraceSpec) -> tuple[float, dict[PrefixKey, PrefixStats]]:
+    # Same work as ``aggregate_events``, fed in chunks so 10^7-event traces fit in memory.
+    aggregator = EventAggregator(half_life_ms=HALF_LIFE_MS)
+    elapsed = 0.0
+    events = generate_events(spec)
+    while chunk := list(islice(events, _AGGREGATE_CHUNK)):
+        start = time.perf_counter()
+        aggregator.update(chunk)
+        elapsed += time.perf_counter() - start
+    start = time.perf_counter()
+    stats = aggregator.stats()
+    return elapsed + time.perf_counter() - start, stats
+
+
+def _time_small_batch(spec: TraceSpec, repeat: int) -> float:
+    """Commit a few events into one partition holding ``spec.events`` keys.
+
+    Copy-on-write commits should cost the batch, not the partition, so this stays flat
+    as the size grows.
+    """
+    service = PrefixIndexService(PrefixIndexConfig(decay_half_life_ms=HALF_LIFE_MS))
+    service.store.bulk_upsert(
+        PrefixStats(
+            prefix_id=f"session:{i}",
+            tenant="tenant-0",
+            model_id="model-0",
+            hit_count=1,
+            total_bytes=spec.mean_bytes,
+            avg_latency_ms=1.0,
+            score=float(spec.mean_bytes),
+            last_seen_ms=spec.start_ms + i * spec.span_ms // spec.events,
+        )
+        for i in range(spec.events)
+    )
+    batches = (
+        [
+            PrefixEvent(
+                prefix_id=f"session:{(round_ * _SMALL_BATCH + i) * 7919 % spec.events}",
+                tenant="tenant-0",
+                model_id="model-0",
+                layer=0,
+                page_start=0,
+                page_end=0,
+                bytes=spec.mean_bytes,
+                latency_ms=1.0,
+                timestamp_ms=spec.start_ms + spec.span_ms + round_,
+            )
+            for i in range(_SMALL_BATCH)
+        ]
+        for round_ in range(repeat)
+    )
+    return _best_of(repeat, lambda: service.ingest_events(next(batches)))
+
+
+def bench_size(spec: TraceSpec, workdir: Path, repeat: int) -> dict[str, float]:
+    """Time every benchmark on one trace; returns seconds keyed by benchmark name."""
+    trace = workdir / f"trace-{spec.events}.jsonl"
+    write_trace(trace, spec)
+    results: dict[str, float] = {}
+
+    results["aggregate_events"] = min(_time_aggregate(spec)[0] for _ in range(repeat))
+
+    # Merge the stats of a second trace over the same keys into those of the first.
+    baseline = list(_time_aggregate(spec)[1].values())
+    updates = list(_time_aggregate(replace(spec, seed=spec.seed + 1))[1].values())
+    results["merge_stats"] = _best_of(
+        repeat, lambda: merge_stats(baseline, updates, half_life_ms=HALF_LIFE_MS)
+    )
+
+    services: list[PrefixIndexService] = []
+
+    def fresh_service() -> None:
+        services[:] = [PrefixIndexService(PrefixIndexConfig(decay_half_life_ms=HALF_LIFE_MS))]
+
+    results["ingest_jsonl"] = _best_of(
+        repeat, lambda: services[0].ingest_jsonl(trace), setup=fresh_service
+    )
+    service = services[0]
+    stats: list[PrefixStats] = service.store.list_stats()
+
+    store_path = workdir / f"index-{spec.events}.jsonl"
+    store = JsonlPrefixIndexStore(path=store_path, half_life_ms=HALF_LIFE_MS)
+    store.bulk_upsert(stats)
+    results["jsonl_flush"] = _best_of(repeat, store._flush)
+    results["jsonl_load"] = _best_of(
+        repeat, lambda: JsonlPrefixIndexStore(path=store_path, half_life_ms=HALF_LIFE_MS).load()
+    )
+
+    results["small_commit_big_partition"] = _time_small_batch(spec, repeat)
+
+    now_ms = spec.start_ms + spec.span_ms
+    results["recommendations_top100"] = _best_of(
+        repeat, lambda: service.recommendations(top_k=100, now_ms=now_ms)
+    )
+    results["recommendations_tenant_top100"] = _best_of(
+        repeat, lambda: service.recommendations(top_k=100, tenant="tenant-0", now_ms=now_ms)
+    )
+    results["keys"] = float(len(stats))
+    return results
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Describe every benchmark slower than ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for size, timings in current["results"].items():
+        reference = baseline.get("results", {}).get(size)
+        if reference is None:
+            continue
+        for name, seconds in timings.items():
+            before = reference.get(name)
+            if name == "keys" or before is None:
+                continue
+            if seconds > before * (1 + tolerance) and seconds - before > MIN_DELTA_S:
+                regressions.append(
+                    f"{name} @ {size} events: {seconds:.4f}s vs {before:.4f}s "
+                    f"(+{(seconds / before - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Events per trace."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--prefixes",
+        type=int,
+        default=None,
+        help="Distinct prefixes per tenant/model (default: events/10).",
+    )
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--models", type=int, default=2)
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--repeat", type=int, default=3, help="Keep the best of this many runs.")
+    parser.add_argument("--output", type=Path, default=None, help="Write results JSON here.")
+    parser.add_argument("--baseline", type=Path, default=None, help="Baseline results JSON.")
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Overwrite --baseline with this run."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown before failing (0.25 = 25%%).",
+    )
+    args = parser.parse_args(argv)
+    if args.baseline is not None and not args.update_baseline and not args.baseline.exists():
+        print(
+            f"No baseline at {args.baseline}; record one with --update-baseline "
+            "(make bench-baseline).",
+            file=sys.stderr,
+        )
+        return 2
+
+    report: dict[str, Any] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": {
+            "seed": args.seed,
+            "tenants": args.tenants,
+            "models": args.models,
+            "prefixes": args.prefixes,
+            "zipf_s": args.zipf_s,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="prefix-bench-") as tmp:
+        for size in args.sizes:
+            spec = TraceSpec(
+                events=size,
+                seed=args.seed,
+                tenants=args.tenants,
+                models=args.models,
+                prefixes=args.prefixes or max(1, size // 10),
+                zipf_s=args.zipf_s,
+            )
+            timings = bench_size(spec, Path(tmp), args.repeat)
+            report["results"][str(size)] = timings
+            for name, seconds in timings.items():
+                if name != "keys":
+                    print(f"{size:>10} {name:<32} {seconds * 1000:10.2f} ms")
+
+    text = json.dumps(report, indent=2) + "\n"
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text)
+    if args.baseline is None:
+        return 0
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(text)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("params") != report["params"]:
+        print("Baseline was recorded with different parameters; rerun with --update-baseline.")
+        return 2
+    regressions = compare(report, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
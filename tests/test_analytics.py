@@ -4,7 +4,15 @@ import time
 
 import pytest
 
-from prefix_indexer.analytics import aggregate_events, merge_stats
+from prefix_indexer.analytics import (
+    EventAggregator,
+    aggregate_events,
+    decay_rank,
+    decayed_score,
+    get_backend,
+    merge_stats,
+)
+from prefix_indexer.columns import EventColumns
 from prefix_indexer.models import PrefixEvent, PrefixStats
 
 
@@ -29,7 +37,7 @@ def test_aggregate_events_groups_by_prefix() -> None:
         _event("pfx-A", now - 500, bytes_=512),
         _event("pfx-B", now - 100, bytes_=256),
     ]
-    result = aggregate_events(events, now_ms=now, half_life_ms=10_000_000)
+    result = aggregate_events(events, half_life_ms=10_000_000)
     assert len(result) == 2
     a_stats = result[("pfx-A", "tenant", "model")]
     assert a_stats.hit_count == 2
@@ -70,3 +78,90 @@ def test_merge_stats_combines_existing() -> None:
     assert stat.total_bytes == 2300
     assert stat.avg_latency_ms < 6.0  # blended downward by faster updates
     assert stat.last_seen_ms == now
+
+
+def test_scores_are_independent_of_batching() -> None:
+    half_life = 60_000
+    events = [_event(f"pfx-{i % 3}", 1_000 + i * 7_000, bytes_=100 + i) for i in range(30)]
+    whole = aggregate_events(events, half_life_ms=half_life)
+
+    merged: dict[tuple[str, str, str], PrefixStats] = {}
+    for start in range(0, len(events), 4):
+        batch = aggregate_events(events[start : start + 4], half_life_ms=half_life)
+        merged = merge_stats(merged.values(), batch.values(), half_life_ms=half_life)
+
+    assert merged.keys() == whole.keys()
+    for key, stat in whole.items():
+        assert merged[key].hit_count == stat.hit_count
+        assert merged[key].last_seen_ms == stat.last_seen_ms
+        assert merged[key].score == pytest.approx(stat.score, rel=1e-9)
+
+
+def test_decay_is_applied_at_read_time() -> None:
+    half_life = 1_000
+    stats = aggregate_events(
+        [_event("old", 1_000, bytes_=4_000), _event("new", 3_000, bytes_=1_000)],
+        half_life_ms=half_life,
+    )
+    old, new = stats[("old", "tenant", "model")], stats[("new", "tenant", "model")]
+    assert old.score == 4_000
+
+    assert decayed_score(old, 3_000, half_life) == pytest.approx(1_000)
+    assert decayed_score(old, 5_000, half_life) == pytest.approx(250)
+    assert decayed_score(new, 5_000, half_life) == pytest.approx(250)
+    assert decay_rank(old, half_life) == pytest.approx(decay_rank(new, half_life))
+
+
+def test_numpy_backend_matches_reference() -> None:
+    pytest.importorskip("numpy")
+    events = [
+        _event(f"pfx-{(i * 7) % 11}", 1_000 + (i * 7919) % 50_000, bytes_=(i * 31) % 4096)
+        for i in range(500)
+    ]
+    reference = EventAggregator(half_life_ms=20_000, backend=get_backend("python"))
+    vectorized = EventAggregator(half_life_ms=20_000, backend=get_backend("numpy"))
+    for start in range(0, len(events), 128):
+        columns = EventColumns.from_events(events[start : start + 128])
+        reference.update_columns(columns)
+        vectorized.update_columns(columns)
+
+    expected, actual = reference.stats(), vectorized.stats()
+    assert actual.keys() == expected.keys()
+    for key, stat in expected.items():
+        got = actual[key]
+        assert (got.hit_count, got.total_bytes, got.last_seen_ms) == (
+            stat.hit_count,
+            stat.total_bytes,
+            stat.last_seen_ms,
+        )
+        assert got.avg_latency_ms == pytest.approx(stat.avg_latency_ms, rel=1e-12)
+        assert got.score == pytest.approx(stat.score, rel=1e-12)
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_horizon_scores_match_single_horizon_passes(backend: str) -> None:
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    events = [_event(f"pfx-{i % 5}", 1_000 + i * 3_000, bytes_=100 + i) for i in range(40)]
+    horizons = (1_000, 600_000)
+    multi = EventAggregator(half_life_ms=60_000, backend=get_backend(backend), horizons=horizons)
+    # Rows, column batches and merged partials all carry the score vector.
+    multi.update(events[:10])
+    multi.update_columns(EventColumns.from_events(events[10:25]))
+    partial = EventAggregator(half_life_ms=60_000, horizons=horizons)
+    partial.update(events[25:])
+    multi.merge(partial)
+
+    for half_life in (60_000, *horizons):
+        expected = aggregate_events(events, half_life_ms=half_life)
+        actual = multi.stats(half_life)
+        assert actual.keys() == expected.keys()
+        for key, stat in expected.items():
+            assert actual[key].score == pytest.approx(stat.score, rel=1e-12)
+            assert actual[key].last_seen_ms == stat.last_seen_ms
+    assert multi.stats() == multi.stats(60_000)
+
+
+def test_get_backend_rejects_unknown_names() -> None:
+    with pytest.raises(ValueError):
+        get_backend("bodo")
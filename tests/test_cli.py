@@ -3,6 +3,8 @@ from __future__ import annotations
 import json
 from pathlib import Path
 
+import pytest
+
 from prefix_indexer import cli
 
 
@@ -30,3 +32,91 @@ def test_cli_ingest_and_dump(tmp_path: Path) -> None:
     assert dump_output == 0
     data = json.loads(store.read_text().splitlines()[0])
     assert data["prefix_id"] == "pfx-1"
+
+
+def test_cli_suggest_filters_by_tenant(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    store = tmp_path / "store.jsonl"
+    events = tmp_path / "events.jsonl"
+    lines = [
+        {"prefix_id": "pfx-1", "tenant": "tenant-a"},
+        {"prefix_id": "pfx-2", "tenant": "tenant-b"},
+    ]
+    events.write_text(
+        "".join(
+            json.dumps(
+                {
+                    **line,
+                    "model_id": "model",
+                    "layer": 0,
+                    "page_start": 0,
+                    "page_end": 0,
+                    "bytes": 128,
+                    "latency_ms": 5.0,
+                    "timestamp_ms": 10,
+                }
+            )
+            + "\n"
+            for line in lines
+        )
+    )
+    assert cli.main(["--store", str(store), "ingest", str(events)]) == 0
+    capsys.readouterr()
+
+    assert cli.main(["--store", str(store), "suggest", "--tenant", "tenant-b"]) == 0
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 1
+    assert output[0].startswith("tenant-b/model/pfx-2")
+
+
+def test_cli_dump_streams_json_and_jsonl(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    store = tmp_path / "store.jsonl"
+    events = tmp_path / "events.jsonl"
+    events.write_text(
+        "".join(
+            json.dumps(
+                {
+                    "prefix_id": f"pfx-{i}",
+                    "tenant": "tenant",
+                    "model_id": "model",
+                    "layer": 0,
+                    "page_start": 0,
+                    "page_end": 0,
+                    "bytes": 128,
+                    "latency_ms": 5.0,
+                    "timestamp_ms": 10,
+                }
+            )
+            + "\n"
+            for i in range(3)
+        )
+    )
+    assert cli.main(["--store", str(store), "ingest", str(events)]) == 0
+    capsys.readouterr()
+
+    assert cli.main(["--store", str(store), "dump"]) == 0
+    records = json.loads(capsys.readouterr().out)
+    assert [r["prefix_id"] for r in records] == ["pfx-0", "pfx-1", "pfx-2"]
+
+    output = tmp_path / "dump.jsonl"
+    assert cli.main(["--store", str(store), "dump", "--jsonl", "--output", str(output)]) == 0
+    assert [json.loads(line) for line in output.read_text().splitlines()] == records
+
+
+def test_cli_profile_reports_stage_timings(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    events = tmp_path / "events.jsonl"
+    events.write_text(
+        '{"prefix_id": "pfx-1", "tenant": "tenant", "model_id": "model", "layer": 0, '
+        '"page_start": 0, "page_end": 0, "bytes": 128, "latency_ms": 5.0, "timestamp_ms": 10}\n'
+    )
+    assert cli.main(["--profile", "ingest", str(events)]) == 0
+    report = capsys.readouterr().err.splitlines()
+    assert report[0].split() == ["stage", "calls", "total_ms", "mean_ms"]
+    assert {line.split()[0] for line in report[1:]} >= {"parse", "merge", "flush"}
+    assert "events_parsed              1" in report
+
+    assert cli.main(["ingest", str(events)]) == 0
+    assert capsys.readouterr().err == ""
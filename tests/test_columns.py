@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from prefix_indexer.analytics import EventAggregator
+from prefix_indexer.columns import EventColumns, decode_jsonl
+from prefix_indexer.models import PrefixEvent
+
+_VALID = {
+    "prefix_id": "pfx-A",
+    "tenant": "tenant",
+    "model_id": "model",
+    "layer": 1,
+    "page_start": 0,
+    "page_end": 2,
+    "bytes": 256,
+    "latency_ms": 3.5,
+    "timestamp_ms": 1_000,
+}
+
+
+def _line(**overrides: object) -> str:
+    return json.dumps({**_VALID, **overrides})
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"prefix_id": ""},
+        {"tenant": 7},
+        {"bytes": -1},
+        {"bytes": 1.5},
+        {"page_end": None},
+        {"latency_ms": -0.1},
+    ],
+)
+def test_decode_rejects_what_prefix_event_rejects(overrides: dict[str, object]) -> None:
+    columns = decode_jsonl([_line(), _line(**overrides)])
+    assert len(columns) == 1
+    assert columns.rejected == 1
+    with pytest.raises(ValidationError):
+        PrefixEvent.model_validate_json(_line(**overrides))
+
+
+def test_decode_only_accepts_json_numbers_for_numeric_fields() -> None:
+    # Pydantic's lax mode coerces these; the fast path deliberately does not.
+    columns = decode_jsonl([_line(layer="3"), _line(timestamp_ms=True)])
+    assert len(columns) == 0
+    assert columns.rejected == 2
+
+
+def test_decode_counts_malformed_lines_and_non_objects() -> None:
+    columns = decode_jsonl([_line(), "{not json", "[1, 2]", _line(bytes=2.0)])
+    assert columns.rejected == 2
+    assert columns.bytes == [256, 2]
+    assert all(type(value) is int for value in columns.bytes)
+
+
+def test_columnar_aggregation_matches_event_aggregation() -> None:
+    lines = [
+        _line(prefix_id=f"pfx-{i % 5}", bytes=100 + i, timestamp_ms=1_000 + 37 * i)
+        for i in range(50)
+    ]
+    columnar = EventAggregator(half_life_ms=5_000)
+    columnar.update_columns(decode_jsonl(lines))
+    reference = EventAggregator(half_life_ms=5_000)
+    reference.update(PrefixEvent.model_validate_json(line) for line in lines)
+
+    assert columnar.stats() == reference.stats()
+    assert columnar.events == reference.events == 50
+    events = [PrefixEvent.model_validate_json(line) for line in lines]
+    assert EventColumns.from_events(events).timestamp_ms == [e.timestamp_ms for e in events]
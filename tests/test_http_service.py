@@ -1,9 +1,16 @@
 from __future__ import annotations
 
+import gzip
+import json
+import time
+from collections.abc import Iterator
+
+import pytest
 from fastapi.testclient import TestClient
 
 from prefix_indexer.analytics import aggregate_events
 from prefix_indexer.models import PrefixEvent, PrefixIndexConfig
+from prefix_indexer.readers import DECODE_CHUNK, StreamDecoder
 from prefix_indexer.service_http import create_app
 
 
@@ -67,6 +74,79 @@ def test_health_and_ingest_endpoint() -> None:
     assert body[0]["tenant"] == "tenant-a"
 
 
+def test_suggest_ranks_by_requested_horizon() -> None:
+    config = PrefixIndexConfig(decay_half_life_ms=10_000_000, decay_horizons_ms=[100])
+    client = TestClient(create_app(config))
+    payload = {"events": [event.model_dump() for event in _load_sample_events()]}
+    assert client.post("/ingest", json=payload).status_code == 202
+
+    late = _load_sample_events()[2].model_copy(
+        update={"prefix_id": "sess-C", "bytes": 10, "timestamp_ms": 100_000}
+    )
+    assert client.post("/ingest", json={"events": [late.model_dump()]}).status_code == 202
+
+    default = client.get("/suggest").json()
+    assert [rec["prefix_id"] for rec in default] == ["sess-A", "sess-B", "sess-C"]
+    # With a 100 ms half-life, one late small event outweighs everything older.
+    short = client.get("/suggest", params={"horizon": 100}).json()
+    assert [rec["prefix_id"] for rec in short] == ["sess-C", "sess-A", "sess-B"]
+    assert client.get("/suggest", params={"horizon": 5}).status_code == 400
+
+
+def test_suggest_ranks_by_bytes_in_window() -> None:
+    config = PrefixIndexConfig(decay_half_life_ms=10_000_000, rollup_minutes=30, rollup_hours=6)
+    client = TestClient(create_app(config))
+    now_ms = int(time.time() * 1000)
+    old, recent, _ = _load_sample_events()
+    events = [
+        old.model_copy(update={"bytes": 50_000, "timestamp_ms": now_ms - 2 * 3_600_000}),
+        recent.model_copy(update={"bytes": 10, "timestamp_ms": now_ms - 60_000}),
+    ]
+    assert (
+        client.post("/ingest", json={"events": [e.model_dump() for e in events]}).status_code == 202
+    )
+
+    body = client.get("/suggest", params={"window": "15m"}).json()
+    assert [(rec["prefix_id"], rec["score"]) for rec in body] == [("sess-A", 10.0)]
+    body = client.get("/suggest", params={"window": "4h"}).json()
+    assert [(rec["prefix_id"], rec["score"]) for rec in body] == [("sess-A", 50_010.0)]
+    assert client.get("/suggest", params={"window": str(4 * 3_600_000)}).json() == body
+    for window in ("0", "15x", "m", "2d"):
+        assert client.get("/suggest", params={"window": window}).status_code == 400
+
+
+def test_suggest_windows_end_at_request_time(monkeypatch: pytest.MonkeyPatch) -> None:
+    config = PrefixIndexConfig(decay_half_life_ms=10_000_000, rollup_minutes=30)
+    client = TestClient(create_app(config))
+    now_ms = int(time.time() * 1000) // 60_000 * 60_000 + 30_000
+    monkeypatch.setattr(time, "time", lambda: now_ms / 1000)
+    event = _load_sample_events()[0].model_copy(update={"timestamp_ms": now_ms - 60_000})
+    client.post("/ingest", json={"events": [event.model_dump()]})
+
+    first = client.get("/suggest", params={"window": "5m"})
+    plain = client.get("/suggest")
+    assert [rec["prefix_id"] for rec in first.json()] == ["sess-A"]
+
+    # Within the same end bucket the cached reply still revalidates.
+    monkeypatch.setattr(time, "time", lambda: (now_ms + 20_000) / 1000)
+    same = client.get(
+        "/suggest", params={"window": "5m"}, headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert same.status_code == 304
+
+    # Once the window has slid past the event, polls of the unchanged index see it go.
+    monkeypatch.setattr(time, "time", lambda: (now_ms + 10 * 60_000) / 1000)
+    moved = client.get(
+        "/suggest", params={"window": "5m"}, headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert moved.status_code == 200
+    assert moved.json() == []
+    assert moved.headers["ETag"] != first.headers["ETag"]
+    # Plain polls stay keyed by the generation alone.
+    unchanged = client.get("/suggest", headers={"If-None-Match": plain.headers["ETag"]})
+    assert unchanged.status_code == 304
+
+
 def test_recommendations_match_analytics_direct_computation() -> None:
     config = PrefixIndexConfig(decay_half_life_ms=10_000_000)
     app = create_app(config)
@@ -80,6 +160,317 @@ def test_recommendations_match_analytics_direct_computation() -> None:
     suggestions = client.get("/suggest", params={"top_k": 10}).json()
     suggested_ids = {(rec["tenant"], rec["prefix_id"]) for rec in suggestions}
 
-    aggregate = aggregate_events(events, now_ms=2_500, half_life_ms=config.decay_half_life_ms)
+    aggregate = aggregate_events(events, half_life_ms=config.decay_half_life_ms)
     expected_ids = {(stat.tenant, stat.prefix_id) for stat in aggregate.values()}
     assert suggested_ids == expected_ids
+
+
+def test_suggest_filters_by_tenant_and_model() -> None:
+    app = create_app(PrefixIndexConfig(decay_half_life_ms=10_000_000))
+    client = TestClient(app)
+    client.post("/ingest", json={"events": [e.model_dump() for e in _load_sample_events()]})
+
+    body = client.get("/suggest", params={"tenant": "tenant-b"}).json()
+    assert [(rec["tenant"], rec["prefix_id"]) for rec in body] == [("tenant-b", "sess-B")]
+
+    body = client.get("/suggest", params={"tenant": "tenant-a", "model_id": "model-y"}).json()
+    assert body == []
+
+
+def test_queued_ingest_commits_in_micro_batches() -> None:
+    config = PrefixIndexConfig(
+        decay_half_life_ms=10_000_000,
+        ingest_queue_max_events=100,
+        ingest_batch_max_events=10,
+        ingest_batch_max_delay_ms=5,
+    )
+    events = [e.model_dump() for e in _load_sample_events()]
+    with TestClient(create_app(config)) as client:
+        for event in events:
+            assert client.post("/ingest", json={"events": [event]}).status_code == 202
+        deadline = time.monotonic() + 5
+        while client.get("/ingest/queue").json()["committed_events"] < len(events):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        stats = client.get("/ingest/queue").json()
+        assert stats["depth"] == 0
+        assert stats["batches"] >= 1
+        body = client.get("/suggest").json()
+        assert {rec["prefix_id"] for rec in body} == {"sess-A", "sess-B"}
+
+
+def test_full_ingest_queue_applies_backpressure() -> None:
+    config = PrefixIndexConfig(
+        decay_half_life_ms=10_000_000,
+        ingest_queue_max_events=2,
+        ingest_batch_max_events=1_000,
+        ingest_batch_max_delay_ms=60_000,
+    )
+    events = [e.model_dump() for e in _load_sample_events()]
+    app = create_app(config)
+    with TestClient(app) as client:
+        assert client.post("/ingest", json={"events": events[:2]}).status_code == 202
+        rejected = client.post("/ingest", json={"events": events[2:]})
+        assert rejected.status_code == 429
+        assert rejected.headers["Retry-After"] == "60"
+        assert client.get("/ingest/queue").json()["rejected_requests"] == 1
+
+    # Shutdown drains what was accepted.
+    assert {stat.prefix_id for stat in app.state.api.snapshot()} == {"sess-A"}
+    assert TestClient(app).get("/ingest/queue").status_code == 404
+
+
+def _ndjson_body() -> bytes:
+    lines = [json.dumps(e.model_dump()) for e in _load_sample_events()]
+    lines.insert(1, '{"prefix_id": ""}')
+    return ("\n".join(lines) + "\n").encode()
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip", "zstd"])
+def test_ingest_stream_aggregates_ndjson_body(encoding: str) -> None:
+    body = _ndjson_body()
+    if encoding == "gzip":
+        body = gzip.compress(body[:100]) + gzip.compress(body[100:])
+    elif encoding == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        body = zstandard.ZstdCompressor().compress(body)
+
+    def pieces() -> Iterator[bytes]:
+        # Small uneven chunks split lines and compressed frames mid-way.
+        for start in range(0, len(body), 37):
+            yield body[start : start + 37]
+
+    client = TestClient(create_app(PrefixIndexConfig(decay_half_life_ms=10_000_000)))
+    resp = client.post(
+        "/ingest/stream",
+        content=pieces(),
+        headers={"content-type": "application/x-ndjson", "content-encoding": encoding},
+    )
+    assert resp.status_code == 202
+    assert resp.json() == {"accepted": 3, "rejected": 1, "keys": 2}
+    suggested = {rec["prefix_id"] for rec in client.get("/suggest").json()}
+    assert suggested == {"sess-A", "sess-B"}
+
+
+def test_ingest_stream_rejects_bad_encodings() -> None:
+    client = TestClient(create_app())
+    headers = {"content-type": "application/x-ndjson"}
+    resp = client.post(
+        "/ingest/stream", content=b"{}", headers={**headers, "content-encoding": "br"}
+    )
+    assert resp.status_code == 415
+    resp = client.post(
+        "/ingest/stream",
+        content=gzip.compress(_ndjson_body())[:-8],
+        headers={**headers, "content-encoding": "gzip"},
+    )
+    assert resp.status_code == 400
+    assert client.post("/ingest/stream", content=b"{}").status_code == 415
+    assert client.get("/snapshot").json() == []
+
+
+def test_ingest_stream_inflates_in_bounded_pieces_and_caps_line_length() -> None:
+    # 32 MiB compress to a few KiB; they must never be inflated at once.
+    bomb = gzip.compress(b" " * (32 << 20))
+    decoder = StreamDecoder("gzip")
+    pieces = [len(piece) for piece in decoder.decode(bomb)]
+    assert sum(pieces) == 32 << 20
+    assert max(pieces) <= DECODE_CHUNK
+    decoder.close()
+
+    config = PrefixIndexConfig(decay_half_life_ms=10_000_000, ingest_max_line_bytes=1_024)
+    client = TestClient(create_app(config))
+    headers = {"content-type": "application/x-ndjson", "content-encoding": "gzip"}
+    body = gzip.compress(b"\n" * (1 << 20) + _ndjson_body())
+    resp = client.post("/ingest/stream", content=body, headers=headers)
+    assert resp.status_code == 202
+    assert resp.json() == {"accepted": 3, "rejected": 1, "keys": 2}
+
+    # A body without newlines is rejected once its pending line passes the limit.
+    for body in (b"x" * 4_096, _ndjson_body() + b"{" + b" " * 2_000 + b"}\n"):
+        resp = client.post("/ingest/stream", content=gzip.compress(body), headers=headers)
+        assert resp.status_code == 413
+    assert len(client.get("/snapshot").json()) == 2
+
+
+def test_suggest_and_snapshot_honor_etags(monkeypatch: pytest.MonkeyPatch) -> None:
+    app = create_app(PrefixIndexConfig(decay_half_life_ms=10_000_000))
+    client = TestClient(app)
+    events = [e.model_dump() for e in _load_sample_events()]
+    client.post("/ingest", json={"events": events[:2]})
+
+    for path in ("/suggest?top_k=5", "/snapshot"):
+        first = client.get(path)
+        etag = first.headers["ETag"]
+        assert client.get(path).content == first.content
+        unchanged = client.get(path, headers={"If-None-Match": f'W/{etag}, "other"'})
+        assert unchanged.status_code == 304
+        assert unchanged.content == b""
+        assert unchanged.headers["ETag"] == etag
+
+    # Polls of an unchanged index revalidate however much time has passed, even once
+    # the cached body is gone.
+    first = client.get("/suggest?top_k=5")
+    etag = first.headers["ETag"]
+    app.state.response_cache._entries.clear()
+    clock = time.time() + 3_600
+    monkeypatch.setattr(time, "time", lambda: clock)
+    later = client.get("/suggest?top_k=5", headers={"If-None-Match": etag})
+    assert later.status_code == 304
+    rebuilt = client.get("/suggest?top_k=5")
+    assert rebuilt.content == first.content
+    assert rebuilt.headers["X-Scores-As-Of"] == first.headers["X-Scores-As-Of"]
+
+    generation = app.state.api.generation
+    client.post("/ingest", json={"events": events[2:]})
+    assert app.state.api.generation == generation + 1
+    changed = client.get("/suggest?top_k=5", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+
+
+def test_response_cache_can_be_disabled() -> None:
+    client = TestClient(create_app(PrefixIndexConfig(response_cache_entries=0)))
+    resp = client.get("/suggest")
+    assert resp.json() == []
+    assert "ETag" not in resp.headers
+
+
+def test_snapshot_paginates_and_streams_ndjson() -> None:
+    client = TestClient(create_app(PrefixIndexConfig(decay_half_life_ms=10_000_000)))
+    events = [
+        {**e.model_dump(), "prefix_id": f"sess-{i}"}
+        for i, e in enumerate(_load_sample_events() * 3)
+    ]
+    client.post("/ingest", json={"events": events})
+    full = client.get("/snapshot").json()
+    assert [r["tenant"] for r in full] == sorted(r["tenant"] for r in full)
+
+    pages: list[dict[str, object]] = []
+    cursor: str | None = None
+    while True:
+        params: dict[str, str | int] = {"limit": 4}
+        if cursor is not None:
+            params["cursor"] = cursor
+        resp = client.get("/snapshot", params=params)
+        pages.extend(resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert pages == full
+
+    streamed = client.get("/snapshot", headers={"Accept": "application/x-ndjson"})
+    assert streamed.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in streamed.text.splitlines()] == full
+    assert client.get("/snapshot", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_changes_endpoint_returns_delta_since_generation() -> None:
+    app = create_app(PrefixIndexConfig(decay_half_life_ms=10_000_000))
+    client = TestClient(app)
+    events = [e.model_dump() for e in _load_sample_events()]
+    client.post("/ingest", json={"events": events[2:]})
+    first = client.get("/changes", params={"since": 0}).json()
+    assert [r["prefix_id"] for r in first["changed"]] == ["sess-B"]
+
+    client.post("/ingest", json={"events": events[:2]})
+    params = {"since": first["generation"], "epoch": first["epoch"], "top_k": 1}
+    delta = client.get("/changes", params=params).json()
+    assert delta["generation"] == first["generation"] + 1
+    assert [r["prefix_id"] for r in delta["changed"]] == ["sess-A"]
+    assert delta["evicted"] == [["sess-B", "tenant-b", "model-y"]]
+    assert client.get("/changes").status_code == 422
+
+
+def test_ingest_and_suggest_speak_msgpack() -> None:
+    msgpack = pytest.importorskip("msgpack")
+    client = TestClient(create_app(PrefixIndexConfig(decay_half_life_ms=10_000_000)))
+    events = [e.model_dump() for e in _load_sample_events()]
+    columns = {name: [e[name] for e in events] for name in events[0]}
+    columns["prefix_id"].append("")
+    for name in columns:
+        if name != "prefix_id":
+            columns[name].append(columns[name][0])
+
+    resp = client.post(
+        "/ingest", content=msgpack.packb(columns), headers={"content-type": "application/msgpack"}
+    )
+    assert resp.status_code == 202
+    assert resp.json() == {"ingested": 3}
+
+    packed = client.get("/suggest", headers={"Accept": "application/msgpack"})
+    assert packed.headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(packed.content) == client.get("/suggest").json()
+
+    # ``q`` weights rank the listed types; ties keep the order they were listed in.
+    for accept, expected in [
+        ("application/json, application/msgpack;q=0.1", "application/json"),
+        ("application/json;q=0.5, application/msgpack", "application/msgpack"),
+        ("*/*;q=0.2, application/msgpack;q=0.9", "application/msgpack"),
+        ("application/msgpack;q=0", "application/json"),
+    ]:
+        resp = client.get("/suggest", headers={"Accept": accept})
+        assert resp.headers["content-type"].split(";")[0] == expected
+
+    bad = client.post("/ingest", content=b"\xc1", headers={"content-type": "application/x-msgpack"})
+    assert bad.status_code == 400
+    assert client.post("/ingest", json={"events": [{"prefix_id": ""}]}).status_code == 422
+
+
+def test_ingest_and_suggest_speak_arrow_ipc() -> None:
+    pa = pytest.importorskip("pyarrow")
+    client = TestClient(create_app(PrefixIndexConfig(decay_half_life_ms=10_000_000)))
+    events = [e.model_dump() for e in _load_sample_events()]
+    table = pa.table({name: [e[name] for e in events] for name in events[0]})
+    table = table.set_column(1, "tenant", table.column("tenant").dictionary_encode())
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=2)
+
+    media_type = "application/vnd.apache.arrow.stream"
+    resp = client.post(
+        "/ingest", content=sink.getvalue().to_pybytes(), headers={"content-type": media_type}
+    )
+    assert resp.json() == {"ingested": 3}
+
+    arrow = client.get("/suggest", headers={"Accept": media_type})
+    assert arrow.headers["content-type"] == media_type
+    rows = pa.ipc.open_stream(arrow.content).read_all().to_pylist()
+    assert rows == client.get("/suggest").json()
+
+    # The IPC file format is read and written as files, not folded onto the stream type.
+    file_type = "application/vnd.apache.arrow.file"
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=2)
+    resp = client.post(
+        "/ingest", content=sink.getvalue().to_pybytes(), headers={"content-type": file_type}
+    )
+    assert resp.json() == {"ingested": 3}
+    arrow = client.get("/suggest", headers={"Accept": file_type})
+    assert arrow.headers["content-type"] == file_type
+    rows = pa.ipc.open_file(pa.py_buffer(arrow.content)).read_all().to_pylist()
+    assert rows == client.get("/suggest").json()
+
+
+def test_metrics_endpoint_serves_prometheus_text() -> None:
+    client = TestClient(create_app(PrefixIndexConfig()))
+    assert client.get("/metrics").status_code == 404
+
+    config = PrefixIndexConfig(metrics_enabled=True, ingest_queue_max_events=100)
+    with TestClient(create_app(config)) as client:
+        payload = {"events": [event.model_dump() for event in _load_sample_events()]}
+        assert client.post("/ingest", json=payload).status_code == 202
+        while client.get("/ingest/queue").json()["committed_events"] < len(payload["events"]):
+            time.sleep(0.01)
+        assert client.get("/suggest").status_code == 200
+        resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = resp.text.splitlines()
+    assert "# TYPE prefix_index_stage_duration_seconds histogram" in lines
+    assert 'prefix_index_stage_duration_seconds_count{stage="suggest"} 1' in lines
+    assert "prefix_index_events_parsed_total 3" in lines
+    assert "prefix_index_store_keys 2" in lines
+    assert "prefix_index_ingest_queue_depth 0" in lines
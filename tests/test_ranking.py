@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import math
+
+from prefix_indexer.analytics import decay_rank, rank_floor
+from prefix_indexer.models import PrefixIndexConfig, PrefixStats
+from prefix_indexer.ranking import PartitionedRanking, RankingIndex, rank_entry
+from prefix_indexer.service import PrefixIndexService
+from prefix_indexer.storage import InMemoryPrefixIndexStore
+
+
+def _stat(prefix: str, score: float, last_seen_ms: int = 0, hits: int = 1) -> PrefixStats:
+    return PrefixStats(
+        prefix_id=prefix,
+        tenant="tenant",
+        model_id="model",
+        hit_count=hits,
+        total_bytes=100,
+        avg_latency_ms=1.0,
+        score=score,
+        last_seen_ms=last_seen_ms,
+    )
+
+
+def _prefixes(index: RankingIndex, min_rank: float = -math.inf) -> list[str]:
+    return [key[0] for key in index.iter_keys(min_rank=min_rank)]
+
+
+def test_ranking_index_tracks_updates() -> None:
+    index = RankingIndex(half_life_ms=1_000)
+    index.upsert([_stat("a", 10.0), _stat("b", 30.0), _stat("c", 20.0)])
+    assert _prefixes(index) == ["b", "c", "a"]
+
+    # Single-key updates take the incremental path.
+    index.upsert([_stat("a", 5.0, last_seen_ms=3_000)])
+    assert _prefixes(index) == ["a", "b", "c"]
+
+    index.discard(("b", "tenant", "model"))
+    assert _prefixes(index) == ["a", "c"]
+    assert len(index) == 2
+
+
+def test_ranking_index_ties_and_zero_scores() -> None:
+    index = RankingIndex(half_life_ms=1_000)
+    index.upsert(
+        [_stat("zero", 0.0, hits=9), _stat("few", 1.0, hits=1), _stat("many", 1.0, hits=3)]
+    )
+    assert _prefixes(index) == ["many", "few", "zero"]
+
+
+def test_ranking_index_min_rank_cut_matches_linear_scan() -> None:
+    half_life = 1_000
+    stats = [_stat(f"p{i}", float(i + 1), last_seen_ms=i * 250) for i in range(200)]
+    index = RankingIndex(half_life_ms=half_life)
+    index.upsert(stats)
+
+    floor = rank_floor(50.0, 60_000, half_life)
+    expected = sorted(
+        (s for s in stats if decay_rank(s, half_life) >= floor),
+        key=lambda s: decay_rank(s, half_life),
+        reverse=True,
+    )
+    assert _prefixes(index, floor) == [s.prefix_id for s in expected]
+
+
+def test_recommendations_apply_min_score_and_top_k() -> None:
+    store = InMemoryPrefixIndexStore(half_life_ms=1_000)
+    store.bulk_upsert([_stat("a", 400.0, 2_000), _stat("b", 100.0, 2_000), _stat("c", 50.0)])
+    service = PrefixIndexService(PrefixIndexConfig(decay_half_life_ms=1_000), store=store)
+
+    recs = service.recommendations(top_k=5, min_score=60.0, now_ms=3_000)
+    assert [rec.prefix_id for rec in recs] == ["a"]
+    assert recs[0].score == 200.0
+
+    recs = service.recommendations(top_k=2, min_score=0.0, now_ms=3_000)
+    assert [rec.prefix_id for rec in recs] == ["a", "b"]
+
+
+def test_partitioned_ranking_reads_only_selected_partitions() -> None:
+    def stat(prefix: str, tenant: str, model_id: str, score: float) -> PrefixStats:
+        return _stat(prefix, score).model_copy(update={"tenant": tenant, "model_id": model_id})
+
+    ranking = PartitionedRanking(half_life_ms=1_000)
+    ranking.upsert(
+        [
+            stat("a", "t1", "m1", 1.0),
+            stat("b", "t1", "m2", 4.0),
+            stat("c", "t2", "m1", 3.0),
+            stat("d", "t1", "m1", 2.0),
+        ]
+    )
+
+    assert [key[0] for key in ranking.iter_keys()] == ["b", "c", "d", "a"]
+    assert [key[0] for key in ranking.iter_keys(tenant="t1")] == ["b", "d", "a"]
+    assert [key[0] for key in ranking.iter_keys(model_id="m1")] == ["c", "d", "a"]
+    assert [key[0] for key in ranking.iter_keys(tenant="t1", model_id="m1")] == ["d", "a"]
+    assert list(ranking.iter_keys(tenant="missing")) == []
+
+    ranking.discard(("b", "t1", "m2"))
+    assert [key[0] for key in ranking.iter_keys(tenant="t1")] == ["d", "a"]
+    assert len(ranking) == 3
+
+
+def test_ranking_index_copies_share_untouched_blocks_and_shards() -> None:
+    half_life = 1_000
+    index = RankingIndex(half_life_ms=half_life)
+    reference: dict[str, PrefixStats] = {}
+    versions: list[tuple[RankingIndex, list[str]]] = []
+    for round_ in range(150):
+        # Small batches take the incremental path and grow the index past several blocks.
+        batch = [
+            _stat(f"p{(round_ * 37 + i * 11) % 2_500}", float(i + 1), last_seen_ms=round_ * 10)
+            for i in range(20)
+        ]
+        index = index.copy()
+        index.upsert(batch)
+        reference.update((stat.prefix_id, stat) for stat in batch)
+        if round_ % 30 == 0:
+            index.discard(("p0", "tenant", "model"))
+            reference.pop("p0", None)
+        expected = sorted(reference.values(), key=lambda s: rank_entry(s, half_life))
+        versions.append((index, [s.prefix_id for s in expected]))
+
+    # Every published version still reads exactly as it did when it was written.
+    for version, expected_ids in versions:
+        assert _prefixes(version) == expected_ids
+        assert len(version) == len(expected_ids)
+    latest, expected_ids = versions[-1]
+    assert latest.get(("p5", "tenant", "model")) == reference["p5"]
+    floor = -latest.entry(reference[expected_ids[100]])[0]
+    assert _prefixes(latest, floor) == expected_ids[:101]
+
+    trimmed = latest.copy()
+    assert trimmed.evict(min_rank=floor) == len(expected_ids) - 101
+    assert _prefixes(trimmed) == expected_ids[:101]
+    assert _prefixes(latest) == expected_ids
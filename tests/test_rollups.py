@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import pytest
+
+from prefix_indexer.rollups import HOUR_MS, MINUTE_MS, RollupIndex, TimeRing
+
+
+def test_time_ring_drops_buckets_it_no_longer_retains() -> None:
+    ring = TimeRing(3)
+    ring.add(0, 1)
+    ring.add(1, 2)
+    ring.add(5, 4)
+    assert ring.total(0, 5) == (4, 1)
+    ring.add(3, 8)
+    ring.add(2, 16)
+    assert ring.total(0, 5) == (12, 2)
+    assert ring.total(4, 4) == (0, 0)
+
+    # Merging partial rings equals counting every event in one ring.
+    left, right, whole = TimeRing(3), TimeRing(3), TimeRing(3)
+    for bucket, bytes_ in [(0, 1), (2, 2), (3, 4), (6, 8), (7, 16)]:
+        (left if bucket % 2 else right).add(bucket, bytes_)
+        whole.add(bucket, bytes_)
+    left.merge(right)
+    assert left.head == whole.head == 7
+    assert left.total(0, 7) == whole.total(0, 7) == (24, 2)
+
+
+def test_rollup_index_answers_windows_from_the_finest_covering_ring() -> None:
+    index = RollupIndex(60, 4)
+    for minute in range(10):
+        index.add("pfx-old", "t", "m", minute * MINUTE_MS, 10_000)
+    index.add("pfx-mid", "t", "m", HOUR_MS + 5 * MINUTE_MS, 3_000)
+    index.add("pfx-new", "t", "m", 2 * HOUR_MS + 30 * MINUTE_MS, 500)
+    end_ms = 2 * HOUR_MS + 40 * MINUTE_MS
+
+    assert index.resolution(15 * MINUTE_MS, end_ms)[0] == MINUTE_MS
+    assert index.top(15 * MINUTE_MS, end_ms=end_ms, limit=10) == [(("pfx-new", "t", "m"), 500, 1)]
+    assert index.resolution(2 * HOUR_MS, end_ms)[0] == HOUR_MS
+    top = index.top(3 * HOUR_MS, end_ms=end_ms, limit=2)
+    assert [(key[0], total) for key, total, _ in top] == [("pfx-old", 100_000), ("pfx-mid", 3_000)]
+    with pytest.raises(ValueError, match="retained rollups"):
+        index.resolution(5 * HOUR_MS, end_ms)
+
+
+def test_rollup_index_merge_is_copy_on_write_and_prunes_cold_keys() -> None:
+    index = RollupIndex(2, 0)
+    recent = RollupIndex(2, 0)
+    recent.add("pfx-hot", "t", "m", 10 * MINUTE_MS, 1)
+    index.merge(recent)
+    before = list(index.window_totals(MINUTE_MS, end_ms=10 * MINUTE_MS))
+
+    stale = RollupIndex(2, 0)
+    for i in range(1_100):
+        stale.add(f"pfx-{i}", "t", "m", 0, 1)
+    stale.add("pfx-hot", "t", "m", 10 * MINUTE_MS, 2)
+    index.merge(stale)
+    # Keys whose newest event is older than every ring's retention are dropped.
+    assert len(index) == 1
+    assert before == [(("pfx-hot", "t", "m"), 1, 1)]
+    assert list(index.window_totals(MINUTE_MS, end_ms=10 * MINUTE_MS)) == [
+        (("pfx-hot", "t", "m"), 3, 2)
+    ]
+
+
+def test_rollup_index_merge_clones_only_the_shards_it_touches() -> None:
+    index = RollupIndex(2, 0)
+    bulk = RollupIndex(2, 0)
+    for i in range(5_000):
+        bulk.add(f"pfx-{i}", "t", "m", MINUTE_MS, 1)
+    index.merge(bulk)
+    before = index._partitions[("t", "m")]
+    assert len(before.shards) > 1
+
+    batch = RollupIndex(2, 0)
+    batch.add("pfx-7", "t", "m", MINUTE_MS, 2)
+    index.merge(batch)
+    after = index._partitions[("t", "m")]
+    changed = [old is not new for old, new in zip(before.shards, after.shards, strict=True)]
+    assert sum(changed) == 1
+    totals = {key[0]: total for key, total, _ in index.window_totals(MINUTE_MS, end_ms=MINUTE_MS)}
+    assert totals["pfx-7"] == 3 and totals["pfx-8"] == 1
+    # The previously published partition still holds the old totals.
+    old_minutes = (rollup.minutes for _, rollup in before.items())
+    assert sum(ring.total(1, 1)[0] for ring in old_minutes if ring is not None) == 5_000
@@ -1,9 +1,19 @@
 from __future__ import annotations
 
+import gzip
+import json
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pytest
+from pydantic import ValidationError
+
 from prefix_indexer.api import PrefixIndexAPI
-from prefix_indexer.models import PrefixEvent, PrefixIndexConfig
+from prefix_indexer.models import PrefixEvent, PrefixIndexConfig, PrefixKey, PrefixStats
+from prefix_indexer.service import PrefixIndexService
+from prefix_indexer.storage import InMemoryPrefixIndexStore
 
 
 def test_service_ingest_and_recommendations(tmp_path: Path) -> None:
@@ -52,3 +62,491 @@ def test_service_ingest_and_recommendations(tmp_path: Path) -> None:
     )
     recs2 = api2.recommendations(top_k=1)
     assert recs2[0].prefix_id == recs[0].prefix_id
+
+
+def test_ingest_only_touches_keys_in_batch() -> None:
+    class RecordingStore(InMemoryPrefixIndexStore):
+        def __init__(self) -> None:
+            super().__init__()
+            self.upserted: list[list[str]] = []
+
+        def bulk_upsert(self, stats: Iterable[PrefixStats]) -> None:
+            batch = list(stats)
+            self.upserted.append(sorted(stat.prefix_id for stat in batch))
+            super().bulk_upsert(batch)
+
+    def event(prefix: str, bytes_: int) -> PrefixEvent:
+        return PrefixEvent(
+            prefix_id=prefix,
+            tenant="tenant-a",
+            model_id="model-x",
+            layer=0,
+            page_start=0,
+            page_end=0,
+            bytes=bytes_,
+            latency_ms=1.0,
+            timestamp_ms=1000,
+        )
+
+    store = RecordingStore()
+    service = PrefixIndexService(PrefixIndexConfig(), store=store)
+    service.ingest_events([event("pfx-A", 10), event("pfx-B", 20)])
+    service.ingest_events([event("pfx-A", 30)])
+
+    assert store.upserted == [["pfx-A", "pfx-B"], ["pfx-A"]]
+    stats = store.get_many([("pfx-A", "tenant-a", "model-x"), ("pfx-C", "tenant-a", "model-x")])
+    assert list(stats) == [("pfx-A", "tenant-a", "model-x")]
+    assert stats[("pfx-A", "tenant-a", "model-x")].hit_count == 2
+
+
+def test_concurrent_ingests_do_not_lose_updates() -> None:
+    class SlowReadStore(InMemoryPrefixIndexStore):
+        # Widens the read-modify-write window so unserialized commits would interleave.
+        def get_many(self, keys: Iterable[PrefixKey]) -> dict[PrefixKey, PrefixStats]:
+            found = super().get_many(keys)
+            time.sleep(0.001)
+            return found
+
+    event = PrefixEvent(
+        prefix_id="pfx-A",
+        tenant="tenant-a",
+        model_id="model-x",
+        layer=0,
+        page_start=0,
+        page_end=0,
+        bytes=10,
+        latency_ms=1.0,
+        timestamp_ms=1000,
+    )
+    service = PrefixIndexService(PrefixIndexConfig(), store=SlowReadStore())
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: service.ingest_events([event]), range(64)))
+
+    (stat,) = service.export_snapshot()
+    assert stat.hit_count == 64
+    assert stat.total_bytes == 640
+
+
+def _trace_line(prefix: str, bytes_: int, timestamp_ms: int) -> str:
+    event = PrefixEvent(
+        prefix_id=prefix,
+        tenant="tenant-a",
+        model_id="model-x",
+        layer=0,
+        page_start=0,
+        page_end=0,
+        bytes=bytes_,
+        latency_ms=1.0,
+        timestamp_ms=timestamp_ms,
+    )
+    return event.model_dump_json() + "\n"
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+def test_ingest_jsonl_streams_chunks_and_compressed_input(tmp_path: Path, compression: str) -> None:
+    payload = "".join(_trace_line(f"pfx-{i % 4}", 100, 1_000 + i) for i in range(25)).encode()
+    path = tmp_path / "trace.jsonl"
+    if compression == "gzip":
+        path.write_bytes(gzip.compress(payload))
+    elif compression == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        path.write_bytes(zstandard.ZstdCompressor().compress(payload))
+    else:
+        path.write_bytes(payload)
+
+    service = PrefixIndexService(PrefixIndexConfig(ingest_chunk_size=3))
+    service.ingest_jsonl(path)
+
+    stats = {stat.prefix_id: stat for stat in service.export_snapshot()}
+    assert sorted(stats) == ["pfx-0", "pfx-1", "pfx-2", "pfx-3"]
+    assert sum(stat.hit_count for stat in stats.values()) == 25
+    assert stats["pfx-0"].last_seen_ms == 1_024
+
+
+def test_ingest_jsonl_reports_invalid_rows(tmp_path: Path) -> None:
+    path = tmp_path / "trace.jsonl"
+    path.write_text(
+        _trace_line("pfx-A", 10, 1_000)
+        + '{"prefix_id": "", "tenant": "t"}\n'
+        + "not json\n"
+        + _trace_line("pfx-A", 20, 2_000)
+    )
+    service = PrefixIndexService(PrefixIndexConfig())
+    report = service.ingest_jsonl(path)
+    assert (report.accepted, report.rejected, report.keys) == (2, 2, 1)
+
+    strict = PrefixIndexService(PrefixIndexConfig(ingest_decoder="pydantic"))
+    with pytest.raises(ValidationError):
+        strict.ingest_jsonl(path)
+
+
+def test_metrics_time_each_stage_only_when_enabled(tmp_path: Path) -> None:
+    path = tmp_path / "trace.jsonl"
+    path.write_text(
+        _trace_line("pfx-A", 10, 1_000) + "not json\n" + _trace_line("pfx-B", 20, 2_000)
+    )
+    store = tmp_path / "index.jsonl"
+
+    quiet = PrefixIndexService(PrefixIndexConfig())
+    quiet.ingest_jsonl(path)
+    quiet.recommendations(now_ms=2_000)
+    assert quiet.metrics.stage_totals() == {}
+    assert set(quiet.metrics.counters().values()) == {0}
+
+    service = PrefixIndexService(PrefixIndexConfig(metrics_enabled=True, store_path=str(store)))
+    service.ingest_jsonl(path)
+    service.recommendations(now_ms=2_000)
+    assert set(service.metrics.stage_totals()) == {
+        "parse",
+        "aggregate",
+        "merge",
+        "flush",
+        "suggest",
+    }
+    assert service.metrics.counters() == {
+        "events_parsed": 2,
+        "events_rejected": 1,
+        "keys_touched": 2,
+        "commits": 1,
+    }
+    text = service.metrics.render()
+    assert 'prefix_index_stage_duration_seconds_count{stage="flush"} 1' in text
+    assert 'prefix_index_stage_duration_seconds_bucket{stage="evict",le="+Inf"} 0' in text
+    assert "prefix_index_store_keys 2" in text
+    assert f"prefix_index_store_bytes_written_total {store.stat().st_size}" in text
+
+
+def test_horizons_rank_one_ingest_pass_by_each_half_life(tmp_path: Path) -> None:
+    path = tmp_path / "trace.jsonl"
+    # pfx-old moved many bytes long ago, pfx-new a few bytes just now.
+    path.write_text(
+        "".join(_trace_line("pfx-old", 10_000, 1_000 + i) for i in range(10))
+        + _trace_line("pfx-new", 2_000, 3_600_000)
+    )
+    store = tmp_path / "index.jsonl"
+    config = PrefixIndexConfig(
+        decay_half_life_ms=60_000,
+        decay_horizons_ms=[86_400_000, 60_000],
+        store_path=str(store),
+    )
+    service = PrefixIndexService(config)
+    assert service.horizons == (86_400_000,)
+    service.ingest_jsonl(path)
+
+    now_ms = 3_600_000
+    short = service.recommendations(now_ms=now_ms)
+    long = service.recommendations(now_ms=now_ms, horizon=86_400_000)
+    assert [rec.prefix_id for rec in short] == ["pfx-new", "pfx-old"]
+    assert [rec.prefix_id for rec in long] == ["pfx-old", "pfx-new"]
+    assert service.recommendations(now_ms=now_ms, horizon=60_000) == short
+
+    # Each horizon matches a dedicated single-horizon index over the same trace.
+    dedicated = PrefixIndexService(PrefixIndexConfig(decay_half_life_ms=86_400_000))
+    dedicated.ingest_jsonl(path)
+    assert long == dedicated.recommendations(now_ms=now_ms)
+    with pytest.raises(ValueError, match="Unknown horizon"):
+        service.recommendations(horizon=1_000)
+
+    # Horizon stores persist next to the primary store.
+    assert (tmp_path / "index.h86400000.jsonl").exists()
+    reopened = PrefixIndexService(config)
+    assert reopened.recommendations(now_ms=now_ms, horizon=86_400_000) == long
+
+
+def test_window_recommendations_sum_rollup_buckets(tmp_path: Path) -> None:
+    minute, hour = 60_000, 3_600_000
+    first, second = tmp_path / "first.jsonl", tmp_path / "second.jsonl"
+    first.write_text(
+        "".join(_trace_line("pfx-old", 10_000, i * minute) for i in range(10))
+        + _trace_line("pfx-mid", 3_000, hour + 5 * minute)
+    )
+    second.write_text(
+        _trace_line("pfx-new", 500, 2 * hour + 30 * minute)
+        + _trace_line("pfx-new", 500, 2 * hour + 31 * minute)
+    )
+    config = PrefixIndexConfig(decay_half_life_ms=60_000, rollup_minutes=60, rollup_hours=4)
+    service = PrefixIndexService(config)
+    service.ingest_jsonl(first)
+    service.ingest_jsonl(second)
+
+    now_ms = 2 * hour + 40 * minute
+    recent = service.recommendations(now_ms=now_ms, window_ms=15 * minute)
+    assert [(rec.prefix_id, rec.score) for rec in recent] == [("pfx-new", 1_000.0)]
+    assert recent[0].hint == "window=900000ms bytes=1000 hits=2"
+    two_hours = service.recommendations(now_ms=now_ms, window_ms=2 * hour)
+    assert [rec.prefix_id for rec in two_hours] == ["pfx-mid", "pfx-new"]
+    assert [
+        rec.prefix_id
+        for rec in service.recommendations(now_ms=now_ms, window_ms=2 * hour, min_score=2_000)
+    ] == ["pfx-mid"]
+    assert service.recommendations(now_ms=now_ms, window_ms=hour, tenant="tenant-b") == []
+
+    # Rollups folded in a worker pool match ones built by successive commits.
+    sharded = PrefixIndexService(config)
+    sharded.ingest_paths([first, second], workers=2)
+    for window_ms in (15 * minute, 2 * hour, 3 * hour):
+        assert sharded.recommendations(now_ms=now_ms, window_ms=window_ms) == (
+            service.recommendations(now_ms=now_ms, window_ms=window_ms)
+        )
+
+    with pytest.raises(ValueError, match="retained rollups"):
+        service.recommendations(now_ms=now_ms, window_ms=5 * hour)
+    with pytest.raises(ValueError, match="horizon"):
+        service.recommendations(window_ms=minute, horizon=60_000)
+    with pytest.raises(ValueError, match="rollup_minutes"):
+        PrefixIndexService(PrefixIndexConfig()).recommendations(window_ms=minute)
+
+
+def test_failed_flush_leaves_window_rollups_unchanged(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    minute = 60_000
+    trace = tmp_path / "trace.jsonl"
+    trace.write_text("".join(_trace_line("pfx-a", 100, i * minute) for i in range(5)))
+    service = PrefixIndexService(PrefixIndexConfig(rollup_minutes=60))
+    service.ingest_jsonl(trace)
+    expected = service.recommendations(now_ms=5 * minute, window_ms=10 * minute)
+
+    def fail(stats: Iterable[PrefixStats]) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(service.store, "bulk_upsert", fail)
+    with pytest.raises(OSError):
+        service.ingest_jsonl(trace)
+    assert service.generation == 1
+    assert service.recommendations(now_ms=5 * minute, window_ms=10 * minute) == expected
+
+
+def test_window_rollups_survive_a_clean_restart(tmp_path: Path) -> None:
+    minute = 60_000
+    trace = tmp_path / "trace.jsonl"
+    trace.write_text(
+        "".join(_trace_line(f"pfx-{i % 3}", 100 * (i + 1), i * minute) for i in range(30))
+    )
+    config = PrefixIndexConfig(
+        store_path=str(tmp_path / "index.jsonl"), rollup_minutes=60, rollup_hours=4
+    )
+    service = PrefixIndexService(config)
+    service.ingest_jsonl(trace)
+    expected = service.recommendations(now_ms=30 * minute, window_ms=10 * minute)
+    assert expected
+
+    # Without saved rollups a restart cannot answer windows over earlier traffic.
+    with pytest.raises(ValueError, match="were not saved"):
+        PrefixIndexService(config).recommendations(now_ms=30 * minute, window_ms=10 * minute)
+
+    service.close()
+    sidecar = tmp_path / "index.jsonl.rollups"
+    assert sidecar.exists()
+    restarted = PrefixIndexService(config)
+    assert restarted.recommendations(now_ms=30 * minute, window_ms=10 * minute) == expected
+    # The next commit makes the sidecar stale, so it is removed until the next close.
+    restarted.ingest_jsonl(trace)
+    assert not sidecar.exists()
+    doubled = restarted.recommendations(now_ms=30 * minute, window_ms=10 * minute)
+    assert [rec.score for rec in doubled] == [2 * rec.score for rec in expected]
+
+
+def test_ingest_parquet_projects_columns_and_filters_window(tmp_path: Path) -> None:
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    rows = [json.loads(_trace_line(f"pfx-{i % 3}", 100 + i, 1_000 * i)) for i in range(20)]
+    rows[5]["tenant"] = ""
+    table = pa.Table.from_pylist(rows)
+    path = tmp_path / "trace.parquet"
+    pq.write_table(table, path, row_group_size=4)
+
+    api = PrefixIndexAPI(PrefixIndexConfig(ingest_chunk_size=3))
+    report = api.ingest_file(path, since_ms=4_000, until_ms=12_000)
+    assert (report.accepted, report.rejected) == (7, 1)
+
+    stats = api.snapshot()
+    assert sum(stat.hit_count for stat in stats) == 7
+    assert min(stat.last_seen_ms for stat in stats) >= 9_000
+    assert max(stat.last_seen_ms for stat in stats) == 11_000
+
+    with pytest.raises(ValueError):
+        api.ingest_file(tmp_path / "trace.jsonl", since_ms=0)
+
+
+def test_parallel_sharded_ingest_matches_serial(tmp_path: Path) -> None:
+    shards = tmp_path / "shards"
+    shards.mkdir()
+    for shard in range(5):
+        lines = (
+            _trace_line(f"pfx-{(shard + i) % 6}", 64 * (i + 1), 10_000 * shard + 997 * i)
+            for i in range(40)
+        )
+        (shards / f"collector-{shard}.jsonl").write_text("".join(lines))
+    (shards / "notes.txt").write_text("not a trace\n")
+
+    config = PrefixIndexConfig(decay_half_life_ms=30_000, ingest_chunk_size=16)
+    serial = PrefixIndexAPI(config)
+    parallel = PrefixIndexAPI(config)
+    serial_report = serial.ingest_paths(shards, workers=1)
+    parallel_report = parallel.ingest_paths(str(shards / "*.jsonl"), workers=3)
+
+    assert serial_report == parallel_report
+    assert serial_report.accepted == 200
+    by_key = {stat.key: stat for stat in serial.snapshot()}
+    assert {stat.key: stat for stat in parallel.snapshot()} == by_key
+
+
+def test_changes_feed_reports_churn_and_top_k_evictions() -> None:
+    def events(prefix: str, hits: int) -> list[PrefixEvent]:
+        return [
+            PrefixEvent(
+                prefix_id=prefix,
+                tenant="tenant-a",
+                model_id="model-x",
+                layer=0,
+                page_start=0,
+                page_end=0,
+                bytes=100,
+                latency_ms=1.0,
+                timestamp_ms=1000,
+            )
+        ] * hits
+
+    service = PrefixIndexService(
+        PrefixIndexConfig(decay_half_life_ms=10_000_000, change_log_max_keys=4)
+    )
+    service.ingest_events(events("pfx-A", 3) + events("pfx-B", 2) + events("pfx-C", 1))
+    mirror = service.changes(0, top_k=2, now_ms=1000)
+    assert [r.prefix_id for r in mirror.changed] == ["pfx-A", "pfx-B"]
+    assert not mirror.reset and mirror.evicted == []
+
+    service.ingest_events(events("pfx-C", 4))
+    delta = service.changes(mirror.generation, top_k=2, now_ms=1000)
+    assert [r.prefix_id for r in delta.changed] == ["pfx-C"]
+    assert delta.evicted == [("pfx-B", "tenant-a", "model-x")]
+    assert service.changes(delta.generation, top_k=2).changed == []
+
+    # Updating keys outside the top-k is not reported.
+    service.ingest_events(events("pfx-D", 1))
+    assert service.changes(delta.generation, top_k=2, now_ms=1000).changed == []
+
+    # Generation 0 has been trimmed from the bounded log, so the caller must resync.
+    stale = service.changes(0, top_k=2, now_ms=1000)
+    assert stale.reset
+    assert [r.prefix_id for r in stale.changed] == ["pfx-C", "pfx-A"]
+
+    # Readers do not take the commit lock, and a generation from another process
+    # lifetime resyncs even when the number itself is still covered by the log.
+    with service._commit_lock:
+        current = service.changes(stale.generation, epoch=stale.epoch, top_k=2)
+    assert not current.reset and current.changed == []
+    restarted = service.changes(stale.generation, epoch=stale.epoch - 1, top_k=2)
+    assert restarted.reset
+    assert [r.prefix_id for r in restarted.changed] == ["pfx-C", "pfx-A"]
+
+
+def test_bounded_index_evicts_cold_keys_and_keeps_top_k() -> None:
+    def event(prefix: str, timestamp_ms: int) -> PrefixEvent:
+        return PrefixEvent(
+            prefix_id=prefix,
+            tenant="tenant-a",
+            model_id="model-x",
+            layer=0,
+            page_start=0,
+            page_end=0,
+            bytes=100,
+            latency_ms=1.0,
+            timestamp_ms=timestamp_ms,
+        )
+
+    # A few hot prefixes plus a long tail of one-off session prefixes.
+    batches = [
+        [event(f"hot-{i}", 1_000 * step) for i in range(5) for _ in range(5 - i)]
+        + [event(f"cold-{step}-{j}", 1_000 * step + j) for j in range(20)]
+        for step in range(20)
+    ]
+    config = PrefixIndexConfig(decay_half_life_ms=5_000)
+    bounded = PrefixIndexService(config.model_copy(update={"max_keys": 30, "evict_slack": 0.0}))
+    reference = PrefixIndexService(config)
+    for batch in batches:
+        bounded.ingest_events(batch)
+        reference.ingest_events(batch)
+        assert len(bounded.store) <= 30
+
+    now_ms = 20_000
+    expected = reference.recommendations(top_k=5, now_ms=now_ms)
+    actual = bounded.recommendations(top_k=5, now_ms=now_ms)
+    assert [r.prefix_id for r in actual] == [r.prefix_id for r in expected]
+    bound = bounded.eviction_error(now_ms)
+    assert bounded.evicted == len(reference.store) - len(bounded.store)
+    assert 0 < bound < expected[-1].score
+    for want, got in zip(expected, actual, strict=True):
+        assert want.score - bound <= got.score <= want.score
+
+    # An epsilon floor alone drops keys whose decayed score has faded.
+    faded = PrefixIndexService(config.model_copy(update={"evict_min_score": 20.0}))
+    for batch in batches:
+        faded.ingest_events(batch)
+    assert {s.prefix_id for s in faded.export_snapshot()} >= {f"hot-{i}" for i in range(5)}
+    assert len(faded.store) < len(reference.store)
+
+
+def test_changes_feed_reports_keys_dropped_by_eviction_sweeps() -> None:
+    def event(prefix: str, timestamp_ms: int) -> PrefixEvent:
+        return PrefixEvent(
+            prefix_id=prefix,
+            tenant="tenant-a",
+            model_id="model-x",
+            layer=0,
+            page_start=0,
+            page_end=0,
+            bytes=100,
+            latency_ms=1.0,
+            timestamp_ms=timestamp_ms,
+        )
+
+    # A score floor sweeps out a key that went cold.
+    faded = PrefixIndexService(PrefixIndexConfig(decay_half_life_ms=1_000, evict_min_score=1.0))
+    faded.ingest_events([event("old", 0)] * 4)
+    synced = faded.changes(0, top_k=5, now_ms=0)
+    assert [r.prefix_id for r in synced.changed] == ["old"]
+    faded.ingest_events([event("new", 100_000)])
+    delta = faded.changes(synced.generation, epoch=synced.epoch, top_k=5, now_ms=100_000)
+    assert [r.prefix_id for r in delta.changed] == ["new"]
+    assert delta.evicted == [("old", "tenant-a", "model-x")]
+
+    # A capacity sweep pushes a mirrored key out of the index.
+    bounded = PrefixIndexService(
+        PrefixIndexConfig(decay_half_life_ms=1_000, max_keys=1, evict_slack=0.0)
+    )
+    bounded.ingest_events([event("a", 0)])
+    synced = bounded.changes(0, top_k=5, now_ms=0)
+    bounded.ingest_events([event("b", 10_000)])
+    delta = bounded.changes(synced.generation, epoch=synced.epoch, top_k=5, now_ms=10_000)
+    assert [r.prefix_id for r in delta.changed] == ["b"]
+    assert delta.evicted == [("a", "tenant-a", "model-x")]
+
+
+def test_bounded_columnar_index_releases_ids_of_evicted_keys() -> None:
+    config = PrefixIndexConfig(
+        decay_half_life_ms=5_000, store_backend="columnar", max_keys=100, evict_slack=0.0
+    )
+    service = PrefixIndexService(config)
+    sizes = []
+    for step in range(50):
+        service.ingest_events(
+            PrefixEvent(
+                prefix_id=f"once-{step}-{j}",
+                tenant="tenant-a",
+                model_id="model-x",
+                layer=0,
+                page_start=0,
+                page_end=0,
+                bytes=100,
+                latency_ms=1.0,
+                timestamp_ms=1_000 * step + j,
+            )
+            for j in range(500)
+        )
+        cols, _, _, (_, names) = service.store._view
+        sizes.append((len(names), len(cols["hits"])))
+    assert len(service.store) <= 100
+    # Interned ids and rows of evicted one-shot prefixes are reclaimed, not accumulated.
+    assert max(sizes[25:]) <= max(sizes[:25])
+    assert max(size for size, _ in sizes) < 25_000 // 4
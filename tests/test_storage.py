@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+
+import pytest
+
+from prefix_indexer.analytics import decay_rank
+from prefix_indexer.models import PrefixIndexConfig, PrefixStats
+from prefix_indexer.storage import (
+    ColumnarPrefixIndexStore,
+    InMemoryPrefixIndexStore,
+    JsonlPrefixIndexStore,
+    PrefixIndexStore,
+    SnapshotPrefixIndexStore,
+    SqlitePrefixIndexStore,
+    create_store,
+)
+
+
+def _stat(prefix: str, hits: int = 1, score: float = 100.0) -> PrefixStats:
+    return PrefixStats(
+        prefix_id=prefix,
+        tenant="tenant",
+        model_id="model",
+        hit_count=hits,
+        total_bytes=hits * 100,
+        avg_latency_ms=5.0,
+        score=score,
+        last_seen_ms=1_000,
+    )
+
+
+def _by_prefix(store: JsonlPrefixIndexStore) -> dict[str, PrefixStats]:
+    return {stat.prefix_id: stat for stat in store.list_stats()}
+
+
+def test_wal_appends_deltas_and_replays_on_load(tmp_path: Path) -> None:
+    path = tmp_path / "index.jsonl"
+    store = JsonlPrefixIndexStore(path=path, wal=True, compact_min_bytes=1 << 30)
+    store.bulk_upsert([_stat("pfx-A"), _stat("pfx-B")])
+    store.bulk_upsert([_stat("pfx-A", hits=5)])
+
+    assert not path.exists()
+    assert len(store.wal_path.read_text().splitlines()) == 3
+
+    reloaded = JsonlPrefixIndexStore(path=path, wal=True)
+    reloaded.load()
+    stats = _by_prefix(reloaded)
+    assert stats["pfx-A"].hit_count == 5
+    assert stats["pfx-B"].hit_count == 1
+
+
+def test_wal_compaction_folds_log_into_base(tmp_path: Path) -> None:
+    path = tmp_path / "index.jsonl"
+    store = JsonlPrefixIndexStore(
+        path=path, wal=True, compact_min_bytes=1, background_compaction=True
+    )
+    store.bulk_upsert([_stat("pfx-A"), _stat("pfx-B")])
+    store.wait_for_compaction()
+
+    assert len(path.read_text().splitlines()) == 2
+    assert not store.wal_path.exists()
+
+    reloaded = JsonlPrefixIndexStore(path=path, wal=True)
+    reloaded.load()
+    assert set(_by_prefix(reloaded)) == {"pfx-A", "pfx-B"}
+
+
+def test_wal_recovers_from_torn_tail_and_interrupted_compaction(tmp_path: Path) -> None:
+    path = tmp_path / "index.jsonl"
+    path.write_text(_stat("pfx-A").model_dump_json() + "\n")
+    compacting = path.with_name(f"{path.name}.wal.compacting")
+    compacting.write_text(_stat("pfx-A", hits=2).model_dump_json() + "\n")
+    wal = path.with_name(f"{path.name}.wal")
+    wal.write_text(_stat("pfx-B").model_dump_json() + '\n{"prefix_id": "pfx-')
+
+    store = JsonlPrefixIndexStore(path=path, wal=True, compact_min_bytes=1 << 30)
+    store.load()
+    stats = _by_prefix(store)
+    assert stats["pfx-A"].hit_count == 2
+    assert set(stats) == {"pfx-A", "pfx-B"}
+
+    store.compact()
+    assert not compacting.exists()
+    reloaded = JsonlPrefixIndexStore(path=path)
+    reloaded.load()
+    assert _by_prefix(reloaded)["pfx-A"].hit_count == 2
+
+
+def _ranked_stat(prefix: str, tenant: str, model_id: str, score: float, seen: int) -> PrefixStats:
+    return PrefixStats(
+        prefix_id=prefix,
+        tenant=tenant,
+        model_id=model_id,
+        hit_count=int(score) % 7 + 1,
+        total_bytes=int(score) * 10,
+        avg_latency_ms=1.5,
+        score=score,
+        last_seen_ms=seen,
+    )
+
+
+_CONFORMANCE_STATS = [
+    _ranked_stat(f"pfx-{i}", f"tenant-{i % 3}", f"model-{i % 2}", float(i * 37 % 101), i * 500)
+    for i in range(60)
+]
+
+
+def _make_store(kind: str, tmp_path: Path) -> PrefixIndexStore:
+    config = PrefixIndexConfig(
+        decay_half_life_ms=2_000,
+        store_backend=kind,
+        store_path=None if kind in ("memory", "columnar") else str(tmp_path / f"index.{kind}"),
+    )
+    store = create_store(config)
+    store.load()
+    return store
+
+
+def _assert_matches(store: PrefixIndexStore, reference: InMemoryPrefixIndexStore) -> None:
+    assert sorted(store.list_stats(), key=lambda s: s.key) == sorted(
+        reference.list_stats(), key=lambda s: s.key
+    )
+    keys = [("pfx-3", "tenant-0", "model-1"), ("pfx-3", "tenant-1", "model-1")]
+    assert store.get_many(keys) == reference.get_many(keys)
+    ordered = sorted(reference.list_stats(), key=lambda s: (s.tenant, s.model_id, s.prefix_id))
+    assert list(store.iter_stats()) == ordered
+    for cursor in (ordered[0].key, ordered[len(ordered) // 2].key, ordered[-1].key, keys[1]):
+        position = (cursor[1], cursor[2], cursor[0])
+        expected_keys = [s.key for s in ordered if (s.tenant, s.model_id, s.prefix_id) > position]
+        assert [s.key for s in store.iter_stats(after=cursor)] == expected_keys
+    for filters in (
+        {},
+        {"tenant": "tenant-1"},
+        {"model_id": "model-0"},
+        {"tenant": "tenant-2", "model_id": "model-1"},
+    ):
+        for min_rank in (-math.inf, 20.0):
+            expected = [s.key for s in reference.iter_ranked(min_rank=min_rank, **filters)]
+            actual = [s.key for s in store.iter_ranked(min_rank=min_rank, **filters)]
+            assert actual == expected
+
+
+@pytest.mark.parametrize("kind", ["memory", "columnar", "jsonl", "sqlite", "snapshot"])
+def test_store_conformance(kind: str, tmp_path: Path) -> None:
+    store = _make_store(kind, tmp_path)
+    reference = InMemoryPrefixIndexStore(half_life_ms=2_000)
+    store.bulk_upsert(_CONFORMANCE_STATS[:40])
+    store.bulk_upsert(_CONFORMANCE_STATS[30:])
+    reference.bulk_upsert(_CONFORMANCE_STATS)
+
+    _assert_matches(store, reference)
+    assert len(store) == len(reference) == len(_CONFORMANCE_STATS)
+
+    assert store.evict(min_rank=20.0) == reference.evict(min_rank=20.0) > 0
+    _assert_matches(store, reference)
+    assert len(store) == len(reference)
+    assert store.evict(min_rank=20.0) == 0
+
+    store.clear()
+    assert store.list_stats() == []
+
+
+def test_columnar_store_matches_reference_across_batch_sizes() -> None:
+    stats = [
+        _ranked_stat(f"pfx-{i}", "tenant-1", "model-0", float(i * 13 % 97), i * 40)
+        for i in range(200)
+    ]
+    store = ColumnarPrefixIndexStore(half_life_ms=2_000)
+    reference = InMemoryPrefixIndexStore(half_life_ms=2_000)
+    # One batch large enough to re-sort the partition, then incremental updates.
+    for batch in (stats[:150], stats[150:], [stats[3].model_copy(update={"score": 1e9})]):
+        store.bulk_upsert(batch)
+        reference.bulk_upsert(batch)
+        _assert_matches(store, reference)
+    assert next(store.iter_ranked(tenant="tenant-1")).prefix_id == "pfx-3"
+
+    # Enough rewrites of the same keys to reclaim superseded rows.
+    for round_ in range(25):
+        batch = [stat.model_copy(update={"hit_count": round_ + 1}) for stat in stats]
+        store.bulk_upsert(batch)
+        reference.bulk_upsert(batch)
+    _assert_matches(store, reference)
+
+
+def test_columnar_upserts_leave_the_published_row_index_intact() -> None:
+    store = ColumnarPrefixIndexStore(half_life_ms=2_000)
+    store.bulk_upsert([_ranked_stat(f"pfx-{i}", "t", "m", 10.0, 1_000) for i in range(3)])
+    # A reader that loaded the view before the next commit keeps resolving through it.
+    _, _, rows, (ids, _) = view = store._view
+    packed = [store._pack(ids[f"pfx-{i}"], ids["t"], ids["m"]) for i in range(3)]
+    before = [rows.get(key) for key in packed]
+
+    store.bulk_upsert([_ranked_stat("pfx-0", "t", "m", 99.0, 2_000)])
+    store.bulk_upsert([_ranked_stat("pfx-new", "t", "m", 5.0, 2_000)])
+    store.evict(min_rank=5.0)
+
+    assert [rows.get(key) for key in packed] == before
+    assert len(rows) == 3
+    assert store._view is not view
+    assert [stat.prefix_id for stat in store.iter_ranked()] == ["pfx-0"]
+
+
+def test_snapshot_evict_drops_keys_whose_overlay_version_is_below_the_floor(
+    tmp_path: Path,
+) -> None:
+    path = tmp_path / "index.pidx"
+    store = SnapshotPrefixIndexStore(
+        path=path, half_life_ms=2_000, compact_min_bytes=1 << 30, compact_ratio=1e9
+    )
+    store.load()
+    hot = _ranked_stat("hot", "t", "m", 500.0, 1_000)
+    kept = _ranked_stat("k", "t", "m", 400.0, 1_000)
+    store.bulk_upsert([hot, kept])
+    store.compact()
+    # The base row of "hot" is above the floor, its newer overlay version below it.
+    store.bulk_upsert([hot.model_copy(update={"score": 0.0})])
+    floor = decay_rank(kept, 2_000)
+    assert store.evict(min_rank=floor) == 1
+    assert [s.prefix_id for s in store.iter_ranked()] == ["k"]
+    reopened = SnapshotPrefixIndexStore(path=path, half_life_ms=2_000)
+    reopened.load()
+    assert [s.prefix_id for s in reopened.iter_ranked()] == ["k"]
+
+
+def test_sqlite_store_persists_and_rebuilds_ranks(tmp_path: Path) -> None:
+    path = tmp_path / "index.sqlite"
+    store = SqlitePrefixIndexStore(path=path, half_life_ms=1_000)
+    store.load()
+    older = _ranked_stat("old", "t", "m", 400.0, 1_000)
+    newer = _ranked_stat("new", "t", "m", 200.0, 1_500)
+    store.bulk_upsert([older, newer])
+    store.close()
+
+    reopened = SqlitePrefixIndexStore(path=path, half_life_ms=1_000)
+    reopened.load()
+    assert [s.prefix_id for s in reopened.iter_ranked()] == ["old", "new"]
+    reopened.close()
+
+    # With a shorter half-life the newer key now outranks the older one.
+    rescaled = SqlitePrefixIndexStore(path=path, half_life_ms=100)
+    rescaled.load()
+    assert [s.prefix_id for s in rescaled.iter_ranked()] == ["new", "old"]
+
+
+@pytest.mark.parametrize("kind", ["memory", "columnar", "jsonl", "sqlite", "snapshot"])
+def test_ranked_reads_keep_the_state_they_started_on(kind: str, tmp_path: Path) -> None:
+    store = _make_store(kind, tmp_path)
+    store.bulk_upsert(_CONFORMANCE_STATS)
+    before = [s.key for s in store.iter_ranked()]
+
+    ranked = store.iter_ranked()
+    first = next(ranked)
+    store.bulk_upsert([stat.model_copy(update={"score": 1e9}) for stat in _CONFORMANCE_STATS])
+    assert [first.key, *(s.key for s in ranked)] == before
+    assert next(store.iter_ranked()).score == 1e9
+
+
+def test_snapshot_store_merges_mapped_base_with_overlay(tmp_path: Path) -> None:
+    path = tmp_path / "index.pidx"
+    store = SnapshotPrefixIndexStore(path=path, half_life_ms=2_000, compact_min_bytes=1 << 30)
+    store.load()
+    store.bulk_upsert(_CONFORMANCE_STATS[:40])
+    store.compact()
+    # Overlapping keys in the overlay shadow the mapped rows.
+    store.bulk_upsert(_CONFORMANCE_STATS[30:])
+    reference = InMemoryPrefixIndexStore(half_life_ms=2_000)
+    reference.bulk_upsert(_CONFORMANCE_STATS)
+    _assert_matches(store, reference)
+
+    reopened = SnapshotPrefixIndexStore(path=path, half_life_ms=2_000)
+    reopened.load()
+    _assert_matches(reopened, reference)
+
+    # A different half-life rewrites the stored ranks on load.
+    rescaled = SnapshotPrefixIndexStore(path=path, half_life_ms=100)
+    rescaled.load()
+    assert not rescaled.wal_path.exists()
+    reference = InMemoryPrefixIndexStore(half_life_ms=100)
+    reference.bulk_upsert(_CONFORMANCE_STATS)
+    assert [s.key for s in rescaled.iter_ranked()] == [s.key for s in reference.iter_ranked()]
+
+    # Eviction rewrites the snapshot, so evicted keys do not come back on reload.
+    rescaled.bulk_upsert(_CONFORMANCE_STATS[:5])
+    assert rescaled.evict(min_rank=20.0) == reference.evict(min_rank=20.0)
+    reloaded = SnapshotPrefixIndexStore(path=path, half_life_ms=100)
+    reloaded.load()
+    _assert_matches(reloaded, reference)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import json
+from collections import Counter
+from pathlib import Path
+
+from prefix_indexer.models import PrefixIndexConfig
+from prefix_indexer.service import PrefixIndexService
+from prefix_indexer.synthetic import TraceSpec, generate_events, iter_event_rows, write_trace
+
+
+def test_trace_is_seeded_and_zipf_skewed() -> None:
+    spec = TraceSpec(events=5_000, seed=7, tenants=3, models=2, prefixes=500)
+    rows = list(iter_event_rows(spec))
+    assert rows == list(iter_event_rows(spec))
+    assert rows != list(iter_event_rows(TraceSpec(events=5_000, seed=8, prefixes=500)))
+
+    assert {row["tenant"] for row in rows} == {"tenant-0", "tenant-1", "tenant-2"}
+    assert {row["model_id"] for row in rows} == {"model-0", "model-1"}
+    hits = Counter(row["prefix_id"] for row in rows).most_common()
+    assert hits[0][0] == "session:0"
+    # The ten hottest of 500 prefixes take a large share of the traffic.
+    assert sum(count for _, count in hits[:10]) > len(rows) * 0.3
+    timestamps = [row["timestamp_ms"] for row in rows]
+    assert timestamps == sorted(timestamps)
+    assert timestamps[-1] < spec.start_ms + spec.span_ms
+
+
+def test_written_trace_ingests_like_generated_events(tmp_path: Path) -> None:
+    spec = TraceSpec(events=2_000, seed=1, prefixes=200)
+    path = tmp_path / "trace.jsonl.gz"
+    assert write_trace(path, spec) == spec.events
+
+    from_file = PrefixIndexService(PrefixIndexConfig())
+    report = from_file.ingest_jsonl(path)
+    assert (report.accepted, report.rejected) == (spec.events, 0)
+    from_events = PrefixIndexService(PrefixIndexConfig())
+    from_events.ingest_events(generate_events(spec))
+    assert json.loads(from_file.dump_json()) == json.loads(from_events.dump_json())